@@ -1,15 +1,20 @@
 import requests
 import json
 import os
-import subprocess
 import time
 import sys
 import re
 import codecs
 
+from core.env_manager import EnvManager, EnvSetupError
+from core.executor import command_executor
+
 # --- CONFIGURAZIONE ---
 API_URL = "http://localhost:8001/chat/god-mode"
 BASE_DIR = "projects"
+env_manager = EnvManager(pool_dir=os.path.join(BASE_DIR, ".venvs"), wheelhouse=os.path.join(BASE_DIR, ".wheelhouse"))
+RUN_TIMEOUT = 30  # seconds
+RUN_HEALTHY_AFTER = float(os.getenv("RUN_HEALTHY_AFTER", "10"))  # vivo e senza traceback = stabile
 
 class Colors:
     HEADER = '\033[95m'
@@ -161,10 +166,17 @@ def phase_3_runtime(project_path):
     """Esegue e ripara (Self-Healing senza JSON)."""
     print_log("RUNTIME", "Avvio main.py...", Colors.CYAN)
     
-    # 1. Installazione Dipendenze
+    # 1. Installazione Dipendenze (venv condiviso dal pool: reinstalla solo se i requirements cambiano)
+    requirements = ""
     if os.path.exists(os.path.join(project_path, "requirements.txt")):
-        print_log("PIP", "Installazione dipendenze...", Colors.GREY)
-        subprocess.run(["pip", "install", "-r", "requirements.txt"], cwd=project_path, capture_output=True)
+        with open(os.path.join(project_path, "requirements.txt"), "r") as f:
+            requirements = f.read()
+    print_log("PIP", "Preparazione ambiente...", Colors.GREY)
+    try:
+        python = os.path.abspath(env_manager.ensure_env(requirements))
+    except EnvSetupError as e:
+        print_log("PIP", f"Setup ambiente fallito:\n{e}", Colors.FAIL)
+        return
 
     # 2. Execution Loop con Auto-Fix
     main_file = "main.py"
@@ -173,21 +185,24 @@ def phase_3_runtime(project_path):
     for attempt in range(max_retries):
         print(f"{Colors.WARNING}▶ Tentativo avvio {attempt+1}/{max_retries}...{Colors.ENDC}")
         
-        res = subprocess.run(
-            ["python3", main_file], 
-            cwd=project_path, 
-            capture_output=True, 
-            text=True,
-            timeout=30
-        )
+        # Output mostrato riga per riga mentre gira: crash rilevato al primo traceback
+        def show_line(stream, line):
+            print(f"{Colors.GREY if stream == 'stdout' else Colors.FAIL}  │ {line.rstrip()}{Colors.ENDC}")
         
-        if res.returncode == 0:
+        res = command_executor.run([python, main_file], cwd=project_path, timeout=RUN_TIMEOUT,
+                                   healthy_after=RUN_HEALTHY_AFTER, on_line=show_line)
+        
+        if res["outcome"] == "healthy":
+            print_log("SUCCESS", f"Il software gira da {RUN_HEALTHY_AFTER:.0f}s senza errori!", Colors.GREEN)
+            return
+        if res["outcome"] == "exited" and res["exit_code"] == 0:
             print_log("SUCCESS", "Il software gira correttamente!", Colors.GREEN)
-            print(f"\n{Colors.GREEN}{res.stdout[:1000]}{Colors.ENDC}")
             return
         
         # GESTIONE ERRORE
-        error_msg = res.stderr
+        error_msg = res["stderr"] or res["stdout"]
+        if res["outcome"] == "timeout":
+            error_msg += f"\nTIMEOUT: nessuna risposta entro {RUN_TIMEOUT}s"
         print(f"{Colors.FAIL}❌ Crash rilevato:\n{error_msg[-500:]}{Colors.ENDC}")
         
         if attempt < max_retries - 1:
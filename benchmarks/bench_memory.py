@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+📊 Benchmark latenza del sottosistema memoria (VectorMemory)
+
+Genera N fatti sintetici nel formato "FATTO: ... CONTESTO ORIGINALE: ..." e misura,
+per ogni backend disponibile:
+- save (accodamento) e flush (scrittura in blocco)
+- search a freddo, search in cache, filtro threshold
+- p50/p95/p99, throughput e RSS del processo
+
+Uso:
+    python benchmarks/bench_memory.py --sizes 1000,10000 --output bench_memory.json
+    python benchmarks/bench_memory.py --baseline old.json --max-regression 20
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+
+import numpy as np
+
+# Setup percorsi (come core/engine.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "core"))
+
+from vector_memory import VectorMemory, chromadb
+from embeddings import HashingEmbedder, get_embedder
+
+ALL_BACKENDS = ["numpy", "ephemeral", "persistent", "http"]
+
+SUBJECTS = ["L'utente", "Il CEO", "Il team", "Il cliente"]
+VERBS = ["preferisce", "usa", "evita", "richiede", "odia", "vuole"]
+OBJECTS = ["risposte in italiano", "Python 3.11", "Docker con rete host", "pandas per l'analisi",
+           "codice senza GUI", "Selenium headless", "SQLite per i dati", "report in CSV",
+           "scraping di ANSA", "notifiche Telegram", "quote delle scommesse", "log dettagliati"]
+TOPICS = ["progetto", "bot", "scraper", "dashboard", "analisi", "deploy"]
+
+
+def make_fact(rng, i):
+    fact = f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} nel {rng.choice(TOPICS)} {i}"
+    context = f"Messaggio utente {i}: parliamo di {rng.choice(OBJECTS)} per il {rng.choice(TOPICS)}"
+    return context, fact
+
+
+def make_query(rng):
+    return f"cosa {rng.choice(VERBS)} {rng.choice(SUBJECTS).lower()} per {rng.choice(OBJECTS)}?"
+
+
+def percentiles(samples_s):
+    if not len(samples_s):
+        return {"n": 0}  # Es. --flush-size 1: ogni save è un flush, nessun accodamento da misurare
+    ms = np.asarray(samples_s) * 1000.0
+    return {
+        "n": int(len(ms)),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+        "throughput_ops": round(len(ms) / float(np.asarray(samples_s).sum()), 2),
+    }
+
+
+def rss_mb():
+    """RSS corrente (Linux /proc) con fallback al picco di getrusage"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError):
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except Exception:
+        return None
+
+
+def make_embedder(kind):
+    if kind == "hashing":
+        return HashingEmbedder()
+    if kind == "local":
+        embedder = get_embedder()
+        if embedder is None:
+            raise SystemExit("sentence-transformers non installato: usa --embedder hashing")
+        return embedder
+    return None  # server: embedding calcolati da Chroma
+
+
+def open_memory(backend, workdir, embedder, flush_size, dedup_distance):
+    """VectorMemory isolata: directory temporanea o collection dedicata (mai quella di produzione)"""
+    if backend == "numpy" and embedder is None:
+        embedder = HashingEmbedder()
+    if backend == "ephemeral" and chromadb is not None:
+        # EphemeralClient riusa il sistema in-process: senza reset le collection delle taglie
+        # precedenti resterebbero in RAM (e nel RSS misurato)
+        chromadb.api.client.SharedSystemClient.clear_system_cache()
+    return VectorMemory(
+        backend=backend,
+        embedder=embedder,
+        flush_size=flush_size,
+        flush_interval=3600,
+        dedup_distance=dedup_distance,
+        collection_name=f"bench_{os.getpid()}_{int(time.time())}",
+        path=os.path.join(workdir, backend)
+    )
+
+
+def bench_backend(backend, size, args, embedder):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench_memory_")
+    rows = []
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    memory = None
+
+    try:
+        with quiet:
+            memory = open_memory(backend, workdir, embedder, args.flush_size, args.dedup_distance)
+        rss_start = rss_mb()
+
+        # --- SAVE + FLUSH ---
+        save_times, flush_times = [], []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(size):
+                user_input, fact = make_fact(rng, i)
+                start = time.perf_counter()
+                pending_before = len(memory._pending)
+                memory.save(user_input, fact)
+                elapsed = time.perf_counter() - start
+                # Un save che ha svuotato il buffer misura il flush, non l'accodamento
+                (flush_times if len(memory._pending) < pending_before + 1 else save_times).append(elapsed)
+            start = time.perf_counter()
+            memory.flush()
+            flush_times.append(time.perf_counter() - start)
+
+        stored = memory.collection.count()
+        rss_loaded = rss_mb()
+        total_write = sum(save_times) + sum(flush_times)
+        rows.append(dict(op="save", **percentiles(save_times), rss_mb=rss_loaded))
+        rows.append(dict(op="flush", **percentiles(flush_times), rss_mb=rss_loaded))
+        rows.append(dict(op="write_total", n=size, throughput_ops=round(size / total_write, 2) if total_write else 0.0,
+                         stored=stored, rss_mb=rss_loaded, rss_delta_mb=round(rss_loaded - rss_start, 1)))
+
+        queries = [make_query(rng) for _ in range(args.queries)]
+
+        # --- SEARCH A FREDDO (cache invalidata) ---
+        cold = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for q in queries:
+                memory.invalidate_search_cache()
+                start = time.perf_counter()
+                memory.search(q)
+                cold.append(time.perf_counter() - start)
+        rows.append(dict(op="search", **percentiles(cold), rss_mb=rss_mb()))
+
+        # --- SEARCH IN CACHE (stessa query ripetuta) ---
+        warm = []
+        memory.search(queries[0])
+        for _ in range(args.queries):
+            start = time.perf_counter()
+            memory.search(queries[0])
+            warm.append(time.perf_counter() - start)
+        rows.append(dict(op="search_cached", **percentiles(warm), rss_mb=rss_mb()))
+
+        # --- FILTRO THRESHOLD ---
+        for threshold in args.thresholds:
+            times, kept = [], []
+            for q in queries:
+                memory.invalidate_search_cache()
+                start = time.perf_counter()
+                context = memory.search(q, threshold=threshold)
+                times.append(time.perf_counter() - start)
+                kept.append(context.count("--- [MEMORIA DEL"))
+            rows.append(dict(op=f"search_threshold_{threshold}", **percentiles(times),
+                             avg_kept=round(float(np.mean(kept)), 2), rss_mb=rss_mb()))
+    finally:
+        if memory is not None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                memory.close()
+        if memory is not None and memory.client is not None:
+            # Collection bench_* dedicata: sul server http resterebbe per sempre
+            try:
+                memory.client.delete_collection(memory.collection.name)
+            except Exception as e:
+                print(f"⚠️  Collection {memory.collection.name} non rimossa: {e}", file=sys.stderr)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for row in rows:
+        row.update(backend=backend, size=size)
+    return rows
+
+
+def compare_with_baseline(results, baseline_path, max_regression):
+    """Confronto p95 con un run precedente; ritorna le regressioni oltre soglia"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["backend"], r["size"], r["op"]): r for r in baseline.get("results", []) if "p95_ms" in r}
+    regressions = []
+    for r in results:
+        prev = old.get((r["backend"], r["size"], r["op"]))
+        if not prev or "p95_ms" not in r or not prev["p95_ms"]:
+            continue
+        change = (r["p95_ms"] - prev["p95_ms"]) / prev["p95_ms"] * 100
+        r["p95_change_pct"] = round(change, 1)
+        if change > max_regression:
+            regressions.append(f"{r['backend']}/{r['size']}/{r['op']}: p95 {prev['p95_ms']}ms -> {r['p95_ms']}ms (+{change:.1f}%)")
+    return regressions
+
+
+def run_benchmark(sizes, backends, args):
+    embedder = make_embedder(args.embedder)
+    results, skipped = [], []
+    for backend in backends:
+        for size in sizes:
+            print(f"⏱️  {backend} @ {size} fatti...", file=sys.stderr)
+            try:
+                results.extend(bench_backend(backend, size, args, embedder))
+            except Exception as e:
+                skipped.append({"backend": backend, "size": size, "reason": str(e)})
+                print(f"⏭️  {backend} saltato: {e}", file=sys.stderr)
+                break
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_rev": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "embedder": args.embedder,
+            "queries": args.queries,
+            "flush_size": args.flush_size,
+            "dedup_distance": args.dedup_distance,
+            "seed": args.seed,
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def print_table(report):
+    print(f"{'backend':<11}{'size':>8}  {'op':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>12}{'RSS MB':>9}")
+    for r in report["results"]:
+        print(f"{r['backend']:<11}{r['size']:>8}  {r['op']:<24}{r.get('p50_ms', ''):>10}{r.get('p95_ms', ''):>10}"
+              f"{r.get('p99_ms', ''):>10}{r.get('throughput_ops', ''):>12}{r.get('rss_mb', ''):>9}")
+    for s in report["skipped"]:
+        print(f"{s['backend']:<11}{s['size']:>8}  SKIPPED: {s['reason'][:80]}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark VectorMemory (save/search/threshold) per backend")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Numero di fatti, separati da virgola")
+    parser.add_argument("--backends", default=",".join(ALL_BACKENDS), help=f"Sottoinsieme di {ALL_BACKENDS}")
+    parser.add_argument("--queries", type=int, default=200, help="Query per misura di search")
+    parser.add_argument("--thresholds", default="0.8,1.4", help="Threshold da confrontare in search")
+    parser.add_argument("--embedder", choices=["hashing", "local", "server"], default="hashing")
+    parser.add_argument("--flush-size", type=int, default=256)
+    parser.add_argument("--dedup-distance", type=float, default=0.0, help="0 = solo dedup per hash")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="File JSON dei risultati (default: stdout)")
+    parser.add_argument("--baseline", help="JSON di un run precedente da confrontare")
+    parser.add_argument("--max-regression", type=float, default=25.0, help="Soglia regressione p95 in %%")
+    args = parser.parse_args(argv)
+    args.thresholds = [float(t) for t in args.thresholds.split(",") if t]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    backends = [b for b in args.backends.split(",") if b]
+    report = run_benchmark(sizes, backends, args)
+
+    regressions = compare_with_baseline(report["results"], args.baseline, args.max_regression) if args.baseline else []
+    report["regressions"] = regressions
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print_table(report)
+    else:
+        print(json.dumps(report, indent=2))
+
+    for line in regressions:
+        print(f"❌ REGRESSIONE: {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
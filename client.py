@@ -2,17 +2,22 @@ import requests
 import json
 import sys
 import time
+import uuid
 
 # Configurazione
 API_URL = "http://localhost:8001/chat/god-mode"
+STREAM_API_URL = f"{API_URL}/stream"
 
-def type_writer(text):
-    """Effetto macchina da scrivere per una UI più figa"""
-    for char in text:
-        sys.stdout.write(char)
-        sys.stdout.flush()
-        time.sleep(0.005)
-    print("")
+def stream_events(payload):
+    """Legge l'endpoint SSE e produce gli eventi (delta / tool / done) appena arrivano"""
+    with requests.post(STREAM_API_URL, json=payload, stream=True, timeout=120) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data:"):
+                try:
+                    yield json.loads(line[5:].strip())
+                except json.JSONDecodeError:
+                    continue
 
 def main():
     print("\n" + "="*50)
@@ -20,7 +25,8 @@ def main():
     print("   API Connection: ACTIVE (Port 8001)")
     print("="*50 + "\n")
 
-    history = []
+    # La history la tiene l'engine: mandiamo solo il nuovo messaggio + l'id della sessione
+    session_id = f"client-{uuid.uuid4().hex[:12]}"
 
     while True:
         try:
@@ -31,35 +37,35 @@ def main():
             # Prepariamo il payload
             payload = {
                 "message": user_input,
-                "history": history[-4:] # Mandiamo gli ultimi scambi per contesto
+                "session_id": session_id
             }
 
             print(" quantum sta pensando...", end="\r")
 
-            # Chiamata API
+            # Chiamata API (streaming: i token appaiono appena generati)
             start_time = time.time()
             try:
-                response = requests.post(API_URL, json=payload, timeout=120)
-                response.raise_for_status()
-                data = response.json()
+                msg = ""
+                first_token = True
                 
-                elapsed = time.time() - start_time
+                for event in stream_events(payload):
+                    if "tool" in event:
+                        print(f"\n\033[93m[TOOL: {event['tool']}]\033[0m") # Giallo se usa tool
+                    delta = event.get("delta")
+                    if not delta:
+                        continue
+                    if first_token:
+                        # Risposta AI (latenza al primo token visibile)
+                        elapsed = time.time() - start_time
+                        print(f"\r[QUANTUM ({elapsed:.1f}s)] > ", end="")
+                        first_token = False
+                    sys.stdout.write(delta)
+                    sys.stdout.flush()
+                    msg += delta
+                print("")
                 
-                # Risposta AI
-                print(f"\r[QUANTUM ({elapsed:.1f}s)] > ", end="")
-                
-                # Visualizza Risposta
-                msg = data.get("response", "Errore nella risposta")
-                tool = data.get("tool_used")
-                
-                if tool:
-                    print(f"\033[93m[TOOL: {tool}]\033[0m") # Giallo se usa tool
-                
-                type_writer(msg)
-
-                # Aggiorna storico locale (per la sessione corrente)
-                history.append({"role": "user", "content": user_input})
-                history.append({"role": "assistant", "content": msg})
+                if first_token:
+                    print("\r[QUANTUM] > Errore nella risposta")
 
             except requests.exceptions.ConnectionError:
                 print("\n❌ ERRORE: Il server API sembra spento. Controlla Docker.")
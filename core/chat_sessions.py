@@ -0,0 +1,267 @@
+import os
+import re
+import sys
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from session_store import SessionStore
+from context_window import ContextWindow, strip_reasoning
+
+# --- CONFIGURAZIONE SESSIONI LATO SERVER ---
+CHAT_SESSION_BACKEND = os.getenv("CHAT_SESSION_BACKEND", "auto")       # auto (redis -> disk) | redis | disk | memory
+CHAT_SESSION_CACHE = int(os.getenv("CHAT_SESSION_CACHE", "256"))       # sessioni tenute in RAM (LRU)
+CHAT_SESSION_MAX_MESSAGES = int(os.getenv("CHAT_SESSION_MAX_MESSAGES", "200"))
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", str(7 * 24 * 3600)))  # seconds, solo Redis
+CHAT_SESSION_DIR = os.getenv("CHAT_SESSION_DIR", os.path.join("data", "sessions"))
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_KEY_PREFIX = "quantum:session:"
+CHAT_SESSION_SUMMARY_TOKENS = int(os.getenv("CHAT_SESSION_SUMMARY_TOKENS", "400"))  # riassunto dei messaggi scartati
+
+SESSION_SUMMARY_HEADER = "RIASSUNTO DEI MESSAGGI PIÙ VECCHI DELLA SESSIONE:"
+SUMMARY_EXT = ".summary.json"
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class InvalidSessionId(ValueError):
+    """session_id non valido (usato anche come nome file del tier disk)"""
+
+
+class ChatSessions:
+    """
+    History delle conversazioni tenuta dall'engine, indirizzata per session_id.
+
+    - Tier in RAM: LRU di CHAT_SESSION_CACHE sessioni
+    - Tier persistente (write-through): Redis (lista per sessione, TTL) oppure log append-only su disco
+    - Oltre max_messages si scarta la metà più vecchia in un colpo solo: il prefisso della
+      conversazione resta stabile tra un turno e l'altro (riassunto e prefix cache riusabili)
+    - I messaggi scartati confluiscono in un messaggio di riassunto in testa alla history
+      (salvato anche nel tier persistente): i fatti vecchi restano nel prompt.
+      Il riassunto nasce estrattivo (nessuna chiamata LLM sul percorso della richiesta);
+      chi ha un LLM lo rifinisce dopo con replace_summary()
+    """
+
+    def __init__(self, backend=CHAT_SESSION_BACKEND, max_sessions=CHAT_SESSION_CACHE,
+                 max_messages=CHAT_SESSION_MAX_MESSAGES, ttl=CHAT_SESSION_TTL, directory=CHAT_SESSION_DIR,
+                 redis_client=None, summary_tokens=CHAT_SESSION_SUMMARY_TOKENS):
+        self.max_sessions = max(1, max_sessions)
+        self.max_messages = max(2, max_messages)
+        self.ttl = ttl
+        self.summary_tokens = max(1, summary_tokens)
+        self._local = OrderedDict()  # session_id -> [messages]
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "errors": 0, "folds": 0, "summaries": 0,
+                      "summary_fallbacks": 0}
+
+        self._redis = redis_client
+        if self._redis is None and backend in ("auto", "redis"):
+            self._redis = self._connect_redis(required=(backend == "redis"))
+        self._disk = None
+        if self._redis is None and backend in ("auto", "redis", "disk"):
+            self._disk = SessionStore(directory=directory, compact_after=self.max_messages * 2, keep=self.max_messages)
+        self.backend = "redis" if self._redis is not None else ("disk" if self._disk is not None else "memory")
+
+    @staticmethod
+    def _connect_redis(required=False):
+        if redis is None:
+            if required:
+                print("⚠️ [SESSION] Libreria 'redis' non installata. Uso il tier su disco.")
+            return None
+        try:
+            client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, socket_timeout=0.5, socket_connect_timeout=0.5)
+            client.ping()
+            return client
+        except Exception:
+            if required:
+                print(f"⚠️ [SESSION] Redis {REDIS_HOST}:{REDIS_PORT} non raggiungibile. Uso il tier su disco.")
+            return None
+
+    @staticmethod
+    def validate(session_id):
+        if not SESSION_ID_PATTERN.match(session_id or ""):
+            raise InvalidSessionId(f"session_id non valido: '{session_id}' (1-64 caratteri tra A-Z a-z 0-9 _ -)")
+        return session_id
+
+    # --- RIASSUNTO DEI MESSAGGI SCARTATI ---
+
+    @staticmethod
+    def summary_message(summary):
+        return {"role": "system", "content": f"{SESSION_SUMMARY_HEADER}\n{summary}"}
+
+    @staticmethod
+    def _summary_of(message):
+        """Testo del riassunto se il messaggio è quello in testa alla history, altrimenti None"""
+        content = message.get("content", "")
+        if message.get("role") == "system" and content.startswith(SESSION_SUMMARY_HEADER):
+            return content[len(SESSION_SUMMARY_HEADER):].strip()
+        return None
+
+    # --- TIER PERSISTENTE ---
+
+    def _summary_path(self, session_id):
+        return os.path.join(self._disk.directory, f"{session_id}{SUMMARY_EXT}")
+
+    def _load(self, session_id):
+        try:
+            if self._redis is not None:
+                raw = self._redis.lrange(REDIS_KEY_PREFIX + session_id, -self.max_messages, -1)
+                stored = self._redis.get(REDIS_KEY_PREFIX + session_id + ":summary")
+                messages = [json.loads(item) for item in raw]
+                summary = json.loads(stored)["summary"] if stored else None
+            elif self._disk is not None:
+                # Solo i messaggi successivi all'ultimo riassunto (il log su disco li conserva tutti)
+                try:
+                    with open(self._summary_path(session_id), "r", encoding="utf-8") as f:
+                        stored = json.load(f)
+                except FileNotFoundError:
+                    stored = {"summary": None, "folded": 0}
+                unfolded = self._disk.count(session_id) - stored["folded"]
+                messages = self._disk.tail(session_id, min(unfolded, self.max_messages))
+                summary = stored["summary"]
+            else:
+                return []
+            return ([self.summary_message(summary)] if summary else []) + messages
+        except Exception as e:
+            print(f"⚠️ [SESSION] Lettura '{session_id}' fallita: {e}")
+            self.stats["errors"] += 1
+        return []
+
+    def _persist(self, session_id, messages):
+        try:
+            if self._redis is not None:
+                key = REDIS_KEY_PREFIX + session_id
+                pipe = self._redis.pipeline()
+                pipe.rpush(key, *[json.dumps(m, ensure_ascii=False) for m in messages])
+                pipe.ltrim(key, -self.max_messages, -1)
+                pipe.expire(key, self.ttl)
+                pipe.execute()
+            elif self._disk is not None:
+                self._disk.append(session_id, *messages)
+        except Exception as e:
+            print(f"⚠️ [SESSION] Scrittura '{session_id}' fallita: {e}")
+            self.stats["errors"] += 1
+
+    def _persist_summary(self, session_id, summary, kept):
+        """Riassunto nel tier persistente; `kept` = messaggi non riassunti rimasti dopo il taglio"""
+        try:
+            if self._redis is not None:
+                key = REDIS_KEY_PREFIX + session_id
+                pipe = self._redis.pipeline()
+                pipe.set(key + ":summary", json.dumps({"summary": summary}, ensure_ascii=False), ex=self.ttl)
+                pipe.ltrim(key, -kept, -1)
+                pipe.expire(key, self.ttl)
+                pipe.execute()
+            elif self._disk is not None:
+                path = self._summary_path(session_id)
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump({"summary": summary, "folded": self._disk.count(session_id) - kept}, f, ensure_ascii=False)
+                os.replace(path + ".tmp", path)
+        except Exception as e:
+            print(f"⚠️ [SESSION] Scrittura riassunto '{session_id}' fallita: {e}")
+            self.stats["errors"] += 1
+
+    # --- API ---
+
+    def get(self, session_id):
+        """Copia della history della sessione ([] se nuova)"""
+        self.validate(session_id)
+        with self._lock:
+            if session_id in self._local:
+                self._local.move_to_end(session_id)
+                self.stats["hits"] += 1
+                return list(self._local[session_id])
+        messages = self._load(session_id)
+        with self._lock:
+            self.stats["loads"] += 1
+            self._put(session_id, messages)
+            return list(messages)
+
+    def _put(self, session_id, messages):
+        """Inserisce in RAM con eviction LRU (chiamata con lock)"""
+        self._local[session_id] = messages
+        self._local.move_to_end(session_id)
+        while len(self._local) > self.max_sessions:
+            self._local.popitem(last=False)  # Il tier persistente ha già tutto (write-through)
+            self.stats["evictions"] += 1
+
+    def append(self, session_id, *messages):
+        """
+        Aggiunge messaggi alla sessione. Oltre max_messages la metà più vecchia viene riassunta
+        subito in forma estrattiva; ritorna il fold {previous, dropped, message} da rifinire con
+        replace_summary() (None se non c'è stato taglio).
+        """
+        self.validate(session_id)
+        if session_id not in self._local:
+            self.get(session_id)
+        with self._lock:
+            history = self._local.setdefault(session_id, [])
+            history.extend(messages)
+            dropped = history[:len(history) - self.max_messages // 2] if len(history) > self.max_messages else []
+            self._local.move_to_end(session_id)
+        self._persist(session_id, messages)
+        if not dropped:
+            return None
+
+        previous = self._summary_of(dropped[0])
+        folded = [m for m in map(strip_reasoning, dropped[1:] if previous is not None else dropped) if m["content"]]
+        message = self.summary_message(ContextWindow._extractive_summary(previous, folded, self.summary_tokens))
+        with self._lock:
+            if not history or history[0] is not dropped[0]:
+                return None  # Già tagliata da un append concorrente
+            del history[:len(dropped)]
+            history.insert(0, message)
+            kept = len(history) - 1
+            self.stats["folds"] += 1
+        print(f"🧾 [SESSION] '{session_id}': {len(dropped)} messaggi riassunti, {kept} tenuti.")
+        self._persist_summary(session_id, self._summary_of(message), kept)
+        return {"previous": previous, "dropped": folded, "message": message}
+
+    def replace_summary(self, session_id, fold, summary):
+        """
+        Sostituisce il riassunto estrattivo di un fold con quello dell'LLM (summary None o vuoto:
+        resta l'estratto). Ignorato se nel frattempo la history è stata tagliata di nuovo.
+        """
+        summary = (summary or "").strip()
+        with self._lock:
+            history = self._local.get(session_id)
+            if not summary:
+                self.stats["summary_fallbacks"] += 1
+                return False
+            if not history or history[0] is not fold["message"]:
+                return False
+            history[0] = self.summary_message(summary)
+            kept = len(history) - 1
+            self.stats["summaries"] += 1
+        self._persist_summary(session_id, summary, kept)
+        return True
+
+    def delete(self, session_id):
+        self.validate(session_id)
+        with self._lock:
+            self._local.pop(session_id, None)
+        try:
+            if self._redis is not None:
+                self._redis.delete(REDIS_KEY_PREFIX + session_id, REDIS_KEY_PREFIX + session_id + ":summary")
+            elif self._disk is not None:
+                self._disk.delete(session_id)
+                if os.path.exists(self._summary_path(session_id)):
+                    os.remove(self._summary_path(session_id))
+        except Exception as e:
+            print(f"⚠️ [SESSION] Cancellazione '{session_id}' fallita: {e}")
+            self.stats["errors"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "sessions_in_memory": len(self._local), "backend": self.backend,
+                    "max_sessions": self.max_sessions, "max_messages": self.max_messages}
@@ -0,0 +1,232 @@
+import os
+import ast
+import glob
+import json
+import hashlib
+
+# --- CONFIGURAZIONE CONTEXT PACKER ---
+CONTEXT_CACHE_FILE = ".context_cache.json"   # nella cartella del progetto
+CHARS_PER_TOKEN = 4                          # stima grezza, basta per restare nel budget
+DETAIL_LEVELS = ("calls", "signatures", "imports")  # dal più ricco al più compatto
+
+
+def _format_args(args):
+    """Ricostruisce la firma (senza annotazioni lunghe) di una funzione"""
+    try:
+        return ast.unparse(args)
+    except Exception:
+        return ", ".join(a.arg for a in args.args)
+
+
+def _function_signature(node, indent=""):
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns is not None else ""
+    line = f"{indent}{prefix} {node.name}({_format_args(node.args)}){returns}"
+    doc = ast.get_docstring(node)
+    if doc:
+        line += f"  # {doc.strip().splitlines()[0][:80]}"
+    return line
+
+
+def extract_public_signatures(source):
+    """
+    Interfaccia pubblica di un modulo Python: funzioni, classi (con metodi pubblici
+    e __init__) e costanti UPPERCASE di primo livello.
+    Ritorna stringa vuota se il codice non è parsabile.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return ""
+    return _signatures(tree)
+
+
+def _signatures(tree):
+    lines = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and not node.name.startswith("_"):
+            lines.append(_function_signature(node))
+        elif isinstance(node, ast.ClassDef) and not node.name.startswith("_"):
+            bases = ", ".join(ast.unparse(b) for b in node.bases)
+            lines.append(f"class {node.name}({bases}):" if bases else f"class {node.name}:")
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and \
+                        (item.name == "__init__" or not item.name.startswith("_")):
+                    lines.append(_function_signature(item, indent="    "))
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id.isupper():
+                    lines.append(f"{target.id} = ...")
+    return "\n".join(lines)
+
+
+def _dotted_name(node):
+    """'a.b.c' per catene Name/Attribute, None per tutto il resto (chiamate, subscript...)"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return ".".join(reversed(parts))
+
+
+def summarize_module(source):
+    """
+    Riassunto strutturale di un file Python:
+    - imports: righe di import normalizzate
+    - signatures: interfaccia pubblica (vedi extract_public_signatures)
+    - calls: chiamate verso nomi importati (es. db.get_connection), cioè i punti di contatto tra moduli
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        return {"imports": [], "signatures": "", "calls": [], "error": f"SyntaxError riga {e.lineno}: {e.msg}"}
+
+    imports, imported_names = set(), set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                imports.add(f"import {alias.name}" + (f" as {alias.asname}" if alias.asname else ""))
+                imported_names.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            imports.add(f"from {module} import " + ", ".join(
+                a.name + (f" as {a.asname}" if a.asname else "") for a in node.names))
+            imported_names.update(a.asname or a.name for a in node.names)
+
+    calls = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            name = _dotted_name(node.func)
+            if name and name.split(".")[0] in imported_names:
+                calls.add(name)
+
+    return {"imports": sorted(imports), "signatures": _signatures(tree), "calls": sorted(calls)}
+
+
+def format_summary(filename, summary, detail="calls"):
+    """Blocco testuale del riassunto; detail taglia le parti meno importanti (vedi DETAIL_LEVELS)"""
+    lines = [f"### {filename}"]
+    if summary.get("error"):
+        lines.append(f"!! {summary['error']}")
+    if summary["imports"]:
+        lines.append("imports: " + " | ".join(summary["imports"]))
+    if detail in ("calls", "signatures") and summary["signatures"]:
+        lines.append(summary["signatures"])
+    if detail == "calls" and summary["calls"]:
+        lines.append("calls: " + ", ".join(summary["calls"]))
+    return "\n".join(lines)
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ContextPacker:
+    """
+    Contesto compatto di un progetto per le fasi di integrazione e review.
+
+    - Ogni file .py viene riassunto con ast (import, firme pubbliche, chiamate tra moduli)
+    - Il riassunto è in cache per hash del contenuto: i file invariati non vengono riparsati
+    - pack() copre SEMPRE tutti i file entro il budget di token, comprimendo i riassunti
+      se serve, e aggiunge il codice completo solo dei file richiesti finché c'è spazio
+    """
+
+    def __init__(self, project_path, cache_file=CONTEXT_CACHE_FILE):
+        self.project_path = project_path
+        self.cache_path = os.path.join(project_path, cache_file)
+        self._cache = self._load_cache()
+        self.stats = {"parsed": 0, "cached": 0}
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r") as f:
+                return json.load(f).get("files", {})
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+            return {}
+
+    def _save_cache(self):
+        temp_path = self.cache_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"files": self._cache}, f)
+        os.replace(temp_path, self.cache_path)
+
+    def scan(self):
+        """Ritorna [{name, source, summary, summary_hash}] per ogni .py del progetto"""
+        entries = []
+        for fpath in sorted(glob.glob(os.path.join(self.project_path, "*.py"))):
+            name = os.path.basename(fpath)
+            with open(fpath, "r") as f:
+                source = f.read()
+            file_hash = content_hash(source)
+            cached = self._cache.get(name)
+            if cached and cached.get("hash") == file_hash:
+                summary = cached["summary"]
+                self.stats["cached"] += 1
+            else:
+                summary = summarize_module(source)
+                self._cache[name] = {"hash": file_hash, "summary": summary,
+                                     "reviewed": cached.get("reviewed") if cached else None}
+                self.stats["parsed"] += 1
+            entries.append({
+                "name": name,
+                "source": source,
+                "summary": summary,
+                "summary_hash": content_hash(json.dumps(summary, sort_keys=True))
+            })
+
+        # File cancellati dal progetto escono dalla cache
+        names = {e["name"] for e in entries}
+        self._cache = {k: v for k, v in self._cache.items() if k in names}
+        self._save_cache()
+        return entries
+
+    def changed_since_review(self, entries):
+        """File il cui riassunto è cambiato dall'ultima review (o mai revisionati)"""
+        return [e["name"] for e in entries if self._cache.get(e["name"], {}).get("reviewed") != e["summary_hash"]]
+
+    def mark_reviewed(self, entries):
+        for e in entries:
+            if e["name"] in self._cache:
+                self._cache[e["name"]]["reviewed"] = e["summary_hash"]
+        self._save_cache()
+
+    def pack(self, entries, budget_tokens, full_body=(), max_detail="calls"):
+        """
+        Costruisce il prompt entro budget_tokens. Ritorna (testo, file_con_codice_completo).
+        Se nemmeno i soli import stanno nel budget, la copertura vince sul budget.
+        Lo stesso vale per full_body: se nessun file richiesto ci sta, il primo entra
+        comunque per intero, altrimenti un file più grande del budget non verrebbe mai visto.
+        """
+        levels = DETAIL_LEVELS[DETAIL_LEVELS.index(max_detail):]
+        for detail in levels:
+            blocks = {e["name"]: format_summary(e["name"], e["summary"], detail) for e in entries}
+            used = estimate_tokens("\n\n".join(blocks.values()))
+            if used <= budget_tokens:
+                break
+
+        # Il codice completo sostituisce il riassunto del file, finché c'è budget
+        full_files = []
+        for e in entries:
+            if e["name"] not in full_body:
+                continue
+            body = f"=== {e['name']} (codice completo) ===\n{e['source']}"
+            cost = estimate_tokens(body) - estimate_tokens(blocks[e["name"]])
+            if used + cost <= budget_tokens:
+                blocks[e["name"]] = body
+                used += cost
+                full_files.append(e["name"])
+
+        if not full_files:
+            first = next((e for e in entries if e["name"] in full_body), None)
+            if first:
+                blocks[first["name"]] = f"=== {first['name']} (codice completo) ===\n{first['source']}"
+                full_files.append(first["name"])
+
+        return "\n\n".join(blocks.values()), full_files
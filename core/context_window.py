@@ -0,0 +1,157 @@
+import os
+import re
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from code_analysis import estimate_tokens, CHARS_PER_TOKEN
+
+# --- CONFIGURAZIONE FINESTRA DI CONTESTO ---
+CONTEXT_HISTORY_TOKENS = int(os.getenv("CONTEXT_HISTORY_TOKENS", "2000"))  # budget dei messaggi recenti
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "300"))   # budget del riassunto
+CONTEXT_MIN_RECENT = int(os.getenv("CONTEXT_MIN_RECENT", "2"))             # messaggi sempre tenuti integri
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "256"))
+
+SUMMARY_HEADER = "RIASSUNTO DELLA CONVERSAZIONE PRECEDENTE (fatti e decisioni chiave):"
+
+
+def strip_reasoning(message):
+    """Messaggio senza il ragionamento <think> (anche senza tag di apertura, tipico di R1)"""
+    content = str(message.get("content", ""))
+    if message.get("role") == "assistant":
+        content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL)
+        if "</think>" in content:
+            content = content.rsplit("</think>", 1)[1]
+        content = re.sub(r'<think>.*', '', content, flags=re.DOTALL)
+    return {"role": message.get("role", "user"), "content": content.strip()}
+
+
+def truncate_to_tokens(text, max_tokens):
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + " [...]"
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + 4  # ruolo + separatori del chat template
+
+
+class ContextWindow:
+    """
+    History con budget di token, indipendente dalla lunghezza della conversazione.
+
+    - Ragionamento <think> rimosso dalle risposte dell'assistente
+    - I messaggi più recenti restano integri finché stanno nel budget
+    - Quelli che escono dalla finestra confluiscono in un riassunto incrementale
+      (riassunto precedente + nuovi messaggi), in cache per hash del prefisso di conversazione
+    - Si ripiega a blocchi (fino a metà budget): il riassunto cambia di rado e il prompt resta stabile
+    """
+
+    def __init__(self, history_tokens=CONTEXT_HISTORY_TOKENS, summary_tokens=CONTEXT_SUMMARY_TOKENS,
+                 min_recent=CONTEXT_MIN_RECENT, cache_size=SUMMARY_CACHE_SIZE):
+        self.history_tokens = max(1, history_tokens)
+        self.summary_tokens = max(1, summary_tokens)
+        self.min_recent = max(0, min_recent)
+        self.cache_size = max(1, cache_size)
+        self._summaries = OrderedDict()  # hash prefisso -> riassunto
+        self._lock = threading.Lock()
+        self.stats = {"summaries": 0, "summary_hits": 0, "summary_fallbacks": 0}
+
+    @staticmethod
+    def prefix_hashes(messages):
+        """hashes[i] = hash dei primi i messaggi (catena: ogni prefisso in O(1) dal precedente)"""
+        hashes = [hashlib.sha256(b"").hexdigest()]
+        for m in messages:
+            hashes.append(hashlib.sha256(f"{hashes[-1]}|{m['role']}|{m['content']}".encode("utf-8")).hexdigest())
+        return hashes
+
+    def _cached(self, key):
+        with self._lock:
+            if key in self._summaries:
+                self._summaries.move_to_end(key)
+                return self._summaries[key]
+        return None
+
+    def _store(self, key, summary):
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    def _split(self, messages, start, budget):
+        """Primo indice >= start da cui i messaggi stanno nel budget (tenendo sempre min_recent messaggi)"""
+        split, total = len(messages), 0
+        while split > start:
+            cost = message_tokens(messages[split - 1])
+            if total + cost > budget and len(messages) - split >= self.min_recent:
+                break
+            total += cost
+            split -= 1
+        return split
+
+    @staticmethod
+    def _extractive_summary(previous, folded, max_tokens):
+        """Fallback senza LLM: prima riga di ogni messaggio ripiegato, le più vecchie escono per prime"""
+        lines = [previous] if previous else []
+        lines += [f"- {m['role']}: {m['content'].splitlines()[0][:120]}" for m in folded if m["content"]]
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+            lines.pop(0)
+        return truncate_to_tokens("\n".join(lines), max_tokens)
+
+    async def build(self, history, summarize=None):
+        """
+        Messaggi da mettere nel prompt: [riassunto (system)] + messaggi recenti, entro il budget.
+        summarize(previous_summary, messages, max_tokens) -> str è una coroutine (di solito una chiamata LLM).
+        """
+        per_message = max(1, self.history_tokens // 2)
+        messages = []
+        for m in history or []:
+            clean = strip_reasoning(m)
+            if clean["content"]:
+                clean["content"] = truncate_to_tokens(clean["content"], per_message)
+                messages.append(clean)
+        if not messages:
+            return []
+
+        hashes = self.prefix_hashes(messages)
+        # Prefisso più lungo già riassunto (turni precedenti della stessa conversazione)
+        folded_at, summary = 0, None
+        for i in range(len(messages), 0, -1):
+            cached = self._cached(hashes[i])
+            if cached is not None:
+                folded_at, summary = i, cached
+                break
+
+        if self._split(messages, folded_at, self.history_tokens) > folded_at:
+            # Fuori budget: ripiega fino a metà budget, così i prossimi turni riusano lo stesso riassunto
+            split = self._split(messages, folded_at, self.history_tokens // 2)
+            folded = messages[folded_at:split]
+            try:
+                if summarize is None:
+                    raise RuntimeError("nessun summarizer")
+                new_summary = await summarize(summary, folded, self.summary_tokens)
+                new_summary = truncate_to_tokens(new_summary.strip(), self.summary_tokens)
+                self.stats["summaries"] += 1
+            except Exception as e:
+                print(f"⚠️ [CONTEXT] Riassunto LLM non disponibile ({e}), uso estratto.")
+                new_summary = self._extractive_summary(summary, folded, self.summary_tokens)
+                self.stats["summary_fallbacks"] += 1
+            print(f"🧾 [CONTEXT] {len(folded)} messaggi ripiegati nel riassunto.")
+            self._store(hashes[split], new_summary)
+            folded_at, summary = split, new_summary
+        elif summary is not None:
+            self.stats["summary_hits"] += 1
+
+        window = messages[folded_at:]
+        if summary:
+            window = [{"role": "system", "content": f"{SUMMARY_HEADER}\n{summary}"}] + window
+        return window
+
+    def get_stats(self):
+        return {**self.stats, "cached_summaries": len(self._summaries),
+                "history_tokens": self.history_tokens, "summary_tokens": self.summary_tokens}
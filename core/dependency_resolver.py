@@ -0,0 +1,155 @@
+import os
+import re
+import ast
+import sys
+import glob
+
+# Nome import -> nome distribuzione su PyPI, solo dove i due differiscono
+IMPORT_TO_DISTRIBUTION = {
+    "bs4": "beautifulsoup4",
+    "cv2": "opencv-python",
+    "PIL": "Pillow",
+    "yaml": "PyYAML",
+    "sklearn": "scikit-learn",
+    "skimage": "scikit-image",
+    "dotenv": "python-dotenv",
+    "dateutil": "python-dateutil",
+    "telegram": "python-telegram-bot",
+    "telebot": "pyTelegramBotAPI",
+    "fake_useragent": "fake-useragent",
+    "serial": "pyserial",
+    "usb": "pyusb",
+    "Crypto": "pycryptodome",
+    "jwt": "PyJWT",
+    "fitz": "PyMuPDF",
+    "docx": "python-docx",
+    "pptx": "python-pptx",
+    "magic": "python-magic",
+    "attr": "attrs",
+    "websocket": "websocket-client",
+    "OpenSSL": "pyOpenSSL",
+    "MySQLdb": "mysqlclient",
+    "psycopg2": "psycopg2-binary",
+    "Levenshtein": "python-Levenshtein",
+    "discord": "discord.py",
+    "googleapiclient": "google-api-python-client",
+    "github": "PyGithub",
+    "slugify": "python-slugify",
+    "multipart": "python-multipart",
+    "socketio": "python-socketio",
+    "engineio": "python-engineio",
+    "jose": "python-jose",
+    "win32api": "pywin32",
+    "win32con": "pywin32",
+    "pkg_resources": "setuptools",
+    "sentence_transformers": "sentence-transformers",
+    "undetected_chromedriver": "undetected-chromedriver",
+    "webdriver_manager": "webdriver-manager",
+    "duckduckgo_search": "duckduckgo-search",
+    "newspaper": "newspaper3k",
+    "Bio": "biopython",
+    "zmq": "pyzmq",
+    "git": "GitPython",
+}
+
+# Import che coincidono con il nome della distribuzione (risolti senza chiedere all'LLM)
+KNOWN_DISTRIBUTIONS = {
+    "requests", "httpx", "aiohttp", "urllib3", "lxml", "selenium", "playwright", "scrapy",
+    "numpy", "pandas", "scipy", "matplotlib", "seaborn", "plotly", "statsmodels", "sympy",
+    "torch", "tensorflow", "keras", "transformers", "openai", "anthropic", "tiktoken",
+    "flask", "fastapi", "uvicorn", "starlette", "django", "jinja2", "pydantic", "werkzeug",
+    "sqlalchemy", "pymongo", "redis", "chromadb", "peewee", "alembic",
+    "rich", "click", "typer", "tqdm", "colorama", "tabulate", "loguru",
+    "schedule", "apscheduler", "feedparser", "markdown", "openpyxl", "xlsxwriter", "reportlab",
+    "boto3", "paramiko", "psutil", "cryptography", "bcrypt", "pytz", "arrow", "pendulum",
+    "tweepy", "praw", "ccxt", "yfinance", "websockets", "gradio", "streamlit", "pytest",
+    "joblib", "networkx", "nltk", "spacy", "gensim", "pyautogui", "pyperclip", "qrcode",
+}
+
+# Fallback per interpreti senza sys.stdlib_module_names (< 3.10)
+_STDLIB_FALLBACK = {
+    "abc", "argparse", "array", "ast", "asyncio", "base64", "bisect", "calendar", "collections",
+    "concurrent", "contextlib", "copy", "csv", "ctypes", "dataclasses", "datetime", "decimal",
+    "email", "enum", "functools", "glob", "gzip", "hashlib", "heapq", "hmac", "html", "http",
+    "importlib", "inspect", "io", "itertools", "json", "logging", "math", "multiprocessing",
+    "operator", "os", "pathlib", "pickle", "platform", "pprint", "queue", "random", "re",
+    "shutil", "signal", "socket", "sqlite3", "ssl", "statistics", "string", "struct",
+    "subprocess", "sys", "tempfile", "textwrap", "threading", "time", "timeit", "tkinter",
+    "traceback", "typing", "unittest", "urllib", "uuid", "warnings", "weakref", "xml", "zipfile",
+}
+STDLIB_MODULES = set(getattr(sys, "stdlib_module_names", _STDLIB_FALLBACK)) | set(sys.builtin_module_names)
+
+VALID_DISTRIBUTION = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+
+def imported_modules(source):
+    """Moduli top-level importati in modo assoluto (gli import relativi sono sempre locali)"""
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return set()
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules.add(node.module.split(".")[0])
+    return modules
+
+
+def project_sources(project_path):
+    """File .py del progetto: primo livello e package (cartelle con __init__.py), mai il venv"""
+    sources = glob.glob(os.path.join(project_path, "*.py"))
+    for init in glob.glob(os.path.join(project_path, "*", "__init__.py")):
+        sources.extend(glob.glob(os.path.join(os.path.dirname(init), "*.py")))
+    return sorted(sources)
+
+
+def local_modules(project_path):
+    """Moduli del progetto stesso: file .py e package di primo livello"""
+    names = {os.path.splitext(os.path.basename(p))[0] for p in glob.glob(os.path.join(project_path, "*.py"))}
+    names.update(os.path.basename(os.path.dirname(p)) for p in glob.glob(os.path.join(project_path, "*", "__init__.py")))
+    return names
+
+
+def classify_imports(modules, local=()):
+    """Divide i moduli in stdlib, locali e di terze parti"""
+    result = {"stdlib": set(), "local": set(), "third_party": set()}
+    for module in modules:
+        if module in local:
+            result["local"].add(module)
+        elif module in STDLIB_MODULES or module == "__future__":
+            result["stdlib"].add(module)
+        else:
+            result["third_party"].add(module)
+    return result
+
+
+def distribution_for(module):
+    """Nome pip per un modulo di terze parti, None se non è nella tabella"""
+    if module in IMPORT_TO_DISTRIBUTION:
+        return IMPORT_TO_DISTRIBUTION[module]
+    if module.lower() in KNOWN_DISTRIBUTIONS:
+        return module.lower()
+    return None
+
+
+def resolve_requirements(project_path):
+    """
+    Risoluzione deterministica delle dipendenze di un progetto.
+    Ritorna (distribuzioni, moduli_non_risolti), entrambe ordinate.
+    """
+    modules = set()
+    for fpath in project_sources(project_path):
+        with open(fpath, "r") as f:
+            modules |= imported_modules(f.read())
+
+    third_party = classify_imports(modules, local_modules(project_path))["third_party"]
+    distributions, unresolved = set(), set()
+    for module in third_party:
+        dist = distribution_for(module)
+        if dist:
+            distributions.add(dist)
+        else:
+            unresolved.add(module)
+    return sorted(distributions, key=str.lower), sorted(unresolved)
@@ -0,0 +1,124 @@
+import os
+import re
+import zlib
+import threading
+from collections import OrderedDict
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# --- CONFIGURAZIONE EMBEDDING LOCALI ---
+# Stesso modello della embedding function di default di Chroma: i vettori restano compatibili
+# con i ricordi già salvati lato server.
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+
+
+def normalize_text(text):
+    """Chiave di cache: spazi iniziali/finali e multipli non cambiano il significato del testo"""
+    return " ".join(str(text).split())
+
+
+class LocalEmbedder:
+    """
+    Embedding in-process con sentence-transformers.
+
+    - Modello caricato una sola volta (lazy, al primo uso)
+    - Memoization LRU dei vettori per testo normalizzato
+    - I testi mancanti vengono calcolati in un unico batch
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, cache_size=EMBEDDING_CACHE_SIZE, encode_fn=None):
+        self.model_name = model_name
+        self.cache_size = max(1, cache_size)
+        self._encode_fn = encode_fn  # Iniettabile nei test
+        self._model = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _encode(self, texts):
+        if self._encode_fn is not None:
+            return [list(map(float, v)) for v in self._encode_fn(texts)]
+        if self._model is None:
+            print(f"🧬 [EMBED] Caricamento modello locale {self.model_name}...")
+            self._model = SentenceTransformer(self.model_name)
+        vectors = self._model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return [v.tolist() for v in vectors]
+
+    def embed(self, texts):
+        """Ritorna un vettore per ogni testo, riusando quelli già calcolati"""
+        keys = [normalize_text(t) for t in texts]
+        results = [None] * len(texts)
+        missing = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    results[i] = self._cache[key]
+                    self.stats["hits"] += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.stats["misses"] += 1
+
+        if missing:
+            miss_keys = list(missing)
+            vectors = self._encode(miss_keys)
+            with self._lock:
+                for key, vector in zip(miss_keys, vectors):
+                    self._cache[key] = vector
+                    self._cache.move_to_end(key)
+                    for i in missing[key]:
+                        results[i] = vector
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return results
+
+    def embed_one(self, text):
+        return self.embed([text])[0]
+
+
+class HashingEmbedder:
+    """
+    Embedding deterministico senza modello (feature hashing di parole e bigrammi).
+    Qualità inferiore a sentence-transformers ma zero dipendenze: serve all'indice
+    NumPy quando il modello locale non è installato.
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.model_name = f"hashing-{dim}"
+
+    def _vector(self, text):
+        tokens = re.findall(r'\w+', str(text).lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vector = [0.0] * self.dim
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = sum(v * v for v in vector) ** 0.5
+        return [v / norm for v in vector] if norm else vector
+
+    def embed(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_one(self, text):
+        return self._vector(text)
+
+
+_default_embedder = None
+_default_lock = threading.Lock()
+
+def get_embedder():
+    """Embedder condiviso del processo, oppure None se sentence-transformers non è installato"""
+    global _default_embedder
+    if SentenceTransformer is None:
+        return None
+    with _default_lock:
+        if _default_embedder is None:
+            _default_embedder = LocalEmbedder()
+    return _default_embedder
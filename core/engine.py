@@ -2,10 +2,15 @@ import os
 import sys
 import re
 import json
-import requests
 import uvicorn
 import asyncio
-from fastapi import FastAPI, BackgroundTasks
+import time
+import textwrap
+import functools
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from dotenv import load_dotenv
@@ -15,189 +20,675 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
 from vector_memory import VectorMemory
-from tools import AVAILABLE_TOOLS
+from tools import AVAILABLE_TOOLS, execute_command, setup_env, env_manager
+from executor import command_executor
+from llm_client import LLMClient
+from response_cache import ResponseCache
+from context_window import ContextWindow, strip_reasoning
+from chat_sessions import ChatSessions, InvalidSessionId
+from prompt_builder import PromptBuilder, static_system_prompt
+from llm_scheduler import LLMScheduler, Overloaded
+from memory_extractor import MemoryExtractor
 
 load_dotenv()
 
 # --- CONFIGURAZIONE ---
-LLM_API_URL = "http://localhost:5000/v1/chat/completions"
+LLM_API_URL = os.getenv("LLM_API_URL", "http://localhost:5000/v1/chat/completions")
 MODEL_NAME = "DeepSeek-R1-Distill-Qwen-32B-abliterated-Q6_K.gguf"
 
-app = FastAPI(title="Quantum AI API", version="9.6 (Tool Execution Fixed)")
+# Agent loop: round tool -> LLM per richiesta, tool eseguiti in parallelo nello stesso round
+TOOL_MAX_STEPS = int(os.getenv("TOOL_MAX_STEPS", "3"))
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "4"))
+BARRIER_TOOLS = {"terminal_run"}  # Dipendono dai tool precedenti (es. write_file -> esecuzione)
+
+# Persona dei system prompt: solo testo statico (il contesto volatile va nell'ultimo messaggio utente)
+FACTORY_PERSONA = textwrap.dedent("""
+    SEI 'QUANTUM BUILDER'. Un motore di esecuzione software automatizzato.
+
+    IL TUO UNICO OBIETTIVO:
+    Ricevere un task -> Analizzare (dentro <think>) -> Eseguire il codice/comando.
+
+    REGOLE FERREE:
+    1. NON usare la memoria a lungo termine. Usa solo i file che vedi ora.
+    2. NON fare conversazione. Non dire "Ecco il codice".
+    3. Ragiona dentro <think>...</think>, poi genera l'output richiesto.
+    4. Se ti viene chiesto di scrivere un file, usa [TOOL: write_file, query: "filename|content"].
+    5. Se ti viene chiesto di eseguire, usa [TOOL: terminal_run, query: "command"].
+    6. Per consultare documentazione usa [TOOL: read_url, query: "url|domanda"]: ricevi solo le sezioni rilevanti.
+""")
+GENERAL_PERSONA = textwrap.dedent("""
+    SEI 'QUANTUM OS'. L'Intelligenza Centrale powered by DeepSeek-R1.
+    Sei un consulente esperto, diretto e razionale.
+
+    Usa <think> tags per il tuo reasoning interno, poi rispondi in modo naturale.
+    Usa il CONTESTO MEMORIA allegato al messaggio dell'utente per personalizzare le risposte.
+""")
+tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+
+# Client condiviso: pool keep-alive + limite di concorrenza verso il backend
+llm_client = LLMClient(LLM_API_URL)
+# Cache delle completion deterministiche (Redis se disponibile, altrimenti in-process)
+response_cache = ResponseCache()
+# History con budget di token + riassunto incrementale dei turni vecchi
+context_window = ContextWindow()
+# History lato server per session_id (i client mandano solo il nuovo messaggio)
+chat_sessions = ChatSessions()
+summary_tasks = set()  # Riassunti LLM delle sessioni in corso (priorità background)
+# Prompt con prefisso stabile (KV cache del backend) + statistiche di prefill
+prompt_builder = PromptBuilder()
+# Priorità verso il backend: chat interattive > factory > background, code limitate (429 oltre)
+llm_scheduler = LLMScheduler()
+
+def priority_for(mode):
+    return "factory" if mode == "factory" else "interactive"
+
+@asynccontextmanager
+async def lifespan(app):
+    if memory:
+        memory_extractor.start()  # Riprende anche i turni rimasti in coda prima del riavvio
+    yield
+    for task in list(summary_tasks):
+        task.cancel()  # Il riassunto estrattivo è già salvato
+    await memory_extractor.stop()
+    if memory:
+        await asyncio.to_thread(memory.close)  # Svuota il write-behind buffer
+    await llm_client.close()
+
+app = FastAPI(title="Quantum AI API", version="9.6 (Tool Execution Fixed)", lifespan=lifespan)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    """Load shedding: il client riprova dopo Retry-After invece di accodarsi senza limite"""
+    print(f"🚦 [SCHEDULER] 429 -> {exc}")
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
 
 try:
     memory = VectorMemory()
-except:
-    memory = None
-    print("⚠️ Memoria Vettoriale non disponibile.")
+except Exception as e:
+    # Chroma giù: indice NumPy locale invece di perdere tutto il contesto a lungo termine
+    print(f"⚠️ Chroma non disponibile ({e}). Fallback su indice NumPy locale.")
+    try:
+        memory = VectorMemory(backend="numpy")
+    except Exception:
+        memory = None
+        print("⚠️ Memoria Vettoriale non disponibile.")
 
 # DTO
 class ChatRequest(BaseModel):
     message: str
-    history: Optional[List[Dict[str, str]]] = []
+    history: Optional[List[Dict[str, str]]] = []  # Senza session_id; con session_id solo per inizializzare una sessione vuota
     mode: str = "general"
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
     tool_used: Optional[str] = None
+    tools_used: List[str] = []
     context_used: str
+    session_id: Optional[str] = None
+
+class ToolRequest(BaseModel):
+    query: str = ""
+    args: Optional[Dict[str, str]] = None  # Argomenti espliciti (es. write_file: filename, content)
+
+class ToolResult(BaseModel):
+    tool: str
+    ok: bool
+    exit_code: Optional[int] = None
+    stdout: str = ""
+    stderr: str = ""
+    duration: float
+    outcome: Optional[str] = None  # terminal_run: exited | crashed | healthy | timeout
+    error: Optional[str] = None
+
+class EnvSetupRequest(BaseModel):
+    project: str  # directory sotto projects/ con requirements.txt (opzionale)
+
+class EnvSetupResult(BaseModel):
+    ok: bool
+    python: Optional[str] = None  # interprete del venv, relativo a projects/ (da usare con terminal_run)
+    duration: float
+    error: Optional[str] = None
 
 def clean_think_tags(text):
     """Rimuove <think> tags di DeepSeek-R1"""
     return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
 
-def extract_tool_command(text):
+class ThinkTagFilter:
     """
-    🔧 FIXED: Gestisce formati multipli (DeepSeek-R1 compatible)
+    Versione streaming di clean_think_tags: macchina a stati che riceve i delta
+    uno alla volta e lascia passare solo il testo fuori da <think>...</think>.
+    Un tag spezzato tra due delta viene trattenuto finché non è completo.
     """
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.in_think = False
+        self.buffer = ""
+        self.started = False  # Salta gli spazi iniziali come fa .strip()
+
+    @staticmethod
+    def _partial_tag_len(text, tag):
+        """Lunghezza del suffisso di `text` che è un prefisso di `tag`"""
+        for size in range(min(len(text), len(tag) - 1), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+
+    def _emit(self, text):
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        visible = []
+        while self.buffer:
+            tag = self.CLOSE_TAG if self.in_think else self.OPEN_TAG
+            idx = self.buffer.find(tag)
+            if idx != -1:
+                if not self.in_think:
+                    visible.append(self.buffer[:idx])
+                self.buffer = self.buffer[idx + len(tag):]
+                self.in_think = not self.in_think
+                continue
+            keep = self._partial_tag_len(self.buffer, tag)
+            if not self.in_think:
+                visible.append(self.buffer[:len(self.buffer) - keep])
+            self.buffer = self.buffer[len(self.buffer) - keep:]
+            break
+        return self._emit("".join(visible))
+
+    def flush(self):
+        rest = "" if self.in_think else self.buffer
+        self.buffer = ""
+        return self._emit(rest)
+
+class ToolDirectiveFilter:
+    """
+    Filtro streaming delle direttive [TOOL: ...] (dopo ThinkTagFilter): dalla prima direttiva
+    in poi il round non viene più inoltrato, così query e contenuti di write_file non arrivano al client.
+    Un "[TOOL" spezzato tra due delta viene trattenuto finché non è deciso.
+    """
+    MARKER = "[TOOL"
+
+    def __init__(self):
+        self.buffer = ""
+        self.blocked = False
+
+    def feed(self, chunk):
+        if self.blocked:
+            return ""
+        self.buffer += chunk
+        idx = self.buffer.find(self.MARKER)
+        if idx != -1:
+            visible, self.buffer, self.blocked = self.buffer[:idx], "", True
+            return visible
+        keep = ThinkTagFilter._partial_tag_len(self.buffer, self.MARKER)
+        visible, self.buffer = self.buffer[:len(self.buffer) - keep], self.buffer[len(self.buffer) - keep:]
+        return visible
+
+    def flush(self):
+        rest = "" if self.blocked else self.buffer
+        self.buffer = ""
+        return rest
+
+TOOL_PATTERNS = [
     # Formato 1: [TOOL: nome, query: "..."]
-    match = re.search(r'\[TOOL:\s*(\w+),\s*query:\s*"([^"]+)"\]', text, re.DOTALL)
-    if match:
-        return (match.group(1), match.group(2))
-    
+    re.compile(r'\[TOOL:\s*(\w+),\s*query:\s*"([^"]+)"\]', re.DOTALL),
     # Formato 2: [TOOL: nome]\n{"command": "..."} (DeepSeek-R1 style)
-    match = re.search(r'\[TOOL:\s*(\w+)\]\s*\n?\s*\{[^}]*"command":\s*"([^"]+)"', text, re.DOTALL)
-    if match:
-        return (match.group(1), match.group(2))
-    
+    re.compile(r'\[TOOL:\s*(\w+)\]\s*\n?\s*\{[^}]*"command":\s*"([^"]+)"', re.DOTALL),
     # Formato 3: [TOOL: nome]\n{"query": "..."}
-    match = re.search(r'\[TOOL:\s*(\w+)\]\s*\n?\s*\{[^}]*"query":\s*"([^"]+)"', text, re.DOTALL)
-    if match:
-        return (match.group(1), match.group(2))
-    
-    return (None, None)
+    re.compile(r'\[TOOL:\s*(\w+)\]\s*\n?\s*\{[^}]*"query":\s*"([^"]+)"', re.DOTALL),
+]
 
-async def analyze_and_save_memory(user_input: str, ai_response: str):
-    """Pulisce <think> tags PRIMA di salvare in memoria"""
-    if not memory: 
-        return
+def extract_tool_commands(text):
+    """
+    Tutte le direttive [TOOL: ...] nell'ordine in cui compaiono (formati multipli, DeepSeek-R1 compatible).
+    Si cercano prima nella risposta visibile, poi nel <think> se la risposta non ne contiene.
+    I duplicati vengono eseguiti una volta sola.
+    """
+    visible = clean_think_tags(text)
+    for source in (visible, text) if visible != text else (text,):
+        found = []
+        for pattern in TOOL_PATTERNS:
+            for match in pattern.finditer(source):
+                found.append((match.start(), match.group(1), match.group(2)))
+        commands = []
+        for _, name, query in sorted(found):
+            if (name, query) not in commands:
+                commands.append((name, query))
+        if commands:
+            return commands
+    return []
+
+def extract_tool_command(text):
+    """
+    🔧 FIXED: Gestisce formati multipli (DeepSeek-R1 compatible)
+    """
+    commands = extract_tool_commands(text)
+    return commands[0] if commands else (None, None)
+
+async def extract_memory_facts(turns):
+    """Una sola chiamata per un batch di turni: fatti in JSON, associati al numero del turno"""
+    numbered = "\n".join(f"[{i}] {turn['input']}" for i, turn in enumerate(turns, 1))
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [{
+            "role": "user",
+            "content": "Estrai SOLO preferenze utente o vincoli tecnici rilevanti dai messaggi numerati. "
+                       "No reasoning. SOLO fatti concreti, uno per elemento; ometti i messaggi senza fatti.\n"
+                       'Rispondi SOLO con JSON: {"facts": [{"turn": <numero>, "fact": "<fatto>"}]} '
+                       '(nessun fatto: {"facts": []}).\n\n'
+                       f"MESSAGGI:\n{numbered}"
+        }],
+        "temperature": 0.05,
+        "max_tokens": 400 + 100 * len(turns)  # Margine per il <think> di R1
+    }
+    async with llm_scheduler.slot("background"):
+        data = await llm_client.chat(payload, timeout=120)
+    return data['choices'][0]['message']['content']
+
+# Estrazione dei fatti differita: coda su disco + batch a backend inattivo (non una chiamata per turno)
+memory_extractor = MemoryExtractor(
+    extract=extract_memory_facts,
+    save=lambda user_input, fact: memory.save(user_input, fact),
+    idle_seconds=lambda: llm_scheduler.idle_seconds()
+)
+
+async def queue_memory_extraction(mode, user_input):
+    if mode == "general" and memory:
+        await asyncio.to_thread(memory_extractor.enqueue, clean_think_tags(user_input))
+
+async def call_llm(messages, temperature=0.3, mode="general", session_id=None):
+    """Temperature calibrate per DeepSeek-R1. Le richieste a bassa temperatura passano dalla cache."""
+    cache_key = response_cache.key_for(messages, temperature, mode, MODEL_NAME)
+    if cache_key:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            print(f"⚡ [CACHE] Hit {cache_key[:12]}")
+            return cached
     
+    payload = {
+        "model": MODEL_NAME, 
+        "messages": messages,
+        "temperature": temperature, 
+        "max_tokens": 8000,
+        **prompt_builder.request_options(session_id or mode)
+    }
+    prompt_builder.track(session_id or mode, messages)
     try:
-        clean_input = clean_think_tags(user_input)
-        clean_response = clean_think_tags(ai_response)
-        
-        if len(clean_input) < 10 or "ci sei" in clean_input.lower(): 
-            return 
-        
-        payload = {
-            "model": MODEL_NAME,
-            "messages": [{
-                "role": "user", 
-                "content": f"Estrai SOLO preferenze utente o vincoli tecnici rilevanti. No reasoning. No think tags. SOLO fatti concreti. Input: {clean_input}"
-            }],
-            "temperature": 0.05,
-            "max_tokens": 150
-        }
-        
-        resp = requests.post(LLM_API_URL, json=payload, timeout=20)
-        content = resp.json()['choices'][0]['message']['content']
-        content = clean_think_tags(content)
-        
-        if len(content) > 5 and "SKIP" not in content.upper() and "<think>" not in content.lower():
-            memory.save(clean_input, content)
-            print(f"💾 [MEMORIA] Salvato: {content[:40]}...")
-        else:
-            print(f"⏭️  [MEMORIA] Skipped (non rilevante o contiene think tags)")
-            
-    except Exception as e:
-        print(f"⚠️ Errore memoria: {e}")
+        async with llm_scheduler.slot(priority_for(mode)):
+            data = await llm_client.chat(payload, timeout=300)
+        prompt_builder.record_usage(data)
+        content = data['choices'][0]['message']['content']
+    except Overloaded:
+        raise  # -> 429
+    except Exception as e: 
+        return f"Errore LLM: {e}"
+    
+    if cache_key:
+        response_cache.set(cache_key, content)
+    return content
 
-async def call_llm(messages, temperature=0.3):
-    """Temperature calibrate per DeepSeek-R1"""
+async def stream_llm(messages, temperature=0.3, mode="general", session_id=None):
+    """Come call_llm ma produce i delta grezzi (think inclusi) appena arrivano"""
     payload = {
         "model": MODEL_NAME, 
         "messages": messages,
         "temperature": temperature, 
-        "max_tokens": 8000
+        "max_tokens": 8000,
+        **prompt_builder.request_options(session_id or mode)
     }
+    prompt_builder.track(session_id or mode, messages)
     try:
-        response = requests.post(LLM_API_URL, json=payload, timeout=300)
-        return response.json()['choices'][0]['message']['content']
+        async with llm_scheduler.slot(priority_for(mode)):
+            async for delta in llm_client.stream_chat(payload, timeout=300, on_usage=prompt_builder.record_usage):
+                yield delta
     except Exception as e: 
-        return f"Errore LLM: {e}"
+        yield f"Errore LLM: {e}"
 
-@app.post("/chat/god-mode", response_model=ChatResponse)
-async def god_mode_chat(request: ChatRequest, background_tasks: BackgroundTasks):
+async def build_chat_messages(request: ChatRequest):
+    """
+    System prompt statico + history + messaggio per la modalità richiesta.
+    Il contesto della memoria cambia a ogni richiesta: sta nell'ultimo messaggio, dopo il prefisso in cache.
+    """
     user_input = request.message
     mode = request.mode
     
     if mode == "factory":
         mem_context = "NESSUNA MEMORIA STORICA DISPONIBILE. BASATI SOLO SUL CONTESTO ATTUALE."
-        
-        system_prompt = f"""
-        SEI 'QUANTUM BUILDER'. Un motore di esecuzione software automatizzato.
-        
-        IL TUO UNICO OBIETTIVO:
-        Ricevere un task -> Analizzare (dentro <think>) -> Eseguire il codice/comando.
-        
-        REGOLE FERREE:
-        1. NON usare la memoria a lungo termine. Usa solo i file che vedi ora.
-        2. NON fare conversazione. Non dire "Ecco il codice". 
-        3. Ragiona dentro <think>...</think>, poi genera l'output richiesto.
-        4. Se ti viene chiesto di scrivere un file, usa [TOOL: write_file, query: "filename|content"].
-        5. Se ti viene chiesto di eseguire, usa [TOOL: terminal_run, query: "command"].
-        
-        TOOLS DISPONIBILI:
-        {list(AVAILABLE_TOOLS.keys())}
-        """
+        system_prompt = static_system_prompt(FACTORY_PERSONA, AVAILABLE_TOOLS.keys())
+        context = None
         temp = 0.05
 
     else:
-        mem_context = memory.search(user_input) if memory else "Nessuna memoria disponibile."
-        
-        system_prompt = f"""
-        SEI 'QUANTUM OS'. L'Intelligenza Centrale powered by DeepSeek-R1.
-        Sei un consulente esperto, diretto e razionale.
-        
-        Usa <think> tags per il tuo reasoning interno, poi rispondi in modo naturale.
-        Usa la memoria storica per personalizzare le risposte.
-        
-        CONTESTO MEMORIA:
-        {mem_context}
-        """
+        mem_context = await asyncio.to_thread(memory.search, user_input) if memory else "Nessuna memoria disponibile."
+        system_prompt = static_system_prompt(GENERAL_PERSONA, AVAILABLE_TOOLS.keys())
+        context = mem_context if memory else None
         temp = 0.4
 
-    messages = [{"role": "system", "content": system_prompt}]
-    if request.history: 
-        messages.extend(request.history[-6:])
-    messages.append({"role": "user", "content": user_input})
+    summarize = functools.partial(summarize_history, priority=priority_for(mode))
+    history = await context_window.build(await session_history(request), summarize)
+    messages = prompt_builder.assemble(system_prompt, history, user_input, context=context)
+    return messages, temp, mem_context
 
-    print(f"🧠 [{mode.upper()}] INPUT: {user_input[:50]}...")
+async def session_history(request: ChatRequest):
+    """History della richiesta: quella della sessione lato server se c'è un session_id"""
+    if not request.session_id:
+        return request.history
+    try:
+        history = await asyncio.to_thread(chat_sessions.get, request.session_id)
+        if not history and request.history:
+            # Sessione nuova (o persa): il client può inizializzarla una volta con la sua history
+            fold = await asyncio.to_thread(chat_sessions.append, request.session_id, *request.history)
+            schedule_summary(request.session_id, fold)
+            history = list(request.history)
+    except InvalidSessionId as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return history
+
+async def record_turn(request: ChatRequest, response):
+    """Salva il turno nella sessione (risposta senza <think>); i messaggi tagliati vengono riassunti in background"""
+    if request.session_id:
+        fold = await asyncio.to_thread(chat_sessions.append, request.session_id,
+                                       {"role": "user", "content": request.message},
+                                       {"role": "assistant", "content": response})
+        schedule_summary(request.session_id, fold)
+
+def schedule_summary(session_id, fold):
+    """Riassunto LLM di un fold fuori dal percorso della richiesta; nel frattempo vale l'estratto"""
+    if fold is None:
+        return
+    task = asyncio.create_task(refine_session_summary(session_id, fold))
+    summary_tasks.add(task)  # asyncio tiene solo riferimenti deboli ai task
+    task.add_done_callback(summary_tasks.discard)
+
+async def refine_session_summary(session_id, fold):
+    try:
+        summary = await summarize_history(fold["previous"], fold["dropped"], chat_sessions.summary_tokens,
+                                          priority="background")
+    except Exception as e:
+        print(f"⚠️ [SESSION] Riassunto LLM non disponibile ({e}), resta l'estratto.")
+        summary = None
+    await asyncio.to_thread(chat_sessions.replace_summary, session_id, fold, summary)
+
+async def summarize_history(previous_summary, folded_messages, max_tokens, priority="interactive"):
+    """Riassunto incrementale: riassunto precedente + messaggi usciti dalla finestra"""
+    transcript = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in folded_messages)
+    previous = f"RIASSUNTO ATTUALE:\n{previous_summary}\n\n" if previous_summary else ""
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [{
+            "role": "user",
+            "content": f"{previous}NUOVI MESSAGGI:\n{transcript}\n\n"
+                       f"Aggiorna il riassunto della conversazione: SOLO fatti, preferenze, decisioni e vincoli. "
+                       f"Massimo {max_tokens * 3 // 4} parole, elenco puntato, niente reasoning."
+        }],
+        "temperature": 0.05,
+        "max_tokens": max_tokens * 4  # Margine per il <think> di R1
+    }
+    async with llm_scheduler.slot(priority):
+        data = await llm_client.chat(payload, timeout=60)
+    summary = strip_reasoning({"role": "assistant", "content": data['choices'][0]['message']['content']})["content"]
+    if not summary or summary.startswith("Errore"):
+        raise ValueError("riassunto vuoto")
+    return summary
+
+def run_tool(tool_name, tool_query):
+    """Esegue un tool di AVAILABLE_TOOLS con il parsing della query"""
+    print(f"⚙️ EXEC TOOL: {tool_name} -> {tool_query[:30]}...")
+    
+    if tool_name == "write_file" and "|" in tool_query:
+        try:
+            fname, fcontent = tool_query.split("|", 1)
+            return AVAILABLE_TOOLS[tool_name](fname.strip(), fcontent.strip())
+        except: 
+            return "Errore sintassi write_file."
+    if tool_name == "read_url" and "|" in tool_query:
+        url, question = tool_query.split("|", 1)
+        return AVAILABLE_TOOLS[tool_name](url.strip(), question.strip())
+    return AVAILABLE_TOOLS[tool_name](tool_query)
+
+def execute_tool(tool_name, query="", args=None):
+    """
+    Esecuzione diretta (senza LLM) di un tool, stessi controlli di sicurezza.
+    terminal_run restituisce exit code/stdout/stderr separati; gli altri tool il loro testo in stdout.
+    terminal_run accetta args {"command", "healthy_after"} per la modalità watch dei servizi long-running.
+    """
+    if tool_name == "terminal_run":
+        args = args or {}
+        try:
+            healthy_after = float(args["healthy_after"]) if args.get("healthy_after") else None
+        except ValueError:
+            return {"tool": tool_name, "ok": False, "duration": 0.0,
+                    "error": f"ERRORE: healthy_after non valido: {args['healthy_after']}"}
+        return {"tool": tool_name, **execute_command(args.get("command", query), healthy_after=healthy_after)}
+    
+    start = time.time()
+    try:
+        output = AVAILABLE_TOOLS[tool_name](**args) if args else run_tool(tool_name, query)
+    except TypeError as e:
+        output = f"ERRORE: argomenti non validi per {tool_name}: {e}"
+    failed = output.startswith(("ERRORE", "Errore"))
+    return {
+        "tool": tool_name,
+        "ok": not failed,
+        "stdout": "" if failed else output,
+        "duration": round(time.time() - start, 3),
+        "error": output if failed else None
+    }
+
+async def run_tools(commands):
+    """
+    Esegue i tool di un round sul thread pool: quelli indipendenti in parallelo,
+    BARRIER_TOOLS solo dopo che i precedenti sono terminati. Risultati nell'ordine dei comandi.
+    """
+    loop = asyncio.get_running_loop()
+    results, batch = [], []
     
-    raw_response = await call_llm(messages, temperature=temp)
+    async def drain():
+        results.extend(await asyncio.gather(*(loop.run_in_executor(tool_executor, run_tool, n, q) for n, q in batch)))
+        batch.clear()
     
-    # Gestione Tool
-    tool_name, tool_query = extract_tool_command(raw_response)
-    tool_used = None
-    final_response = raw_response
-
-    if tool_name and tool_name in AVAILABLE_TOOLS:
-        print(f"⚙️ EXEC TOOL: {tool_name} -> {tool_query[:30]}...")
-        
-        if tool_name == "write_file" and "|" in tool_query:
-            try:
-                fname, fcontent = tool_query.split("|", 1)
-                tool_result = AVAILABLE_TOOLS[tool_name](fname.strip(), fcontent.strip())
-            except: 
-                tool_result = "Errore sintassi write_file."
+    for name, query in commands:
+        if name in BARRIER_TOOLS:
+            await drain()
+            batch.append((name, query))
+            await drain()
         else:
-            tool_result = AVAILABLE_TOOLS[tool_name](tool_query)
-            
-        tool_used = tool_name
+            batch.append((name, query))
+    await drain()
+    return results
+
+def tool_results_message(commands, results, last_step):
+    """Un solo messaggio con l'output di tutti i tool del round"""
+    blocks = [f"[{i}] {name} ({query[:60]}):\n{result}" for i, ((name, query), result) in enumerate(zip(commands, results), 1)]
+    closing = "Ora concludi." if last_step else "Se servono altri tool usa [TOOL: ...], altrimenti concludi."
+    return "TOOL OUTPUT:\n" + "\n\n".join(blocks) + f"\n\n{closing}"
+
+def pending_tools(raw_response):
+    return [(n, q) for n, q in extract_tool_commands(raw_response) if n in AVAILABLE_TOOLS]
+
+async def tool_loop(messages, raw_response, temperature, mode, session_id=None):
+    """
+    Agent loop: fino a TOOL_MAX_STEPS round, ognuno = tutti i tool della risposta + una sola chiamata LLM.
+    Ritorna (risposta finale, tool usati).
+    """
+    tools_used = []
+    for step in range(TOOL_MAX_STEPS):
+        commands = pending_tools(raw_response)
+        if not commands:
+            break
+        results = await run_tools(commands)
+        tools_used.extend(name for name, _ in commands)
         messages.append({"role": "assistant", "content": raw_response})
-        messages.append({"role": "system", "content": f"TOOL OUTPUT: {tool_result}. Ora concludi."})
-        final_response = await call_llm(messages, temperature=temp)
+        messages.append({"role": "system", "content": tool_results_message(commands, results, step == TOOL_MAX_STEPS - 1)})
+        raw_response = await call_llm(messages, temperature=temperature, mode=mode, session_id=session_id)
+    return raw_response, tools_used
+
+def tools_summary(tools_used):
+    unique = list(dict.fromkeys(tools_used))
+    return ", ".join(unique) if unique else None
+
+@app.post("/chat/god-mode", response_model=ChatResponse)
+async def god_mode_chat(request: ChatRequest):
+    user_input = request.message
+    mode = request.mode
+    messages, temp, mem_context = await build_chat_messages(request)
+
+    print(f"🧠 [{mode.upper()}] INPUT: {user_input[:50]}...")
     
-    clean_response = clean_think_tags(final_response)
+    raw_response = await call_llm(messages, temperature=temp, mode=mode, session_id=request.session_id)
     
-    if mode == "general" and memory:
-        background_tasks.add_task(analyze_and_save_memory, user_input, clean_response)
+    # Gestione Tool (tutte le direttive, più round se servono)
+    final_response, tools_used = await tool_loop(messages, raw_response, temp, mode, session_id=request.session_id)
+    
+    clean_response = clean_think_tags(final_response)
+    await record_turn(request, clean_response)
+    await queue_memory_extraction(mode, user_input)
     
     return {
         "response": clean_response,
-        "tool_used": tool_used,
-        "context_used": mem_context[:30] + "..." if mem_context else "N/A"
+        "tool_used": tools_summary(tools_used),
+        "tools_used": tools_used,
+        "context_used": mem_context[:30] + "..." if mem_context else "N/A",
+        "session_id": request.session_id
     }
 
+@app.post("/tools/{tool_name}", response_model=ToolResult)
+async def invoke_tool(tool_name: str, request: ToolRequest):
+    """Step deterministici della factory: il comando è già noto, nessuna completion necessaria"""
+    if tool_name not in AVAILABLE_TOOLS:
+        raise HTTPException(status_code=404, detail=f"Tool sconosciuto: {tool_name}. Disponibili: {list(AVAILABLE_TOOLS)}")
+    print(f"🔧 [DIRECT] {tool_name} -> {(request.query or str(request.args))[:30]}...")
+    return await asyncio.to_thread(execute_tool, tool_name, request.query, request.args)
+
+@app.post("/env/setup", response_model=EnvSetupResult)
+async def env_setup(request: EnvSetupRequest):
+    """Venv del runtime dal pool (core/env_manager.py), creato dove gira terminal_run"""
+    print(f"🧪 [ENV] Setup ambiente per {request.project[:30]}...")
+    return await asyncio.to_thread(setup_env, request.project)
+
+@app.get("/env/stats")
+async def env_stats():
+    """Pool dei venv: riusati, creati, falliti"""
+    return {"pool_dir": env_manager.pool_dir, "max_envs": env_manager.max_envs, **env_manager.stats}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Contatori della cache delle risposte LLM"""
+    return response_cache.get_stats()
+
+@app.get("/context/stats")
+async def context_stats():
+    """Riassunti della history: generati, riusati dalla cache, fallback estrattivi"""
+    return context_window.get_stats()
+
+@app.get("/prompt/stats")
+async def prompt_stats():
+    """Token di prompt: prefill effettivo vs riusati dalla KV cache del backend (+ stima locale del prefisso)"""
+    return {**prompt_builder.get_stats(), "unsupported_fields": sorted(llm_client.unsupported_fields)}
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """Chiamate LLM per classe: in esecuzione, in coda, rifiutate (429), attese medie/massime"""
+    return llm_scheduler.get_stats()
+
+@app.get("/memory/stats")
+async def memory_stats():
+    """Estrazione fatti: turni in coda, batch, chiamate LLM per turno, fatti salvati"""
+    return memory_extractor.get_stats()
+
+@app.get("/sessions/stats")
+async def sessions_stats():
+    """Sessioni lato server: in RAM, caricate dal tier persistente, evicted"""
+    return chat_sessions.get_stats()
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Dimentica la history di una sessione (RAM + tier persistente)"""
+    try:
+        await asyncio.to_thread(chat_sessions.delete, session_id)
+    except InvalidSessionId as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"deleted": session_id}
+
+@app.get("/executor/stats")
+async def executor_stats():
+    """Job di terminal_run: in esecuzione, in coda, rifiutati (coda piena), timeout"""
+    return {"workers": command_executor.workers, "queue_size": command_executor.queue_size, **command_executor.stats}
+
+def sse_event(data):
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/god-mode/stream")
+async def god_mode_chat_stream(request: ChatRequest):
+    """
+    Variante SSE di /chat/god-mode: inoltra i delta del backend appena arrivano,
+    filtrando <think>...</think> e le direttive [TOOL: ...] in streaming.
+    Eventi: {"delta": "..."} | {"tool": "nome"} (uno per tool) | {"done": true, "tool_used": ..., "tools_used": [...], "context_used": ..., "session_id": ...}
+    Un evento "tool" chiude un round intermedio: la risposta è solo il testo ricevuto dopo l'ultimo
+    (lo stesso che restituisce /chat/god-mode e che viene salvato nella sessione).
+    """
+    user_input = request.message
+    mode = request.mode
+    llm_scheduler.check(priority_for(mode))  # Dopo l'apertura dello stream non si può più rispondere 429
+    messages, temp, mem_context = await build_chat_messages(request)
+
+    print(f"🧠 [{mode.upper()}] STREAM INPUT: {user_input[:50]}...")
+
+    async def relay(raw_parts, visible_parts):
+        think_filter, tool_filter = ThinkTagFilter(), ToolDirectiveFilter()
+        async for delta in stream_llm(messages, temperature=temp, mode=mode, session_id=request.session_id):
+            raw_parts.append(delta)
+            text = tool_filter.feed(think_filter.feed(delta))
+            if text:
+                visible_parts.append(text)
+                yield sse_event({"delta": text})
+        tail = tool_filter.feed(think_filter.flush()) + tool_filter.flush()
+        if tail:
+            visible_parts.append(tail)
+            yield sse_event({"delta": tail})
+
+    async def event_stream():
+        raw, visible = [], []
+        async for event in relay(raw, visible):
+            yield event
+        raw_response = "".join(raw)
+
+        tools_used = []
+        for step in range(TOOL_MAX_STEPS):
+            commands = pending_tools(raw_response)
+            if not commands:
+                break
+            for name, _ in commands:
+                yield sse_event({"tool": name})
+            results = await run_tools(commands)
+            tools_used.extend(name for name, _ in commands)
+            messages.append({"role": "assistant", "content": raw_response})
+            messages.append({"role": "system", "content": tool_results_message(commands, results, step == TOOL_MAX_STEPS - 1)})
+            
+            raw, visible = [], []
+            async for event in relay(raw, visible):
+                yield event
+            raw_response = "".join(raw)
+
+        clean_response = "".join(visible).strip()
+        await record_turn(request, clean_response)
+        await queue_memory_extraction(mode, user_input)
+
+        yield sse_event({
+            "done": True,
+            "tool_used": tools_summary(tools_used),
+            "tools_used": tools_used,
+            "context_used": mem_context[:30] + "..." if mem_context else "N/A",
+            "session_id": request.session_id
+        })
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,197 @@
+import os
+import re
+import sys
+import time
+import shutil
+import hashlib
+import threading
+import subprocess
+
+# --- CONFIGURAZIONE AMBIENTI RUNTIME ---
+VENV_POOL_DIR = os.getenv("VENV_POOL_DIR", os.path.join("projects", ".venvs"))
+WHEELHOUSE_DIR = os.getenv("WHEELHOUSE_DIR", os.path.join("projects", ".wheelhouse"))
+VENV_POOL_MAX = int(os.getenv("VENV_POOL_MAX", "8"))       # venv tenuti nel pool (LRU)
+PIP_TIMEOUT = int(os.getenv("PIP_TIMEOUT", "600"))         # seconds
+
+TEMPLATE_NAME = "_template"
+READY_MARKER = ".ready"
+
+
+class EnvSetupError(RuntimeError):
+    """Creazione del venv o installazione dei requirements fallita"""
+
+
+def normalize_requirements(requirements_text):
+    """Requirements canonici: niente commenti/righe vuote/spazi, ordine stabile"""
+    lines = []
+    for line in requirements_text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line:
+            lines.append(re.sub(r'\s+', '', line))
+    return sorted(set(lines), key=str.lower)
+
+
+class EnvManager:
+    """
+    Pool di virtualenv condivisi tra i progetti della factory.
+
+    - Stesso set di requirements (hash) = stesso venv, riusato senza reinstallare nulla
+    - I nuovi venv sono copie di un template già pronto (niente ensurepip ogni volta)
+    - Wheelhouse locale: ogni pacchetto viene scaricato/compilato una volta sola
+    - pip chiamato direttamente, senza passare dall'LLM
+    - Il lock del pool copre solo riuso, stats ed eviction: l'installazione gira sotto un lock
+      per venv, così un pip lento non blocca chi chiede un venv già pronto
+    """
+
+    def __init__(self, pool_dir=VENV_POOL_DIR, wheelhouse=WHEELHOUSE_DIR, python=sys.executable,
+                 max_envs=VENV_POOL_MAX, runner=subprocess.run):
+        self.pool_dir = pool_dir
+        self.wheelhouse = wheelhouse
+        self.python = python
+        self.max_envs = max(1, max_envs)
+        self._run = runner  # Iniettabile nei test
+        self._lock = threading.Lock()  # Pool: riuso, stats, eviction
+        self._env_locks = {}  # key -> lock della build di quel venv (anche il template)
+        self.stats = {"reused": 0, "created": 0, "failed": 0}
+
+    def requirements_key(self, requirements_text):
+        """Chiave del venv: requirements normalizzati + interprete base"""
+        payload = "\n".join([self.python] + [r.lower() for r in normalize_requirements(requirements_text)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def env_path(self, key):
+        return os.path.join(self.pool_dir, key)
+
+    @staticmethod
+    def python_path(env_dir):
+        return os.path.join(env_dir, "bin", "python3")
+
+    def _command(self, args, what):
+        try:
+            result = self._run(args, capture_output=True, text=True, timeout=PIP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            raise EnvSetupError(f"{what}: timeout dopo {PIP_TIMEOUT}s")
+        if result.returncode != 0:
+            raise EnvSetupError(f"{what} fallito (exit {result.returncode}):\n{(result.stderr or result.stdout or '')[-2000:]}")
+        return result
+
+    def _ensure_template(self):
+        template = os.path.join(self.pool_dir, TEMPLATE_NAME)
+        if os.path.exists(os.path.join(template, READY_MARKER)):
+            return template
+        shutil.rmtree(template, ignore_errors=True)
+        print("🧪 [ENV] Creazione template venv...")
+        self._command([self.python, "-m", "venv", os.path.abspath(template)], "Creazione venv template")
+        with open(os.path.join(template, READY_MARKER), "w") as f:
+            f.write("")
+        return template
+
+    def _clone_template(self, template, env_dir):
+        """Copia il template e riscrive i path assoluti (shebang, activate, pyvenv.cfg)"""
+        shutil.copytree(template, env_dir, symlinks=True)
+        os.remove(os.path.join(env_dir, READY_MARKER))
+        old, new = os.path.abspath(template).encode(), os.path.abspath(env_dir).encode()
+        candidates = [os.path.join(env_dir, "pyvenv.cfg")]
+        bin_dir = os.path.join(env_dir, "bin")
+        if os.path.isdir(bin_dir):
+            candidates += [os.path.join(bin_dir, name) for name in os.listdir(bin_dir)]
+        for path in candidates:
+            if os.path.islink(path) or not os.path.isfile(path) or os.path.getsize(path) > 1024 * 1024:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            if old in data:
+                with open(path, "wb") as f:
+                    f.write(data.replace(old, new))
+
+    def _install(self, env_dir, requirements):
+        requirements_file = os.path.join(env_dir, "requirements.txt")
+        with open(requirements_file, "w") as f:
+            f.write("\n".join(requirements) + "\n")
+        python = self.python_path(env_dir)
+        os.makedirs(self.wheelhouse, exist_ok=True)
+
+        install = [python, "-m", "pip", "install", "-q", "--no-index",
+                   "--find-links", self.wheelhouse, "-r", requirements_file]
+        # 1. Solo dalla wheelhouse: nessun download, nessuna compilazione
+        try:
+            self._command(install, "pip install")
+            return
+        except EnvSetupError:
+            pass
+        # 2. Wheel mancanti nella wheelhouse (quelli già presenti vengono riusati), poi di nuovo offline
+        self._command([python, "-m", "pip", "wheel", "-q", "-r", requirements_file,
+                       "-w", self.wheelhouse, "--find-links", self.wheelhouse], "pip wheel")
+        self._command(install, "pip install")
+
+    def _evict(self, keep):
+        """Rimuove i venv usati meno di recente oltre max_envs"""
+        envs = []
+        for name in os.listdir(self.pool_dir):
+            marker = os.path.join(self.pool_dir, name, READY_MARKER)
+            if name not in (TEMPLATE_NAME, keep) and os.path.exists(marker):
+                envs.append((os.path.getmtime(marker), name))
+        for _, name in sorted(envs)[:max(0, len(envs) + 1 - self.max_envs)]:
+            print(f"🧹 [ENV] Venv {name} rimosso dal pool (LRU).")
+            shutil.rmtree(os.path.join(self.pool_dir, name), ignore_errors=True)
+
+    def ensure_env(self, requirements_text=""):
+        """
+        Ritorna il path dell'interprete di un venv con i requirements installati.
+        Lancia EnvSetupError se il venv non può essere preparato.
+        """
+        requirements = normalize_requirements(requirements_text)
+        key = self.requirements_key(requirements_text)
+        env_dir = self.env_path(key)
+        marker = os.path.join(env_dir, READY_MARKER)
+
+        with self._lock:
+            if self._reuse(key, marker, requirements):
+                return self.python_path(env_dir)
+            env_lock = self._env_locks.setdefault(key, threading.Lock())
+
+        with env_lock:
+            with self._lock:
+                # Costruito da un'altra richiesta mentre aspettavamo il lock del venv
+                if self._reuse(key, marker, requirements):
+                    return self.python_path(env_dir)
+                os.makedirs(self.pool_dir, exist_ok=True)
+                template_lock = self._env_locks.setdefault(TEMPLATE_NAME, threading.Lock())
+
+            start = time.time()
+            try:
+                with template_lock:
+                    template = self._ensure_template()
+                shutil.rmtree(env_dir, ignore_errors=True)  # Build precedente interrotta
+                self._clone_template(template, env_dir)
+                if requirements:
+                    self._install(env_dir, requirements)
+            except EnvSetupError:
+                self._discard(env_dir)
+                raise
+            except OSError as e:
+                self._discard(env_dir)
+                raise EnvSetupError(f"Preparazione venv fallita: {e}")
+
+            with self._lock:
+                with open(marker, "w") as f:
+                    f.write("\n".join(requirements))
+                self.stats["created"] += 1
+                self._evict(keep=key)
+            print(f"🆕 [ENV] Venv {key} pronto in {time.time() - start:.1f}s ({len(requirements)} pacchetti).")
+            return self.python_path(env_dir)
+
+    def _discard(self, env_dir):
+        """Build fallita: niente venv a metà nel pool"""
+        with self._lock:
+            self.stats["failed"] += 1
+        shutil.rmtree(env_dir, ignore_errors=True)
+
+    def _reuse(self, key, marker, requirements):
+        """Venv già pronto? (da chiamare con il lock del pool)"""
+        if not os.path.exists(marker):
+            return False
+        os.utime(marker)  # LRU
+        self.stats["reused"] += 1
+        print(f"♻️  [ENV] Venv {key} riusato ({len(requirements)} pacchetti).")
+        return True
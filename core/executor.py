@@ -0,0 +1,245 @@
+import os
+import time
+import queue
+import signal
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows: niente rlimit
+    resource = None
+
+# --- CONFIGURAZIONE ESECUTORE COMANDI ---
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", "2"))            # processi in esecuzione simultanea
+EXECUTOR_QUEUE_SIZE = int(os.getenv("EXECUTOR_QUEUE_SIZE", "8"))      # job in attesa prima di rifiutare
+JOB_CPU_SECONDS = int(os.getenv("JOB_CPU_SECONDS", "60"))             # RLIMIT_CPU
+JOB_MEMORY_MB = int(os.getenv("JOB_MEMORY_MB", "2048"))               # RLIMIT_AS (0 = nessun limite)
+JOB_MAX_OPEN_FILES = int(os.getenv("JOB_MAX_OPEN_FILES", "256"))      # RLIMIT_NOFILE
+JOB_MAX_PROCESSES = int(os.getenv("JOB_MAX_PROCESSES", "256"))        # RLIMIT_NPROC (per utente)
+OUTPUT_BUFFER_BYTES = int(os.getenv("OUTPUT_BUFFER_BYTES", "65536"))  # ultimi byte tenuti per stream
+CRASH_GRACE_SECONDS = float(os.getenv("CRASH_GRACE_SECONDS", "1"))    # modalità watch: resto del traceback prima del kill
+
+READ_CHUNK = 4096
+TRACEBACK_MARKER = "Traceback (most recent call last):"
+
+
+class QueueFullError(RuntimeError):
+    """Troppi job in coda: il chiamante deve riprovare più tardi"""
+
+
+class RingBuffer:
+    """Tiene solo gli ultimi max_bytes di uno stream (la coda è dove stanno i traceback)"""
+
+    def __init__(self, max_bytes=OUTPUT_BUFFER_BYTES):
+        self.max_bytes = max(1, max_bytes)
+        self._chunks = deque()
+        self._size = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        with self._lock:
+            self._chunks.append(data)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                excess = self._size - self.max_bytes
+                head = self._chunks[0]
+                if len(head) <= excess:
+                    self._chunks.popleft()
+                    self._size -= len(head)
+                    self.dropped += len(head)
+                else:
+                    self._chunks[0] = head[excess:]
+                    self._size -= excess
+                    self.dropped += excess
+
+    def getvalue(self):
+        with self._lock:
+            text = b"".join(self._chunks).decode("utf-8", errors="replace")
+        if self.dropped:
+            return f"...[{self.dropped} byte precedenti omessi]...\n{text}"
+        return text
+
+
+def limit_resources(cpu_seconds=JOB_CPU_SECONDS, memory_mb=JOB_MEMORY_MB,
+                    open_files=JOB_MAX_OPEN_FILES, processes=JOB_MAX_PROCESSES):
+    """preexec_fn per Popen: rlimit applicati nel processo figlio prima dell'exec"""
+    limits = []
+    if resource is not None:
+        if cpu_seconds:
+            limits.append((resource.RLIMIT_CPU, cpu_seconds))
+        if memory_mb:
+            limits.append((resource.RLIMIT_AS, memory_mb * 1024 * 1024))
+        if open_files:
+            limits.append((resource.RLIMIT_NOFILE, open_files))
+        if processes and hasattr(resource, "RLIMIT_NPROC"):
+            limits.append((resource.RLIMIT_NPROC, processes))
+
+    def apply():
+        for kind, value in limits:
+            soft, hard = resource.getrlimit(kind)
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            resource.setrlimit(kind, (value, hard if hard != resource.RLIM_INFINITY else value))
+    return apply if limits else None
+
+
+class CommandExecutor:
+    """
+    Pool limitato di processi per terminal_run.
+
+    - Al massimo `workers` processi in esecuzione, `queue_size` job in attesa: oltre -> QueueFullError
+    - Ogni processo in una sua sessione con rlimit (CPU, memoria, file aperti, processi)
+    - Timeout = kill dell'intero gruppo di processi
+    - stdout/stderr letti riga per riga mentre il processo gira, in RingBuffer limitati
+    - Modalità watch (servizi long-running): kill appena compare un traceback ("crashed"),
+      oppure successo se il processo resta vivo senza errori per healthy_after secondi ("healthy")
+    """
+
+    def __init__(self, workers=EXECUTOR_WORKERS, queue_size=EXECUTOR_QUEUE_SIZE, limits=None):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.limits = limits if limits is not None else {}
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "completed": 0, "rejected": 0, "timed_out": 0, "running": 0, "queued": 0}
+
+    def submit(self, args, cwd=None, timeout=60, output_limit=OUTPUT_BUFFER_BYTES,
+               watch=False, healthy_after=None, on_line=None):
+        """
+        Accoda un job e ritorna un Future; QueueFullError se la coda è piena (backpressure).
+        watch / healthy_after / on_line(stream, line): vedi _run_job.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise QueueFullError(f"Coda di esecuzione piena ({self.workers} in esecuzione, {self.queue_size} in attesa)")
+        with self._lock:
+            self.stats["submitted"] += 1
+            self.stats["queued"] += 1
+        try:
+            return self._pool.submit(self._run_job, args, cwd, timeout, output_limit,
+                                     watch or healthy_after is not None, healthy_after, on_line)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def run(self, args, cwd=None, timeout=60, output_limit=OUTPUT_BUFFER_BYTES,
+            watch=False, healthy_after=None, on_line=None):
+        """Versione bloccante di submit"""
+        return self.submit(args, cwd=cwd, timeout=timeout, output_limit=output_limit,
+                           watch=watch, healthy_after=healthy_after, on_line=on_line).result()
+
+    @staticmethod
+    def _pump(stream, name, buffer, events):
+        """Righe (al massimo READ_CHUNK byte) nel buffer e, in modalità watch, nella coda eventi"""
+        with stream:
+            for data in iter(lambda: stream.readline(READ_CHUNK), b""):
+                buffer.write(data)
+                if events is not None:
+                    events.put((name, data.decode("utf-8", errors="replace")))
+
+    @staticmethod
+    def _kill_group(proc):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            proc.kill()
+
+    def _watch(self, proc, events, deadline, healthy_at, on_line):
+        """
+        Segue l'output finché il processo gira. Ritorna l'esito:
+        exited | crashed (traceback visto) | healthy (vivo e senza errori fino a healthy_at) | timeout
+        """
+        crash_at = None
+        while proc.poll() is None:
+            now = time.time()
+            if crash_at is not None and now >= crash_at:
+                self._kill_group(proc)
+                return "crashed"
+            if now >= deadline:
+                self._kill_group(proc)
+                return "timeout"
+            if healthy_at is not None and crash_at is None and now >= healthy_at:
+                self._kill_group(proc)
+                return "healthy"
+            try:
+                name, line = events.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if on_line:
+                on_line(name, line)
+            if crash_at is None and TRACEBACK_MARKER in line:
+                crash_at = time.time() + CRASH_GRACE_SECONDS
+        return "crashed" if crash_at is not None else "exited"
+
+    def _run_job(self, args, cwd, timeout, output_limit, watch=False, healthy_after=None, on_line=None):
+        """
+        Esegue il comando: {exit_code, stdout, stderr, timed_out, outcome, duration}.
+        outcome: exited | timeout, e in modalità watch anche crashed | healthy.
+        FileNotFoundError/OSError di Popen vengono propagati al chiamante.
+        """
+        with self._lock:
+            self.stats["queued"] -= 1
+            self.stats["running"] += 1
+        start = time.time()
+        timed_out = False
+        try:
+            stdout, stderr = RingBuffer(output_limit), RingBuffer(output_limit)
+            events = queue.Queue() if watch else None
+            proc = subprocess.Popen(
+                args,
+                shell=False,
+                cwd=cwd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env={**os.environ, "PYTHONUNBUFFERED": "1"},  # print() visibile subito, non a fine processo
+                start_new_session=True,  # Gruppo di processi proprio: il timeout uccide anche i figli
+                preexec_fn=limit_resources(**self.limits)
+            )
+            readers = [threading.Thread(target=self._pump, args=(proc.stdout, "stdout", stdout, events), daemon=True),
+                       threading.Thread(target=self._pump, args=(proc.stderr, "stderr", stderr, events), daemon=True)]
+            for reader in readers:
+                reader.start()
+            if watch:
+                healthy_at = start + healthy_after if healthy_after is not None else None
+                outcome = self._watch(proc, events, start + timeout, healthy_at, on_line)
+            else:
+                try:
+                    proc.wait(timeout=timeout)
+                    outcome = "exited"
+                except subprocess.TimeoutExpired:
+                    self._kill_group(proc)
+                    outcome = "timeout"
+            proc.wait()
+            timed_out = outcome == "timeout"
+            for reader in readers:
+                reader.join(timeout=5)
+            while watch and on_line and not events.empty():
+                on_line(*events.get_nowait())
+            return {
+                "exit_code": proc.returncode,
+                "stdout": stdout.getvalue(),
+                "stderr": stderr.getvalue(),
+                "timed_out": timed_out,
+                "outcome": outcome,
+                "duration": round(time.time() - start, 3)
+            }
+        finally:
+            with self._lock:
+                self.stats["running"] -= 1
+                self.stats["completed"] += 1
+                if timed_out:
+                    self.stats["timed_out"] += 1
+            self._slots.release()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+command_executor = CommandExecutor()
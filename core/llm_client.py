@@ -0,0 +1,128 @@
+import os
+import json
+import asyncio
+import httpx
+
+# --- CONFIGURAZIONE CLIENT LLM ---
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))      # richieste in volo verso il backend
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "8"))          # connessioni riusabili nel pool
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))   # seconds
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))  # seconds
+
+# Campi non standard (llama.cpp): se il backend li rifiuta (400/422) vengono tolti e la richiesta ripetuta
+OPTIONAL_FIELDS = ("cache_prompt", "id_slot")
+
+
+class LLMClient:
+    """
+    Client HTTP asincrono condiviso verso il backend LLM (OpenAI-compatible).
+
+    - Connessioni keep-alive in pool (niente handshake TCP per ogni richiesta)
+    - Semaforo per limitare le richieste concorrenti al backend
+    - Timeout configurabile per singola richiesta
+    - Campi opzionali (OPTIONAL_FIELDS) scartati per sempre al primo rifiuto del backend
+    Non blocca mai l'event loop di uvicorn.
+    """
+
+    def __init__(self, api_url, max_concurrency=LLM_MAX_CONCURRENCY, max_keepalive=LLM_MAX_KEEPALIVE,
+                 connect_timeout=LLM_CONNECT_TIMEOUT, request_timeout=LLM_REQUEST_TIMEOUT, transport=None):
+        self.api_url = api_url
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_keepalive = max_keepalive
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self._transport = transport  # Iniettabile nei test (httpx.MockTransport)
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        self.unsupported_fields = set()
+
+    def _prepare(self, payload):
+        return {k: v for k, v in payload.items() if k not in self.unsupported_fields}
+
+    def _reject_optional(self, error, payload):
+        """True se l'errore è un rifiuto dei campi opzionali: da ora non vengono più inviati"""
+        fields = [f for f in OPTIONAL_FIELDS if f in payload]
+        if not fields or error.response.status_code not in (400, 422):
+            return False
+        self.unsupported_fields.update(fields)
+        print(f"⚠️ [LLM] Backend non accetta {fields}: richieste ripetute senza.")
+        return True
+
+    def _ensure_client(self):
+        """Crea client e semaforo in modo lazy, legati all'event loop corrente."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max(self.max_concurrency, self.max_keepalive),
+                    max_keepalive_connections=self.max_keepalive
+                ),
+                timeout=httpx.Timeout(self.request_timeout, connect=self.connect_timeout),
+                transport=self._transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    async def chat(self, payload, timeout=None):
+        """
+        Invia una chat completion e ritorna il JSON di risposta.
+        Solleva httpx.HTTPError in caso di errore di rete o status != 2xx.
+        """
+        client = self._ensure_client()
+        request_timeout = httpx.Timeout(timeout or self.request_timeout, connect=self.connect_timeout)
+        async with self._semaphore:
+            while True:
+                body = self._prepare(payload)
+                resp = await client.post(self.api_url, json=body, timeout=request_timeout)
+                try:
+                    resp.raise_for_status()
+                except httpx.HTTPStatusError as e:
+                    if self._reject_optional(e, body):
+                        continue
+                    raise
+                return resp.json()
+
+    async def stream_chat(self, payload, timeout=None, on_usage=None):
+        """
+        Chat completion in streaming (SSE, `stream: true`).
+        Generatore asincrono che produce i delta di testo appena arrivano dal backend.
+        on_usage(chunk): chiamata per i chunk con usage / timings (di solito l'ultimo).
+        """
+        client = self._ensure_client()
+        request_timeout = httpx.Timeout(timeout or self.request_timeout, connect=self.connect_timeout)
+        payload = dict(payload, stream=True)
+        async with self._semaphore:
+            while True:
+                body = self._prepare(payload)
+                async with client.stream("POST", self.api_url, json=body, timeout=request_timeout) as resp:
+                    try:
+                        resp.raise_for_status()
+                    except httpx.HTTPStatusError as e:
+                        if self._reject_optional(e, body):
+                            continue
+                        raise
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                            if on_usage and (chunk.get("usage") or chunk.get("timings")):
+                                on_usage(chunk)
+                            delta = chunk['choices'][0].get('delta', {}).get('content')
+                        except (json.JSONDecodeError, KeyError, IndexError, AttributeError):
+                            continue
+                        if delta:
+                            yield delta
+                    return
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._semaphore = None
+        self._loop = None
@@ -0,0 +1,191 @@
+import os
+import sys
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from llm_client import LLM_MAX_CONCURRENCY
+
+# --- CONFIGURAZIONE SCHEDULER LLM ---
+# Classi in ordine di priorità: chat umane > generazioni della factory > estrazioni in background
+PRIORITY_CLASSES = ("interactive", "factory", "background")
+SCHED_SLOTS = int(os.getenv("SCHED_SLOTS", str(LLM_MAX_CONCURRENCY)))  # chiamate LLM simultanee (tutte le classi)
+SCHED_LIMITS = {
+    "interactive": int(os.getenv("SCHED_INTERACTIVE_SLOTS", str(SCHED_SLOTS))),
+    "factory": int(os.getenv("SCHED_FACTORY_SLOTS", str(max(1, SCHED_SLOTS - 1)))),  # uno slot resta alle chat
+    "background": int(os.getenv("SCHED_BACKGROUND_SLOTS", "1")),
+}
+SCHED_QUEUE_SIZES = {
+    "interactive": int(os.getenv("SCHED_INTERACTIVE_QUEUE", "16")),
+    "factory": int(os.getenv("SCHED_FACTORY_QUEUE", "8")),
+    "background": int(os.getenv("SCHED_BACKGROUND_QUEUE", "16")),
+}
+SCHED_SERVICE_SECONDS = float(os.getenv("SCHED_SERVICE_SECONDS", "20"))  # durata iniziale stimata di una chiamata
+
+SERVICE_EWMA_ALPHA = 0.2
+IDLE_CLASSES = ("interactive", "factory")  # Il backend è "inattivo" quando queste non hanno chiamate
+
+
+class Overloaded(RuntimeError):
+    """Coda della classe piena: la richiesta va rifiutata (HTTP 429) e ripetuta dopo retry_after secondi"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    """
+    Ammissione e priorità delle chiamate al backend LLM.
+
+    - Al massimo `slots` chiamate in volo, e per ogni classe al massimo limits[classe]
+    - Quando si libera uno slot passa il primo in coda della classe più prioritaria che può partire
+    - Code limitate per classe: oltre -> Overloaded con Retry-After stimato dalla durata media delle chiamate
+    - Statistiche: in esecuzione, in coda, rifiutate, attesa media/massima per classe
+    - idle_seconds(): da quanto non ci sono chiamate interactive/factory (per i lavori in background)
+    """
+
+    def __init__(self, slots=SCHED_SLOTS, limits=None, queue_sizes=None, service_seconds=SCHED_SERVICE_SECONDS):
+        self.slots = max(1, slots)
+        limits = {**SCHED_LIMITS, **(limits or {})}
+        queue_sizes = {**SCHED_QUEUE_SIZES, **(queue_sizes or {})}
+        self.limits = {c: max(1, min(self.slots, limits[c])) for c in PRIORITY_CLASSES}
+        self.queue_sizes = {c: max(0, queue_sizes[c]) for c in PRIORITY_CLASSES}
+        self.service_seconds = service_seconds
+        self._waiting = {c: deque() for c in PRIORITY_CLASSES}  # future in attesa, FIFO per classe
+        self._running = {c: 0 for c in PRIORITY_CLASSES}
+        self._lock = threading.Lock()
+        self._last_busy = time.time()
+        self.stats = {c: {"admitted": 0, "rejected": 0, "started": 0, "completed": 0,
+                          "wait_total": 0.0, "wait_max": 0.0}
+                      for c in PRIORITY_CLASSES}
+
+    @staticmethod
+    def _validate(priority):
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Classe di priorità sconosciuta: {priority}. Disponibili: {list(PRIORITY_CLASSES)}")
+
+    def _can_run(self, priority):
+        return sum(self._running.values()) < self.slots and self._running[priority] < self.limits[priority]
+
+    def _retry_after(self, priority):
+        """Secondi stimati prima che la coda della classe si svuoti (chiamata con lock)"""
+        backlog = sum(len(self._waiting[c]) for c in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(priority) + 1])
+        return max(1, math.ceil((backlog + 1) * self.service_seconds / self.limits[priority]))
+
+    def _reject(self, priority):
+        self.stats[priority]["rejected"] += 1
+        retry_after = self._retry_after(priority)
+        return Overloaded(f"Backend LLM sovraccarico (coda '{priority}' piena: {len(self._waiting[priority])} "
+                          f"in attesa). Riprova tra {retry_after}s.", retry_after)
+
+    def check(self, priority):
+        """Ammissione senza prenotare uno slot (es. prima di aprire uno stream SSE)"""
+        self._validate(priority)
+        with self._lock:
+            if not self._can_run(priority) and len(self._waiting[priority]) >= self.queue_sizes[priority]:
+                raise self._reject(priority)
+
+    def _dispatch(self):
+        """Assegna gli slot liberi ai primi in coda, in ordine di priorità (chiamata con lock)"""
+        for priority in PRIORITY_CLASSES:
+            waiting = self._waiting[priority]
+            while waiting and self._can_run(priority):
+                future = waiting.popleft()
+                self._running[priority] += 1
+                future.get_loop().call_soon_threadsafe(self._wake, future, priority)
+
+    def _wake(self, future, priority):
+        if future.cancelled():
+            self.release(priority)  # Slot assegnato a una richiesta nel frattempo annullata
+        else:
+            future.set_result(True)
+
+    async def acquire(self, priority):
+        """Attende uno slot per la classe; Overloaded se la sua coda è piena"""
+        self._validate(priority)
+        start = time.time()
+        with self._lock:
+            if priority in IDLE_CLASSES:
+                self._last_busy = start
+            if self._can_run(priority) and not self._waiting[priority]:
+                self._running[priority] += 1
+                self.stats[priority]["admitted"] += 1
+                self.stats[priority]["started"] += 1
+                return
+            if len(self._waiting[priority]) >= self.queue_sizes[priority]:
+                raise self._reject(priority)
+            future = asyncio.get_running_loop().create_future()
+            self._waiting[priority].append(future)
+            self.stats[priority]["admitted"] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if future in self._waiting[priority]:
+                    self._waiting[priority].remove(future)
+                elif future.done() and not future.cancelled():
+                    self._release(priority)  # Slot già ricevuto ma mai usato
+            raise
+        waited = time.time() - start
+        with self._lock:
+            self.stats[priority]["started"] += 1
+            self.stats[priority]["wait_total"] += waited
+            self.stats[priority]["wait_max"] = max(self.stats[priority]["wait_max"], waited)
+
+    def _release(self, priority, duration=None):
+        """Libera uno slot (chiamata con lock) e lo passa al prossimo in coda"""
+        self._running[priority] -= 1
+        if priority in IDLE_CLASSES:
+            self._last_busy = time.time()
+        if duration is not None:
+            self.stats[priority]["completed"] += 1
+            self.service_seconds += SERVICE_EWMA_ALPHA * (duration - self.service_seconds)
+        self._dispatch()
+
+    def release(self, priority, duration=None):
+        with self._lock:
+            self._release(priority, duration)
+
+    @asynccontextmanager
+    async def slot(self, priority):
+        """async with scheduler.slot("interactive"): chiamata al backend"""
+        await self.acquire(priority)
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.release(priority, time.time() - start)
+
+    def _idle_seconds(self):
+        if any(self._running[c] or self._waiting[c] for c in IDLE_CLASSES):
+            return 0.0
+        return time.time() - self._last_busy
+
+    def idle_seconds(self):
+        """0 se ci sono chiamate interactive/factory in corso o in coda, altrimenti secondi dall'ultima"""
+        with self._lock:
+            return self._idle_seconds()
+
+    def get_stats(self):
+        with self._lock:
+            classes = {}
+            for c in PRIORITY_CLASSES:
+                s = self.stats[c]
+                classes[c] = {
+                    "running": self._running[c], "queued": len(self._waiting[c]),
+                    "limit": self.limits[c], "queue_size": self.queue_sizes[c],
+                    "admitted": s["admitted"], "rejected": s["rejected"], "completed": s["completed"],
+                    "avg_wait": round(s["wait_total"] / s["started"], 3) if s["started"] else 0.0,
+                    "max_wait": round(s["wait_max"], 3),
+                }
+            return {"slots": self.slots, "service_seconds": round(self.service_seconds, 2),
+                    "idle_seconds": round(self._idle_seconds(), 1),
+                    "classes": classes}
@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from context_window import strip_reasoning
+
+# --- CONFIGURAZIONE ESTRAZIONE MEMORIA ---
+MEMORY_QUEUE_DIR = os.getenv("MEMORY_QUEUE_DIR", os.path.join("data", "memory_queue"))
+MEMORY_BATCH_SIZE = int(os.getenv("MEMORY_BATCH_SIZE", "8"))              # turni per chiamata di estrazione
+MEMORY_BATCH_MAX_AGE = float(os.getenv("MEMORY_BATCH_MAX_AGE", "300"))    # seconds: batch incompleto processato comunque
+MEMORY_IDLE_SECONDS = float(os.getenv("MEMORY_IDLE_SECONDS", "5"))        # backend senza chat/factory da almeno N secondi
+MEMORY_POLL_SECONDS = float(os.getenv("MEMORY_POLL_SECONDS", "1"))
+MEMORY_MAX_ATTEMPTS = int(os.getenv("MEMORY_MAX_ATTEMPTS", "3"))          # risposte non valide prima di scartare il batch
+MEMORY_INPUT_CHARS = int(os.getenv("MEMORY_INPUT_CHARS", "1500"))         # caratteri del messaggio tenuti per turno
+
+QUEUE_FILE = "pending.jsonl"
+OFFSET_FILE = "pending.offset"
+
+
+class PendingTurns:
+    """
+    Coda persistente FIFO dei turni da analizzare: sopravvive ai riavvii dell'engine.
+
+    - pending.jsonl: un turno per riga, sempre in append
+    - pending.offset: byte del primo turno non ancora processato (scrittura atomica)
+    - Coda svuotata del tutto -> file troncati (niente crescita senza limite)
+    """
+
+    def __init__(self, directory=MEMORY_QUEUE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._queue_path = os.path.join(directory, QUEUE_FILE)
+        self._offset_path = os.path.join(directory, OFFSET_FILE)
+        self._offset = self._read_offset()
+        self._repair()
+        self._count = sum(1 for _ in self._lines())
+
+    def _read_offset(self):
+        try:
+            with open(self._offset_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_offset(self, offset):
+        with open(self._offset_path + ".tmp", "w") as f:
+            f.write(str(offset))
+        os.replace(self._offset_path + ".tmp", self._offset_path)
+        self._offset = offset
+
+    def _repair(self):
+        """Scarta una riga finale scritta a metà (crash durante l'append)"""
+        if not os.path.exists(self._queue_path):
+            return
+        with open(self._queue_path, "rb+") as f:
+            data = f.read()
+            valid_end = data.rfind(b"\n") + 1
+            if valid_end != len(data):
+                f.truncate(valid_end)
+        self._offset = min(self._offset, valid_end)
+
+    def _lines(self, limit=None):
+        """(lunghezza in byte, turno) dei turni in coda a partire dall'offset"""
+        if not os.path.exists(self._queue_path):
+            return
+        with open(self._queue_path, "rb") as f:
+            f.seek(self._offset)
+            for i, line in enumerate(f):
+                if limit is not None and i >= limit:
+                    break
+                yield len(line), json.loads(line)
+
+    def append(self, turn):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._queue_path, "ab") as f:
+                f.write(json.dumps(turn, ensure_ascii=False).encode("utf-8") + b"\n")
+            self._count += 1
+
+    def peek(self, n):
+        """Primi n turni senza rimuoverli (restano in coda finché non arriva ack)"""
+        with self._lock:
+            return [turn for _, turn in self._lines(n)]
+
+    def ack(self, n):
+        """Rimuove i primi n turni (dopo che sono stati processati)"""
+        with self._lock:
+            consumed = sum(size for size, _ in self._lines(n))
+            self._count -= min(n, self._count)
+            if self._count == 0:
+                open(self._queue_path, "wb").close()
+                self._write_offset(0)
+            else:
+                self._write_offset(self._offset + consumed)
+
+    def __len__(self):
+        return self._count
+
+
+def parse_facts(text, turns):
+    """
+    Risposta JSON {"facts": [{"turn": n, "fact": "..."}]} -> [(indice turno, fatto)].
+    ValueError se la risposta non contiene JSON valido (il batch verrà ritentato).
+    """
+    content = strip_reasoning({"role": "assistant", "content": text})["content"]
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError(f"nessun JSON nella risposta: {content[:80]!r}")
+    data = json.loads(content[start:end + 1])
+    facts = []
+    for item in data.get("facts", []) if isinstance(data, dict) else []:
+        if not isinstance(item, dict):
+            continue
+        turn, fact = item.get("turn"), str(item.get("fact", "")).strip()
+        if isinstance(turn, int) and 1 <= turn <= turns and len(fact) > 5 and "<think>" not in fact.lower():
+            facts.append((turn - 1, fact))
+    return facts
+
+
+class MemoryExtractor:
+    """
+    Estrazione dei fatti per la memoria a lungo termine, differita e a batch.
+
+    - I turni finiscono in una coda su disco (nessuna chiamata LLM durante la richiesta)
+    - Un worker li manda MEMORY_BATCH_SIZE alla volta in un solo prompt con output JSON
+    - Il worker parte solo a backend inattivo (nessuna chat/factory da MEMORY_IDLE_SECONDS),
+      o per un batch incompleto quando il turno più vecchio supera MEMORY_BATCH_MAX_AGE (sempre a backend inattivo)
+    - extract(turns) -> testo della risposta LLM, save(input, fatto), idle_seconds() -> float: forniti dall'engine
+    """
+
+    def __init__(self, extract, save, idle_seconds=lambda: float("inf"), directory=MEMORY_QUEUE_DIR,
+                 batch_size=MEMORY_BATCH_SIZE, max_age=MEMORY_BATCH_MAX_AGE, idle_after=MEMORY_IDLE_SECONDS,
+                 poll_seconds=MEMORY_POLL_SECONDS, max_attempts=MEMORY_MAX_ATTEMPTS):
+        self.extract = extract
+        self.save = save
+        self.idle_seconds = idle_seconds
+        self.queue = PendingTurns(directory)
+        self.batch_size = max(1, batch_size)
+        self.max_age = max_age
+        self.idle_after = idle_after
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max(1, max_attempts)
+        self._attempts = 0
+        self._task = None
+        self.stats = {"enqueued": 0, "skipped": 0, "batches": 0, "turns": 0, "facts": 0,
+                      "llm_calls": 0, "failures": 0, "dropped": 0}
+
+    def enqueue(self, user_input):
+        """Accoda un turno (stessi filtri della vecchia estrazione per turno)"""
+        if len(user_input) < 10 or "ci sei" in user_input.lower():
+            self.stats["skipped"] += 1
+            return False
+        self.queue.append({"input": user_input[:MEMORY_INPUT_CHARS], "ts": time.time()})
+        self.stats["enqueued"] += 1
+        return True
+
+    def ready(self):
+        """Batch da processare ora? (pieno o scaduto, e backend inattivo)"""
+        pending = len(self.queue)
+        if not pending:
+            return False
+        if pending < self.batch_size:
+            oldest = self.queue.peek(1)
+            if not oldest or time.time() - oldest[0].get("ts", 0) < self.max_age:
+                return False
+        return self.idle_seconds() >= self.idle_after
+
+    async def process_batch(self):
+        """Una chiamata LLM per fino a batch_size turni; ritorna i fatti salvati"""
+        batch = await asyncio.to_thread(self.queue.peek, self.batch_size)
+        if not batch:
+            return 0
+        self.stats["llm_calls"] += 1
+        try:
+            facts = parse_facts(await self.extract(batch), len(batch))
+        except ValueError as e:
+            self._attempts += 1
+            self.stats["failures"] += 1
+            if self._attempts < self.max_attempts:
+                raise
+            print(f"⚠️ [MEMORIA] Batch di {len(batch)} turni scartato dopo {self._attempts} risposte non valide: {e}")
+            self.stats["dropped"] += len(batch)
+            facts = []
+        for index, fact in facts:
+            await asyncio.to_thread(self.save, batch[index]["input"], fact)
+            print(f"💾 [MEMORIA] Salvato: {fact[:40]}...")
+        await asyncio.to_thread(self.queue.ack, len(batch))
+        self._attempts = 0
+        self.stats["batches"] += 1
+        self.stats["turns"] += len(batch)
+        self.stats["facts"] += len(facts)
+        return len(facts)
+
+    async def run(self):
+        """Loop del worker (task asyncio avviato dall'engine)"""
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                if self.ready():
+                    await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Backend occupato/giù o JSON non valido: i turni restano in coda, si riprova più tardi
+                print(f"⚠️ [MEMORIA] Estrazione rimandata: {e}")
+                await asyncio.sleep(self.poll_seconds * 5)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+            if len(self.queue):
+                print(f"📥 [MEMORIA] {len(self.queue)} turni in attesa di estrazione (coda persistente).")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self):
+        turns = self.stats["turns"]
+        return {**self.stats, "pending": len(self.queue), "batch_size": self.batch_size,
+                "llm_calls_per_turn": round(self.stats["llm_calls"] / turns, 3) if turns else 0.0,
+                "running": self._task is not None and not self._task.done()}
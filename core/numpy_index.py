@@ -0,0 +1,265 @@
+import os
+import json
+import threading
+import numpy as np
+
+# --- CONFIGURAZIONE INDICE NUMPY ---
+NUMPY_MEMORY_PATH = os.getenv("NUMPY_MEMORY_PATH", os.path.join("data", "numpy_memory"))
+NUMPY_INITIAL_CAPACITY = 1024  # righe pre-allocate nella matrice, raddoppia quando serve
+
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.jsonl"
+HEADER_FILE = "index.json"
+
+
+class NumpyCollection:
+    """
+    Vector store locale con la stessa interfaccia (ridotta) di una collection Chroma:
+    add / query / get / count. Usato da VectorMemory quando Chroma non è disponibile.
+
+    - Embedding in una matrice float32 memory-mapped (vectors.f32)
+    - Documenti e metadata in un sidecar JSONL (meta.jsonl), una riga per vettore
+    - Top-k vettorizzato: distanza l2 (quadrata, come Chroma) o cosine
+    """
+
+    def __init__(self, path=NUMPY_MEMORY_PATH, embedder=None, space="l2"):
+        if space not in ("l2", "cosine"):
+            raise ValueError(f"Spazio non supportato: '{space}' (usa l2 o cosine)")
+        self.path = path
+        self.embedder = embedder  # Serve solo per add/query con testi senza embedding
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._sq_norms = np.zeros(0, dtype=np.float32)  # |v|^2 per riga, evita di ricalcolarli a ogni query
+        self.ids, self.documents, self.metadatas = [], [], []
+
+        os.makedirs(path, exist_ok=True)
+        header = self._read_header()
+        self.space = header.get("space", space)
+        self.dim = header.get("dim")
+        self.embedder_name = header.get("embedder")
+        self.capacity = header.get("capacity", 0)
+        self._load_meta(header.get("count", 0))
+        if self.dim:
+            self._open_vectors()
+            rows = self._vectors[:len(self.ids)]
+            self._sq_norms = np.einsum('ij,ij->i', rows, rows)
+
+    # --- PERSISTENZA ---
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_header(self):
+        try:
+            with open(self._file(HEADER_FILE), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_header(self):
+        """Scrittura atomica (temp -> rename) dell'header"""
+        header = {
+            "dim": self.dim,
+            "count": len(self.ids),
+            "capacity": self.capacity,
+            "space": self.space,
+            "embedder": self.embedder_name
+        }
+        temp_path = self._file(HEADER_FILE) + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(header, f)
+        os.replace(temp_path, self._file(HEADER_FILE))
+
+    def _load_meta(self, count):
+        """
+        Carica il sidecar e lo tronca alle prime 'count' righe valide: righe in più
+        (crash tra append e header) verrebbero altrimenti disallineate dai vettori al prossimo add.
+        """
+        if not os.path.exists(self._file(META_FILE)):
+            return
+        valid_end = 0
+        with open(self._file(META_FILE), "rb") as f:
+            for line in f:
+                if len(self.ids) >= count or not line.endswith(b"\n"):
+                    break
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                self.ids.append(row["id"])
+                self.documents.append(row["document"])
+                self.metadatas.append(row.get("metadata") or {})
+                valid_end += len(line)
+        if os.path.getsize(self._file(META_FILE)) != valid_end:
+            with open(self._file(META_FILE), "rb+") as f:
+                f.truncate(valid_end)
+            print(f"🔧 [NUMPY] meta.jsonl troncato a {len(self.ids)} righe (scrittura interrotta).")
+
+    def _open_vectors(self):
+        self._vectors = np.memmap(self._file(VECTORS_FILE), dtype=np.float32, mode="r+",
+                                  shape=(self.capacity, self.dim))
+
+    def _ensure_capacity(self, needed):
+        if needed <= self.capacity and self._vectors is not None:
+            return
+        new_capacity = max(self.capacity or NUMPY_INITIAL_CAPACITY, 1)
+        while new_capacity < needed:
+            new_capacity *= 2
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._file(VECTORS_FILE), "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.capacity = new_capacity
+        self._open_vectors()
+
+    # --- API STILE CHROMA ---
+
+    def count(self):
+        return len(self.ids)
+
+    def _embed(self, texts):
+        if self.embedder is None:
+            raise ValueError("NumpyCollection: servono embeddings espliciti o un embedder")
+        return self.embedder.embed(texts)
+
+    def add(self, documents, metadatas=None, ids=None, embeddings=None):
+        computed = embeddings is None  # Vettori espliciti: il modello lo dichiara chi li passa
+        if computed:
+            embeddings = self._embed(documents)
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) != len(documents):
+            raise ValueError("NumpyCollection: embeddings e documents non allineati")
+        metadatas = metadatas or [{} for _ in documents]
+        ids = ids or [str(len(self.ids) + i) for i in range(len(documents))]
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(matrix.shape[1])
+                if computed:
+                    self.embedder_name = getattr(self.embedder, "model_name", None)
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"NumpyCollection: dimensione {matrix.shape[1]} != {self.dim} dell'indice")
+
+            start = len(self.ids)
+            self._ensure_capacity(start + len(documents))
+            self._vectors[start:start + len(documents)] = matrix
+            self._vectors.flush()
+
+            with open(self._file(META_FILE), "a", encoding="utf-8") as f:
+                for mem_id, doc, meta in zip(ids, documents, metadatas):
+                    f.write(json.dumps({"id": mem_id, "document": doc, "metadata": meta}, ensure_ascii=False) + "\n")
+
+            self._sq_norms = np.concatenate([self._sq_norms, np.einsum('ij,ij->i', matrix, matrix)])
+            self.ids.extend(ids)
+            self.documents.extend(documents)
+            self.metadatas.extend(metadatas)
+            self._write_header()
+
+    def _distances(self, matrix, queries):
+        """Distanze (n_query x n_vettori) nello spazio dell'indice"""
+        if self.space == "cosine":
+            norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(queries, axis=1)[:, None]
+            norms[norms == 0] = 1.0
+            return 1.0 - (queries @ matrix.T) / norms
+        # l2 quadrata: |q|^2 + |v|^2 - 2 q.v
+        sq = self._sq_norms[:len(matrix)]
+        q_sq = np.einsum('ij,ij->i', queries, queries)
+        return np.maximum(q_sq[:, None] + sq[None, :] - 2.0 * (queries @ matrix.T), 0.0)
+
+    def query(self, n_results=10, query_texts=None, query_embeddings=None, include=None):
+        if query_embeddings is None:
+            query_embeddings = self._embed(query_texts or [])
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        with self._lock:
+            count = len(self.ids)
+            if count == 0 or len(queries) == 0:
+                for _ in range(len(queries)):
+                    for key in result:
+                        result[key].append([])
+                return result
+
+            distances = self._distances(self._vectors[:count], queries)
+            k = min(n_results, count)
+            for row in distances:
+                top = np.argpartition(row, k - 1)[:k] if k < count else np.arange(count)
+                top = top[np.argsort(row[top])]
+                result["ids"].append([self.ids[i] for i in top])
+                result["documents"].append([self.documents[i] for i in top])
+                result["metadatas"].append([self.metadatas[i] for i in top])
+                result["distances"].append([float(row[i]) for i in top])
+        return result
+
+    @staticmethod
+    def _matches(metadata, where):
+        """Filtro metadata stile Chroma: {"campo": valore} o {"campo": {"$eq"/"$in": ...}}"""
+        for field, condition in where.items():
+            value = (metadata or {}).get(field)
+            if isinstance(condition, dict):
+                if "$eq" in condition and value != condition["$eq"]:
+                    return False
+                if "$in" in condition and value not in condition["$in"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def get(self, include=None, limit=None, offset=0, where=None):
+        with self._lock:
+            rows = range(len(self.ids))
+            if where:
+                rows = [i for i in rows if self._matches(self.metadatas[i], where)]
+            rows = rows[offset:None if limit is None else offset + limit]
+            result = {
+                "ids": [self.ids[i] for i in rows],
+                "documents": [self.documents[i] for i in rows],
+                "metadatas": [self.metadatas[i] for i in rows]
+            }
+            if include and "embeddings" in include and self._vectors is not None:
+                result["embeddings"] = np.array(self._vectors[list(rows)])
+        return result
+
+    def import_from_chroma(self, collection, batch_size=500, embedder_name="all-MiniLM-L6-v2"):
+        """
+        Copia in blocco una collection Chroma esistente (embeddings inclusi, nessun ricalcolo).
+        embedder_name: modello con cui Chroma ha calcolato i vettori (default di Chroma).
+        Rifiuta l'import se l'embedder collegato o i vettori già presenti vengono da un altro modello.
+        """
+        attached = getattr(self.embedder, "model_name", None)
+        if self.embedder is not None and attached != embedder_name:
+            raise ValueError(f"NumpyCollection: vettori Chroma di '{embedder_name}', embedder collegato '{attached}'")
+        if self.ids and self.embedder_name not in (None, embedder_name):
+            raise ValueError(f"NumpyCollection: indice creato con '{self.embedder_name}', import di '{embedder_name}'")
+        known = set(self.ids)
+        imported, offset = 0, 0
+        while True:
+            page = collection.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+            page_ids = page.get("ids") or []
+            if not page_ids:
+                break
+            rows = [i for i, mem_id in enumerate(page_ids) if mem_id not in known]
+            if rows:
+                embeddings = page.get("embeddings")
+                self.add(
+                    documents=[page["documents"][i] for i in rows],
+                    metadatas=[page["metadatas"][i] or {} for i in rows],
+                    ids=[page_ids[i] for i in rows],
+                    embeddings=[embeddings[i] for i in rows] if embeddings is not None else None
+                )
+                imported += len(rows)
+            offset += len(page_ids)
+        if imported:
+            with self._lock:
+                self.embedder_name = embedder_name
+                self._write_header()
+        print(f"📦 [NUMPY] Importati {imported} ricordi da Chroma.")
+        return imported
+
+
+if __name__ == "__main__":
+    # Import una tantum della collection quantum-chroma: python core/numpy_index.py
+    import chromadb
+    client = chromadb.HttpClient(host=os.getenv("CHROMA_HOST", "localhost"), port=int(os.getenv("CHROMA_PORT", "8000")))
+    NumpyCollection().import_from_chroma(client.get_or_create_collection(name="quantum_memory"))
@@ -0,0 +1,124 @@
+import os
+import sys
+import zlib
+import threading
+from collections import OrderedDict
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from code_analysis import estimate_tokens
+
+# --- CONFIGURAZIONE PROMPT / KV CACHE DEL BACKEND ---
+LLM_PROMPT_CACHE = os.getenv("LLM_PROMPT_CACHE", "on")      # on: invia cache_prompt (llama.cpp) | off
+LLM_SLOTS = int(os.getenv("LLM_SLOTS", "0"))                # slot del server llama.cpp (-np); 0 = niente id_slot
+PREFIX_TRACK_KEYS = int(os.getenv("PREFIX_TRACK_KEYS", "64"))  # ultimi prompt tenuti per stimare il prefisso riusato
+
+CONTEXT_HEADER = "CONTESTO MEMORIA:"
+QUESTION_HEADER = "MESSAGGIO:"
+
+
+def static_system_prompt(persona, tool_names):
+    """Parte fissa del system prompt: persona + tool. Identica byte per byte tra le richieste."""
+    return f"{persona.strip()}\n\nTOOLS DISPONIBILI:\n{list(tool_names)}"
+
+
+def serialize_prompt(messages):
+    """Approssimazione del testo che il chat template passa al tokenizer"""
+    return "".join(f"<{m['role']}>\n{m['content']}\n" for m in messages)
+
+
+class PromptBuilder:
+    """
+    Assembla i messaggi in modo che il prefisso del prompt resti stabile (KV cache del backend riusabile).
+
+    - Ordine: system statico (persona + tool) -> riassunto -> history -> ultimo messaggio utente
+    - Il contesto volatile (memoria vettoriale) va nell'ultimo messaggio, non nel system prompt
+    - Hint per llama.cpp: cache_prompt e id_slot (stessa sessione -> stesso slot)
+    - Statistiche di prefill: token riportati dal backend (usage / timings) + stima locale del prefisso riusato
+    """
+
+    def __init__(self, prompt_cache=LLM_PROMPT_CACHE, slots=LLM_SLOTS, track_keys=PREFIX_TRACK_KEYS):
+        self.prompt_cache = prompt_cache != "off"
+        self.slots = max(0, slots)
+        self.track_keys = max(1, track_keys)
+        self._last_prompts = OrderedDict()  # chiave (sessione o modo) -> ultimo prompt serializzato
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0, "estimated_prompt_tokens": 0, "estimated_reused_tokens": 0,
+            "reported": 0, "prompt_tokens": 0, "prefill_tokens": 0, "cached_tokens": 0
+        }
+
+    def assemble(self, static_prompt, history, user_input, context=None):
+        """[system statico (+ riassunto)] + history + [utente (+ contesto volatile)]"""
+        messages = [{"role": "system", "content": static_prompt}]
+        history = list(history or [])
+        if history and history[0]["role"] == "system":
+            # Riassunto dopo la parte statica: un solo messaggio system per il chat template
+            messages[0]["content"] += "\n\n" + history.pop(0)["content"]
+        messages.extend(history)
+        if context:
+            user_input = f"{CONTEXT_HEADER}\n{context}\n\n{QUESTION_HEADER}\n{user_input}"
+        messages.append({"role": "user", "content": user_input})
+        return messages
+
+    def slot_for(self, key):
+        """Slot stabile per chiave (crc32: uguale tra processi, a differenza di hash())"""
+        if not self.slots or not key:
+            return None
+        return zlib.crc32(key.encode("utf-8")) % self.slots
+
+    def request_options(self, key=None):
+        """Campi extra del payload (ignorati o rifiutati dai backend che non li conoscono, vedi LLMClient)"""
+        options = {}
+        if self.prompt_cache:
+            options["cache_prompt"] = True
+            slot = self.slot_for(key)
+            if slot is not None:
+                options["id_slot"] = slot
+        return options
+
+    def track(self, key, messages):
+        """Stima dei token di prefisso in comune con l'ultimo prompt della stessa chiave"""
+        prompt = serialize_prompt(messages)
+        with self._lock:
+            previous = self._last_prompts.get(key, "")
+            self._last_prompts[key] = prompt
+            self._last_prompts.move_to_end(key)
+            while len(self._last_prompts) > self.track_keys:
+                self._last_prompts.popitem(last=False)
+            reused = len(os.path.commonprefix([previous, prompt]))
+            self.stats["requests"] += 1
+            self.stats["estimated_prompt_tokens"] += estimate_tokens(prompt)
+            self.stats["estimated_reused_tokens"] += estimate_tokens(prompt[:reused])
+
+    def record_usage(self, data):
+        """
+        Token di prompt dalla risposta del backend:
+        llama.cpp -> timings.prompt_n (valutati) / timings.cache_n, OpenAI/vLLM -> usage.prompt_tokens_details.cached_tokens
+        """
+        usage = data.get("usage") or {}
+        timings = data.get("timings") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        if "prompt_n" in timings:
+            prefill = timings["prompt_n"]
+            cached = timings.get("cache_n", (prompt_tokens or prefill) - prefill)
+        elif prompt_tokens is not None:
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+            prefill = prompt_tokens - cached
+        else:
+            return
+        with self._lock:
+            self.stats["reported"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens if prompt_tokens is not None else prefill + cached
+            self.stats["prefill_tokens"] += prefill
+            self.stats["cached_tokens"] += cached
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["estimated_reuse_ratio"] = round(stats["estimated_reused_tokens"] / stats["estimated_prompt_tokens"], 3) \
+            if stats["estimated_prompt_tokens"] else 0.0
+        stats["cached_ratio"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+        return {**stats, "prompt_cache": self.prompt_cache, "slots": self.slots}
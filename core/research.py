@@ -0,0 +1,361 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from urllib.parse import urlparse
+
+import httpx
+import numpy as np
+import lxml.html
+from lxml.etree import ParserError
+from fake_useragent import UserAgent
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from embeddings import get_embedder, HashingEmbedder
+
+# --- CONFIGURAZIONE RICERCA WEB ---
+BRAVE_SEARCH_URL = "https://api.search.brave.com/res/v1/web/search"
+RESEARCH_TOP_N = int(os.getenv("RESEARCH_TOP_N", "3"))                    # pagine scaricate per ricerca
+RESEARCH_MAX_CONNECTIONS = int(os.getenv("RESEARCH_MAX_CONNECTIONS", "10"))
+RESEARCH_PER_HOST = int(os.getenv("RESEARCH_PER_HOST", "2"))              # richieste simultanee per host
+RESEARCH_TIMEOUT = float(os.getenv("RESEARCH_TIMEOUT", "15"))             # seconds
+RESEARCH_CACHE_DIR = os.getenv("RESEARCH_CACHE_DIR", os.path.join("data", "research_cache"))
+RESEARCH_CACHE_TTL = float(os.getenv("RESEARCH_CACHE_TTL", "86400"))      # seconds, poi rivalidazione ETag
+RESEARCH_MAX_CHARS = 8000
+# read_url con domanda: solo i chunk più rilevanti della pagina
+RESEARCH_CHUNK_CHARS = int(os.getenv("RESEARCH_CHUNK_CHARS", "1200"))
+RESEARCH_CHUNK_OVERLAP = int(os.getenv("RESEARCH_CHUNK_OVERLAP", "200"))
+RESEARCH_TOP_K = int(os.getenv("RESEARCH_TOP_K", "4"))
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+BLOCK_TAGS = ["p", "div", "li", "br", "tr", "pre", "section", "blockquote", "h1", "h2", "h3", "h4", "h5", "h6"]
+BOILERPLATE_TAGS = ["script", "style", "noscript", "nav", "footer", "header", "aside", "form", "iframe", "svg"]
+
+
+def pick_user_agent():
+    """Un solo User-Agent per processo (fake_useragent è lento da inizializzare)"""
+    try:
+        return UserAgent().random
+    except Exception:
+        return DEFAULT_USER_AGENT
+
+
+def extract_main_text(html):
+    """
+    Titolo e testo principale di una pagina (lxml, molto più veloce di html.parser).
+    Preferisce <article>/<main> se contengono abbastanza testo, altrimenti tutto il <body>.
+    """
+    try:
+        doc = lxml.html.fromstring(html)
+    except (ParserError, ValueError):
+        return "", ""
+    title = (doc.findtext(".//title") or "").strip()
+    for element in doc.xpath("//" + " | //".join(BOILERPLATE_TAGS)):
+        element.drop_tree()
+    # Un blocco = una riga: i chunk possono seguire i paragrafi
+    for element in doc.xpath("//" + " | //".join(BLOCK_TAGS)):
+        element.tail = "\n" + (element.tail or "")
+
+    def clean(node):
+        lines = (line.strip() for line in node.text_content().splitlines())
+        return "\n".join(line for line in lines if line)
+
+    text = clean(doc)
+    for candidate in doc.xpath("//article | //main"):
+        main_text = clean(candidate)
+        if len(main_text) > 0.3 * len(text):
+            text = main_text
+            break
+    return title, text
+
+
+def chunk_text(text, size=RESEARCH_CHUNK_CHARS, overlap=RESEARCH_CHUNK_OVERLAP):
+    """
+    Chunk sovrapposti che rispettano i confini di riga/paragrafo.
+    Le righe più lunghe di un chunk vengono spezzate a caratteri (con la stessa sovrapposizione).
+    """
+    overlap = min(overlap, size // 2)
+    step = size - overlap
+    pieces = []
+    for line in text.splitlines():
+        line = line.strip()
+        if len(line) > size:
+            pieces.extend(line[i:i + size] for i in range(0, len(line) - overlap, step))
+        elif line:
+            pieces.append(line)
+
+    chunks, current, length = [], [], 0
+    for piece in pieces:
+        if current and length + len(piece) + 1 > size:
+            chunks.append("\n".join(current))
+            # Coda del chunk precedente come contesto del successivo
+            tail, tail_length = [], 0
+            for previous in reversed(current):
+                if tail_length + len(previous) + 1 > overlap or tail_length + len(previous) + len(piece) + 2 > size:
+                    break
+                tail.insert(0, previous)
+                tail_length += len(previous) + 1
+            current, length = tail, tail_length
+        current.append(piece)
+        length += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class PageCache:
+    """
+    Cache su disco delle pagine già estratte, una per URL (json con ETag/Last-Modified).
+    Entro il TTL la pagina viene servita senza rete, dopo viene rivalidata con una GET condizionale.
+    """
+
+    def __init__(self, path=RESEARCH_CACHE_DIR, ttl=RESEARCH_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+
+    def _file(self, url):
+        return os.path.join(self.path, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url):
+        try:
+            with open(self._file(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def set(self, url, entry):
+        os.makedirs(self.path, exist_ok=True)
+        temp_path = self._file(url) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(temp_path, self._file(url))
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def _chunks_file(self, url):
+        return self._file(url)[:-len(".json")] + ".chunks.npz"
+
+    def get_chunks(self, url, key):
+        """(chunks, vettori) salvati per questo testo+embedder, altrimenti None"""
+        try:
+            with np.load(self._chunks_file(url), allow_pickle=False) as data:
+                if str(data["key"]) != key:
+                    return None
+                return [str(c) for c in data["chunks"]], data["vectors"]
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            return None
+
+    def set_chunks(self, url, key, chunks, vectors):
+        os.makedirs(self.path, exist_ok=True)
+        temp_path = self._chunks_file(url) + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, key=np.array(key), chunks=np.array(chunks, dtype=str), vectors=vectors)
+        os.replace(temp_path, self._chunks_file(url))
+
+
+class ResearchClient:
+    """
+    Pipeline di ricerca: Brave Search + download concorrente delle prime N pagine.
+
+    - Un solo httpx.AsyncClient in pool (keep-alive), limite di richieste per host
+    - Testo principale estratto una volta con lxml e salvato in PageCache
+    - Chunk + embedding (stesso embedder di VectorMemory) calcolati una volta per pagina
+    - transport iniettabile (httpx.MockTransport / make_stub_transport) per test senza rete
+    """
+
+    def __init__(self, cache=None, max_connections=RESEARCH_MAX_CONNECTIONS, per_host=RESEARCH_PER_HOST,
+                 timeout=RESEARCH_TIMEOUT, transport=None, api_key=None, embedder="auto"):
+        self.cache = cache or PageCache()
+        self._embedder = embedder
+        self.max_connections = max(1, max_connections)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.api_key = api_key
+        self.user_agent = None
+        self._transport = transport
+        self._client = None
+        self._loop = None
+        self._host_limits = {}
+        self.stats = {"fetched": 0, "cache_hits": 0, "revalidated": 0, "errors": 0, "chunk_hits": 0, "chunked": 0}
+
+    @property
+    def embedder(self):
+        """Embedder di VectorMemory (sentence-transformers) o, se non installato, HashingEmbedder"""
+        if self._embedder == "auto":
+            self._embedder = get_embedder() or HashingEmbedder()
+        return self._embedder
+
+    def _ensure_client(self):
+        """Client e semafori per host in modo lazy, legati all'event loop corrente."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self.user_agent is None:
+                self.user_agent = pick_user_agent()
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.timeout),
+                headers={"User-Agent": self.user_agent},
+                follow_redirects=True,
+                transport=self._transport
+            )
+            self._host_limits = {}
+            self._loop = loop
+        return self._client
+
+    def _host_limit(self, url):
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    async def search(self, query, count=RESEARCH_TOP_N):
+        """Risultati Brave: [{title, url, description}]. Solleva httpx.HTTPError o ValueError."""
+        api_key = self.api_key or os.getenv("BRAVE_API_KEY")
+        if not api_key:
+            raise ValueError("BRAVE_API_KEY mancante nel file .env")
+        client = self._ensure_client()
+        async with self._host_limit(BRAVE_SEARCH_URL):
+            resp = await client.get(BRAVE_SEARCH_URL, params={"q": query, "count": count},
+                                    headers={"X-Subscription-Token": api_key})
+        resp.raise_for_status()
+        results = resp.json().get("web", {}).get("results", [])
+        return [{"title": r.get("title"), "url": r.get("url"), "description": r.get("description", "")}
+                for r in results[:count]]
+
+    async def fetch_page(self, url):
+        """
+        Pagina estratta: {url, title, text, cached, error}.
+        Cache fresca = nessuna richiesta; cache scaduta = GET condizionale (304 -> riuso).
+        """
+        cached = await asyncio.to_thread(self.cache.get, url)
+        if cached and self.cache.is_fresh(cached):
+            self.stats["cache_hits"] += 1
+            return dict(cached, cached=True, error=None)
+
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        client = self._ensure_client()
+        try:
+            async with self._host_limit(url):
+                resp = await client.get(url, headers=headers)
+        except httpx.HTTPError as e:
+            self.stats["errors"] += 1
+            return {"url": url, "title": "", "text": "", "cached": False, "error": str(e) or type(e).__name__}
+
+        if resp.status_code == 304 and cached:
+            self.stats["revalidated"] += 1
+            cached["fetched_at"] = time.time()
+            await asyncio.to_thread(self.cache.set, url, cached)
+            return dict(cached, cached=True, error=None)
+        if resp.status_code != 200:
+            self.stats["errors"] += 1
+            return {"url": url, "title": "", "text": "", "cached": False, "error": f"Status code {resp.status_code}"}
+
+        title, text = await asyncio.to_thread(extract_main_text, resp.content)
+        entry = {
+            "url": url,
+            "title": title,
+            "text": text,
+            "etag": resp.headers.get("etag"),
+            "last_modified": resp.headers.get("last-modified"),
+            "fetched_at": time.time()
+        }
+        await asyncio.to_thread(self.cache.set, url, entry)
+        self.stats["fetched"] += 1
+        return dict(entry, cached=False, error=None)
+
+    def _chunk_index(self, url, text):
+        """Chunk e vettori (normalizzati) della pagina, dalla cache se il testo non è cambiato"""
+        embedder = self.embedder
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16] + ":" + embedder.model_name
+        cached = self.cache.get_chunks(url, key)
+        if cached is not None:
+            self.stats["chunk_hits"] += 1
+            return cached
+        chunks = chunk_text(text)
+        vectors = np.asarray(embedder.embed(chunks), dtype=np.float32).reshape(len(chunks), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        self.cache.set_chunks(url, key, chunks, vectors)
+        self.stats["chunked"] += 1
+        return chunks, vectors
+
+    async def relevant_chunks(self, url, query, top_k=RESEARCH_TOP_K):
+        """
+        Pagina con i top_k chunk più simili alla domanda (in ordine di documento):
+        {url, title, text, cached, error, chunks: [{index, score, text}], total_chunks}
+        """
+        page = await self.fetch_page(url)
+        if page["error"] or not page["text"]:
+            return dict(page, chunks=[], total_chunks=0)
+        chunks, vectors = await asyncio.to_thread(self._chunk_index, url, page["text"])
+        query_vector = np.asarray(await asyncio.to_thread(self.embedder.embed_one, query), dtype=np.float32)
+        scores = vectors @ (query_vector / (np.linalg.norm(query_vector) or 1))
+        best = sorted(int(i) for i in np.argsort(-scores)[:top_k])
+        page["chunks"] = [{"index": i, "score": float(scores[i]), "text": chunks[i]} for i in best]
+        page["total_chunks"] = len(chunks)
+        return page
+
+    async def research(self, query, top_n=RESEARCH_TOP_N):
+        """Ricerca + download concorrente delle prime top_n pagine"""
+        results = await self.search(query, count=top_n)
+        pages = await asyncio.gather(*(self.fetch_page(r["url"]) for r in results if r.get("url")))
+        by_url = {p["url"]: p for p in pages}
+        for r in results:
+            r["page"] = by_url.get(r.get("url"))
+        return results
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def make_stub_transport(pages, search_results=None):
+    """
+    Transport locale per test e sviluppo offline.
+    pages: {url: html} oppure {url: (status, headers, html)}; ETag rispettato (304).
+    search_results: lista Brave [{title, url, description}] servita per BRAVE_SEARCH_URL.
+    """
+    def handler(request):
+        url = str(request.url)
+        if url.startswith(BRAVE_SEARCH_URL):
+            return httpx.Response(200, json={"web": {"results": search_results or []}})
+        page = pages.get(url)
+        if page is None:
+            return httpx.Response(404, text="not found")
+        status, headers, body = page if isinstance(page, tuple) else (200, {}, page)
+        etag = headers.get("ETag")
+        if etag and request.headers.get("if-none-match") == etag:
+            return httpx.Response(304, headers=headers)
+        return httpx.Response(status, headers=headers, text=body)
+    return httpx.MockTransport(handler)
+
+
+# --- PONTE SYNC -> ASYNC (i tool sono funzioni sincrone eseguite in thread) ---
+_loop = None
+_loop_lock = threading.Lock()
+
+def run_sync(coro, timeout=None):
+    """Esegue una coroutine sull'event loop di background condiviso (il pool HTTP resta vivo tra le chiamate)"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True, name="research-loop").start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result(timeout)
+
+research_client = ResearchClient()
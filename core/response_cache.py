@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# --- CONFIGURAZIONE CACHE RISPOSTE ---
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "auto")                  # auto | redis | memory | off
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))                     # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.2"))  # sopra: bypass
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_KEY_PREFIX = "quantum:llm:"
+
+
+def normalize_text(text):
+    """Collassa spazi/indentazione: i prompt f-string di hub.py cambiano solo per whitespace"""
+    return " ".join(str(text).split())
+
+
+def make_cache_key(messages, temperature, mode, model):
+    """Hash stabile di (messages, temperature, mode, model) dopo normalizzazione"""
+    normalized = {
+        "messages": [
+            {"role": m.get("role", ""), "content": normalize_text(m.get("content", ""))}
+            for m in messages
+        ],
+        "temperature": round(float(temperature), 3),
+        "mode": mode,
+        "model": model
+    }
+    raw = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache delle completion LLM davanti a call_llm.
+
+    - Backend Redis (servizio quantum-redis) se disponibile, altrimenti LRU in-process
+    - TTL per entry, eviction LRU oltre max_entries
+    - Bypass automatico sopra max_temperature (risposte volutamente non deterministiche)
+    - Contatori hit / miss / eviction / bypass
+    """
+
+    def __init__(self, backend=LLM_CACHE_BACKEND, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES,
+                 max_temperature=LLM_CACHE_MAX_TEMPERATURE, redis_client=None):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.max_temperature = max_temperature
+        self.enabled = backend != "off"
+        self._local = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "bypassed": 0, "errors": 0}
+
+        self._redis = redis_client
+        if self._redis is None and backend in ("auto", "redis"):
+            self._redis = self._connect_redis(required=(backend == "redis"))
+        self.backend = "off" if not self.enabled else ("redis" if self._redis is not None else "memory")
+
+    @staticmethod
+    def _connect_redis(required=False):
+        if redis is None:
+            if required:
+                print("⚠️ [CACHE] Libreria 'redis' non installata. Uso cache in-process.")
+            return None
+        try:
+            client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, socket_timeout=0.5, socket_connect_timeout=0.5)
+            client.ping()
+            return client
+        except Exception:
+            if required:
+                print(f"⚠️ [CACHE] Redis {REDIS_HOST}:{REDIS_PORT} non raggiungibile. Uso cache in-process.")
+            return None
+
+    def should_bypass(self, temperature):
+        return not self.enabled or temperature > self.max_temperature
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def key_for(self, messages, temperature, mode, model):
+        """Chiave di cache per la richiesta, oppure None se va in bypass"""
+        if self.should_bypass(temperature):
+            self._count("bypassed")
+            return None
+        return make_cache_key(messages, temperature, mode, model)
+
+    def get(self, key):
+        if self._redis is not None:
+            try:
+                value = self._redis.get(REDIS_KEY_PREFIX + key)
+                self._count("hits" if value is not None else "misses")
+                return value.decode("utf-8") if value is not None else None
+            except Exception:
+                self._count("errors")
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._local[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._local.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key, value):
+        if self._redis is not None:
+            try:
+                self._redis.setex(REDIS_KEY_PREFIX + key, self.ttl, value)
+                return
+            except Exception:
+                self._count("errors")
+
+        with self._lock:
+            self._local[key] = (time.time() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._local)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["backend"] = self.backend
+        stats["ttl"] = self.ttl
+        stats["max_entries"] = self.max_entries
+        stats["max_temperature"] = self.max_temperature
+        return stats
@@ -0,0 +1,206 @@
+import os
+import json
+import threading
+from array import array
+
+# --- CONFIGURAZIONE SESSIONI ---
+SESSION_DIR = os.getenv("SESSION_DIR", "memories")
+SESSION_COMPACT_AFTER = int(os.getenv("SESSION_COMPACT_AFTER", "200"))  # messaggi nel log attivo prima della compattazione
+SESSION_KEEP = int(os.getenv("SESSION_KEEP", "60"))                     # messaggi che restano nel log attivo
+
+LOG_EXT = ".jsonl"
+INDEX_EXT = ".idx"
+ARCHIVE_EXT = ".archive.jsonl"
+LEGACY_EXT = ".json"
+OFFSET_SIZE = array("Q").itemsize
+
+
+class SessionStore:
+    """
+    Storico delle conversazioni su log append-only.
+
+    - <nome>.jsonl: un messaggio per riga, ogni turno è un append O(1)
+    - <nome>.idx: offset (uint64) di ogni riga, gli ultimi N messaggi si leggono dalla coda
+    - Compattazione periodica: i messaggi vecchi passano in <nome>.archive.jsonl (mai cancellati, ricercabili)
+    - Import automatico del vecchio <nome>.json (lista completa riscritta a ogni turno)
+    """
+
+    def __init__(self, directory=SESSION_DIR, compact_after=SESSION_COMPACT_AFTER, keep=SESSION_KEEP):
+        self.directory = directory
+        self.compact_after = max(1, compact_after)
+        self.keep = max(0, min(keep, self.compact_after))
+        self._lock = threading.Lock()
+        self._counts = {}  # nome -> messaggi nel log attivo (index verificato)
+
+    def _path(self, name, ext):
+        return os.path.join(self.directory, f"{name}{ext}")
+
+    # --- INDICE ---
+
+    def _read_offsets(self, name, last=None):
+        """Offset dal file indice (solo gli ultimi `last` se indicato)"""
+        offsets = array("Q")
+        try:
+            with open(self._path(name, INDEX_EXT), "rb") as f:
+                if last is not None:
+                    f.seek(0, os.SEEK_END)
+                    f.seek(max(0, f.tell() - last * OFFSET_SIZE))
+                offsets.frombytes(f.read())
+        except FileNotFoundError:
+            pass
+        return offsets
+
+    def _rebuild_index(self, name):
+        """Ricostruisce l'indice scansionando il log (indice mancante o scritto a metà)"""
+        offsets = array("Q")
+        log_path = self._path(name, LOG_EXT)
+        if os.path.exists(log_path):
+            position = valid_end = 0
+            with open(log_path, "rb") as f:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        offsets.append(position)
+                        valid_end = position + len(line)
+                    position += len(line)
+            if position != valid_end:
+                # Riga finale troncata (crash durante la scrittura): viene scartata
+                with open(log_path, "rb+") as f:
+                    f.truncate(valid_end)
+        with open(self._path(name, INDEX_EXT), "wb") as f:
+            offsets.tofile(f)
+        return len(offsets)
+
+    @staticmethod
+    def _line_at(log_path, offset):
+        with open(log_path, "rb") as f:
+            f.seek(offset)
+            return f.readline()
+
+    def _ensure(self, name):
+        """Verifica (una volta per processo) che log e indice siano coerenti; ritorna il numero di messaggi"""
+        if name in self._counts:
+            return self._counts[name]
+        os.makedirs(self.directory, exist_ok=True)
+        log_path = self._path(name, LOG_EXT)
+        if not os.path.exists(log_path) and os.path.exists(self._path(name, LEGACY_EXT)):
+            self._import_legacy(name)
+
+        offsets = self._read_offsets(name, last=1)
+        count = os.path.getsize(self._path(name, INDEX_EXT)) // OFFSET_SIZE if offsets else 0
+        log_size = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        consistent = (not offsets and log_size == 0) or \
+            (offsets and offsets[-1] + len(self._line_at(log_path, offsets[-1])) == log_size)
+        if not consistent:
+            print(f"🔧 [SESSION] Indice di '{name}' ricostruito.")
+            count = self._rebuild_index(name)
+        self._counts[name] = count
+        return count
+
+    def _import_legacy(self, name):
+        try:
+            with open(self._path(name, LEGACY_EXT), "r") as f:
+                history = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return
+        if isinstance(history, list) and history:
+            self._write_log(name, history)
+            print(f"📥 [SESSION] '{name}.json' importato nel log ({len(history)} messaggi).")
+
+    def _write_log(self, name, messages):
+        """Riscrittura atomica di log + indice (import e compattazione)"""
+        offsets = array("Q")
+        log_path, index_path = self._path(name, LOG_EXT), self._path(name, INDEX_EXT)
+        with open(log_path + ".tmp", "wb") as f:
+            for message in messages:
+                offsets.append(f.tell())
+                f.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        with open(index_path + ".tmp", "wb") as f:
+            offsets.tofile(f)
+        os.replace(log_path + ".tmp", log_path)
+        os.replace(index_path + ".tmp", index_path)
+
+    # --- API ---
+
+    def append(self, name, *messages):
+        """Aggiunge messaggi in coda al log (nessuna riscrittura del file)"""
+        with self._lock:
+            count = self._ensure(name)
+            offsets = array("Q")
+            with open(self._path(name, LOG_EXT), "ab") as f:
+                for message in messages:
+                    offsets.append(f.tell())
+                    f.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+            with open(self._path(name, INDEX_EXT), "ab") as f:
+                offsets.tofile(f)
+            self._counts[name] = count + len(messages)
+            if self._counts[name] > self.compact_after:
+                self._compact(name)
+
+    def tail(self, name, n):
+        """Ultimi n messaggi: lettura dalla coda del log tramite indice"""
+        if n <= 0:
+            return []
+        with self._lock:
+            if not self._ensure(name):
+                return []
+            offsets = self._read_offsets(name, last=n)
+            with open(self._path(name, LOG_EXT), "rb") as f:
+                f.seek(offsets[0])
+                return [json.loads(line) for line in f.read().splitlines() if line]
+
+    def count(self, name):
+        """Messaggi totali (archivio + log attivo)"""
+        with self._lock:
+            live = self._ensure(name)
+        archived = 0
+        if os.path.exists(self._path(name, ARCHIVE_EXT)):
+            with open(self._path(name, ARCHIVE_EXT), "rb") as f:
+                archived = sum(1 for _ in f)
+        return archived + live
+
+    def _compact(self, name):
+        """Sposta in archivio tutto tranne gli ultimi `keep` messaggi (chiamata con lock)"""
+        offsets = self._read_offsets(name)
+        split = len(offsets) - self.keep
+        if split <= 0:
+            return
+        with open(self._path(name, LOG_EXT), "rb") as f:
+            archived = f.read(offsets[split]) if split < len(offsets) else f.read()
+            kept = f.read()
+        with open(self._path(name, ARCHIVE_EXT), "ab") as f:
+            f.write(archived)
+            f.flush()
+            os.fsync(f.fileno())
+        self._write_log(name, [json.loads(line) for line in kept.splitlines() if line])
+        self._counts[name] = self.keep if split < len(offsets) else 0
+        print(f"🗜️ [SESSION] '{name}': {split} messaggi archiviati, {self._counts[name]} nel log attivo.")
+
+    def search(self, name, query, limit=10):
+        """Messaggi (archivio incluso) che contengono tutte le parole della query, i più recenti prima"""
+        words = [w.lower() for w in query.split()]
+        if not words:
+            return []
+        with self._lock:
+            self._ensure(name)
+        matches = []
+        for ext in (ARCHIVE_EXT, LOG_EXT):
+            path = self._path(name, ext)
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if all(w in line.lower() for w in words):
+                        message = json.loads(line)
+                        if all(w in str(message.get("content", "")).lower() for w in words):
+                            matches.append(message)
+        return matches[::-1][:limit]
+
+    def delete(self, name):
+        """Cancella sessione, indice e archivio"""
+        with self._lock:
+            self._counts.pop(name, None)
+            for ext in (LOG_EXT, INDEX_EXT, ARCHIVE_EXT):
+                try:
+                    os.remove(self._path(name, ext))
+                except FileNotFoundError:
+                    pass
@@ -1,50 +1,69 @@
 import os
-import requests
+import re
+import sys
+import time
 import json
-import subprocess
 import shlex
-from bs4 import BeautifulSoup
-from fake_useragent import UserAgent
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from executor import command_executor, QueueFullError
+from research import research_client, run_sync, RESEARCH_TOP_N, RESEARCH_TOP_K, RESEARCH_MAX_CHARS
+from env_manager import EnvManager, EnvSetupError
 
 # Security Configuration
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_WRITE_DIRS = ["projects/", "memories/"]
 COMMAND_TIMEOUT = 60  # seconds
+TERMINAL_OUTPUT_BYTES = 2000  # coda di output mostrata all'LLM da terminal_run
 ALLOWED_COMMANDS = ["python3", "pip", "ls", "cat", "mkdir", "pytest"]
+# Unica eccezione ai path: l'interprete di un venv del pool (core/env_manager.py), relativo a projects/
+VENV_PYTHON_PATTERN = re.compile(r'^\.venvs/[0-9a-f]{16}/bin/python3$')
+SEARCH_EXCERPT_CHARS = 400  # estratto per ogni risultato di web_search
+PROJECT_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]*$')  # una sola directory sotto projects/
+
+# Venv del runtime creati qui, accanto a terminal_run che li esegue (stesso container, stesso interprete)
+env_manager = EnvManager()
 
-# --- TOOL 1: RICERCA WEB (Brave) ---
+# --- TOOL 1: RICERCA WEB (Brave + prime pagine scaricate in parallelo) ---
 def web_search(query):
-    api_key = os.getenv("BRAVE_API_KEY")
-    if not api_key: return "ERRORE: BRAVE_API_KEY mancante nel file .env"
     try:
-        url = "https://api.search.brave.com/res/v1/web/search"
-        headers = {"X-Subscription-Token": api_key}
-        params = {"q": query, "count": 3}
-        resp = requests.get(url, headers=headers, params=params, timeout=10)
-        if resp.status_code == 200:
-            results = resp.json().get('web', {}).get('results', [])
-            if not results: return "Nessun risultato."
-            output = f"--- RISULTATI WEB PER: '{query}' ---\n"
-            for res in results:
-                output += f"- {res.get('title')}: {res.get('url')}\n"
-            return output
+        results = run_sync(research_client.research(query, top_n=RESEARCH_TOP_N))
+    except ValueError as e: return f"ERRORE: {e}"
     except Exception as e: return f"Errore Web: {e}"
-    return "Errore generico ricerca."
+    if not results: return "Nessun risultato."
+    output = f"--- RISULTATI WEB PER: '{query}' ---\n"
+    for res in results:
+        output += f"- {res.get('title')}: {res.get('url')}\n"
+        page = res.get("page")
+        if page and page.get("text"):
+            excerpt = " ".join(page["text"][:SEARCH_EXCERPT_CHARS].split())
+            output += f"  > {excerpt}...\n"
+    return output
 
-# --- TOOL 2: LETTORE DOCUMENTAZIONE ---
-def read_url(url):
+# --- TOOL 2: LETTORE DOCUMENTAZIONE (cache su disco, rivalidazione ETag) ---
+def read_url(url, query=""):
+    """
+    Senza query: testo della pagina troncato a RESEARCH_MAX_CHARS.
+    Con query: solo i RESEARCH_TOP_K chunk più rilevanti (chunk ed embedding in cache per URL).
+    """
     try:
-        ua = UserAgent()
-        headers = {'User-Agent': ua.random}
-        resp = requests.get(url, headers=headers, timeout=15)
-        if resp.status_code != 200: return f"Errore: Status code {resp.status_code}"
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        for script in soup(["script", "style", "nav", "footer"]): script.decompose()
-        text = soup.get_text(separator='\n')
-        lines = (line.strip() for line in text.splitlines())
-        clean_text = '\n'.join(chunk for chunk in lines if chunk)
-        return f"--- CONTENUTO URL: {url} ---\n{clean_text[:8000]}..."
+        if query:
+            page = run_sync(research_client.relevant_chunks(url, query, top_k=RESEARCH_TOP_K))
+        else:
+            page = run_sync(research_client.fetch_page(url))
     except Exception as e: return f"Errore lettura URL: {str(e)}"
+    if page["error"]:
+        if page["error"].startswith("Status code"): return f"Errore: {page['error']}"
+        return f"Errore lettura URL: {page['error']}"
+    if not query:
+        return f"--- CONTENUTO URL: {url} ---\n{page['text'][:RESEARCH_MAX_CHARS]}..."
+    output = f"--- CONTENUTO URL: {url} (sezioni rilevanti per: '{query}') ---\n"
+    for chunk in page["chunks"]:
+        output += f"[{chunk['index'] + 1}/{page['total_chunks']}]\n{chunk['text']}\n\n"
+    return output
 
 # --- TOOL 3: SCRITTURA FILE ---
 def write_file(filename, content):
@@ -90,60 +109,112 @@ def write_file(filename, content):
         return f"Errore scrittura: {str(e)}"
 
 # --- TOOL 4: TERMINAL RUNNER (NUOVO - IL BRACCIO ESECUTIVO) ---
-def terminal_run(command):
+def execute_command(command, output_limit=None, healthy_after=None):
     """
-    Esecuzione sicura con whitelist, timeout, sandboxing.
+    Esecuzione sicura con whitelist, timeout, sandboxing (executor con rlimit e coda limitata).
+    Risultato strutturato: {ok, exit_code, stdout, stderr, duration, outcome, error}
+    (error = comando rifiutato, non eseguibile, coda piena o timeout; exit_code None).
+    stdout/stderr: ultimi output_limit byte (default OUTPUT_BUFFER_BYTES dell'executor).
+    healthy_after: modalità watch per servizi long-running (kill al primo traceback = "crashed",
+    vivo per healthy_after secondi = "healthy", ok=True anche se il processo viene poi terminato).
     """
+    start = time.time()
+    result = {"ok": False, "exit_code": None, "stdout": "", "stderr": "", "duration": 0.0, "outcome": None, "error": None}
+    
+    def rejected(message):
+        result["error"] = message
+        result["duration"] = round(time.time() - start, 3)
+        return result
+    
+    # 1. Safe parsing (no shell injection)
+    try:
+        parsed = shlex.split(command)
+    except ValueError:
+        return rejected("ERRORE: Comando malformato")
+    
+    if not parsed:
+        return rejected("ERRORE: Comando vuoto")
+    
+    # 2. Whitelist enforcement - validate only the base command name
+    base_cmd = os.path.basename(parsed[0])
+    # Remove any path components to prevent bypass with /usr/bin/../../../bin/malicious
+    if ('/' in parsed[0] or '\\' in parsed[0]) and not VENV_PYTHON_PATTERN.match(parsed[0]):
+        return rejected("ERRORE SICUREZZA: Path nel comando non consentito")
+    
+    if base_cmd not in ALLOWED_COMMANDS:
+        return rejected(f"ERRORE SICUREZZA: '{base_cmd}' non consentito. Whitelist: {ALLOWED_COMMANDS}")
+    
+    # 3. Dangerous pattern detection
+    dangerous = [';', '&&', '||', '|', '>', '<', '`', '$(', 'rm', 'wget', 'curl']
+    full_cmd = ' '.join(parsed)
+    if any(p in full_cmd for p in dangerous):
+        return rejected("ERRORE SICUREZZA: Pattern pericoloso rilevato")
+    
     try:
-        # 1. Safe parsing (no shell injection)
-        try:
-            parsed = shlex.split(command)
-        except ValueError:
-            return "ERRORE: Comando malformato"
-        
-        if not parsed:
-            return "ERRORE: Comando vuoto"
-        
-        # 2. Whitelist enforcement - validate only the base command name
-        base_cmd = os.path.basename(parsed[0])
-        # Remove any path components to prevent bypass with /usr/bin/../../../bin/malicious
-        if '/' in parsed[0] or '\\' in parsed[0]:
-            return "ERRORE SICUREZZA: Path nel comando non consentito"
-        
-        if base_cmd not in ALLOWED_COMMANDS:
-            return f"ERRORE SICUREZZA: '{base_cmd}' non consentito. Whitelist: {ALLOWED_COMMANDS}"
-        
-        # 3. Dangerous pattern detection
-        dangerous = [';', '&&', '||', '|', '>', '<', '`', '$(', 'rm', 'wget', 'curl']
-        full_cmd = ' '.join(parsed)
-        if any(p in full_cmd for p in dangerous):
-            return "ERRORE SICUREZZA: Pattern pericoloso rilevato"
-        
         # 4. Working directory isolation
         safe_cwd = os.path.join(os.getcwd(), "projects")
         os.makedirs(safe_cwd, exist_ok=True)
         
-        # 5. Execution with timeout
-        result = subprocess.run(
-            parsed,
-            shell=False,  # ← CRITICAL: No shell injection
-            cwd=safe_cwd,
-            capture_output=True,
-            text=True,
-            timeout=COMMAND_TIMEOUT
-        )
-        
-        output = result.stdout if result.returncode == 0 else result.stderr
-        status = "✅" if result.returncode == 0 else f"❌ (exit {result.returncode})"
-        
-        return f"{status} OUTPUT:\n{output[:2000]}"
-    
-    except subprocess.TimeoutExpired:
-        return f"ERRORE TIMEOUT: Comando superato {COMMAND_TIMEOUT}s"
+        # 5. Execution with timeout + rlimit (shell=False nell'executor: no shell injection)
+        limit_kwargs = {"output_limit": output_limit} if output_limit else {}
+        completed = command_executor.run(parsed, cwd=safe_cwd, timeout=COMMAND_TIMEOUT,
+                                         healthy_after=healthy_after, **limit_kwargs)
+    except QueueFullError as e:
+        return rejected(f"ERRORE CODA: {e}, riprova più tardi")
     except FileNotFoundError:
-        return f"ERRORE: Comando '{parsed[0]}' non trovato"
+        return rejected(f"ERRORE: Comando '{parsed[0]}' non trovato")
     except Exception as e:
-        return f"Errore esecuzione: {str(e)}"
+        return rejected(f"Errore esecuzione: {str(e)}")
+    
+    result.update(stdout=completed["stdout"], stderr=completed["stderr"], outcome=completed["outcome"])
+    if completed["timed_out"]:
+        return rejected(f"ERRORE TIMEOUT: Comando superato {COMMAND_TIMEOUT}s")
+    
+    result.update(
+        ok=completed["outcome"] == "healthy" or (completed["outcome"] == "exited" and completed["exit_code"] == 0),
+        exit_code=completed["exit_code"],
+        duration=round(time.time() - start, 3)
+    )
+    return result
+
+def terminal_run(command):
+    """
+    Versione testuale di execute_command, per il loop tool dell'LLM.
+    """
+    result = execute_command(command, output_limit=TERMINAL_OUTPUT_BYTES)
+    if result["error"]:
+        return result["error"]
+    
+    output = result["stdout"] if result["exit_code"] == 0 else result["stderr"]
+    status = "✅" if result["exit_code"] == 0 else f"❌ (exit {result['exit_code']})"
+    
+    return f"{status} OUTPUT:\n{output}"
+
+# --- SETUP AMBIENTE RUNTIME (solo step deterministici della factory, non esposto all'LLM) ---
+def setup_env(project):
+    """
+    Venv del pool con i requirements di projects/<project>/requirements.txt.
+    Risultato: {ok, python, duration, error}; python è relativo a projects/ (cwd di terminal_run).
+    """
+    start = time.time()
+    result = {"ok": False, "python": None, "duration": 0.0, "error": None}
+    if not PROJECT_NAME_PATTERN.match(project or ""):
+        result["error"] = f"ERRORE SICUREZZA: Nome progetto non valido: {project!r}"
+        return result
+
+    requirements = ""
+    requirements_path = os.path.join("projects", project, "requirements.txt")
+    if os.path.exists(requirements_path):
+        with open(requirements_path, "r", encoding="utf-8") as f:
+            requirements = f.read()
+
+    try:
+        python = env_manager.ensure_env(requirements)
+        result.update(ok=True, python=os.path.relpath(python, "projects"))
+    except EnvSetupError as e:
+        result["error"] = str(e)
+    result["duration"] = round(time.time() - start, 3)
+    return result
 
 # Mappa dei tool disponibili
 AVAILABLE_TOOLS = {
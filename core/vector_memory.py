@@ -1,51 +1,340 @@
-import chromadb
-from chromadb.config import Settings
 import os
+import sys
+import re
 import uuid
+import atexit
+import hashlib
+import weakref
+import threading
+from collections import OrderedDict
 from datetime import datetime
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+try:
+    import chromadb
+except ImportError:
+    chromadb = None
+
+from embeddings import get_embedder, normalize_text, HashingEmbedder
+from numpy_index import NumpyCollection, NUMPY_MEMORY_PATH
+
+# --- CONFIGURAZIONE BACKEND ---
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "http")           # http | persistent | ephemeral | numpy
+CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+MEMORY_PATH = os.getenv("MEMORY_PATH", os.path.join("data", "memory"))  # solo backend persistent
+
+# --- CONFIGURAZIONE SCRITTURE ---
+MEMORY_FLUSH_SIZE = int(os.getenv("MEMORY_FLUSH_SIZE", "16"))             # fatti in coda prima del flush
+MEMORY_FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "5"))    # seconds
+MEMORY_DEDUP_DISTANCE = float(os.getenv("MEMORY_DEDUP_DISTANCE", "0.15")) # sotto: quasi-duplicato
+MEMORY_KNOWN_HASHES = int(os.getenv("MEMORY_KNOWN_HASHES", "4096"))       # hash già salvati tenuti in RAM (LRU)
+
+# --- CONFIGURAZIONE CACHE RICERCHE ---
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+SEARCH_CACHE_SIMILARITY = float(os.getenv("SEARCH_CACHE_SIMILARITY", "0.95"))  # cosine per "domanda simile"
+
+def fact_hash(fact):
+    """Hash del fatto normalizzato (case, punteggiatura e spazi non contano)"""
+    normalized = " ".join(re.sub(r'[^\w\s]', ' ', fact.lower()).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def _flush_at_exit(memory_ref):
+    """atexit tiene solo un weakref: un'istanza non chiusa resta comunque collezionabile"""
+    memory = memory_ref()
+    if memory is not None:
+        memory.flush()
+
+
+def create_chroma_client(backend=MEMORY_BACKEND, host=CHROMA_HOST, port=CHROMA_PORT, path=MEMORY_PATH):
+    """
+    Client Chroma per il backend scelto:
+    - http: server quantum-chroma (un hop di rete per ogni save/search)
+    - persistent: Chroma in-process su directory locale (nessun hop di rete)
+    - ephemeral: in-memory, per test e sviluppo
+    Il backend numpy non usa Chroma: vedi NumpyCollection.
+    """
+    if chromadb is None:
+        raise ImportError("chromadb non installato: usa MEMORY_BACKEND=numpy")
+    if backend == "http":
+        return chromadb.HttpClient(host=host, port=port)
+    if backend == "persistent":
+        os.makedirs(path, exist_ok=True)
+        return chromadb.PersistentClient(path=path)
+    if backend == "ephemeral":
+        return chromadb.EphemeralClient()
+    raise ValueError(f"MEMORY_BACKEND non valido: '{backend}' (usa http, persistent o ephemeral)")
 
 class VectorMemory:
-    def __init__(self):
-        # Connessione persistente
-        self.client = chromadb.HttpClient(host='localhost', port=8000)
-        self.collection = self.client.get_or_create_collection(name="quantum_memory")
-        print(f"🧠 Memoria V4 Attiva. Ricordi: {self.collection.count()}")
+    def __init__(self, client=None, backend=MEMORY_BACKEND, flush_size=MEMORY_FLUSH_SIZE, flush_interval=MEMORY_FLUSH_INTERVAL,
+                 dedup_distance=MEMORY_DEDUP_DISTANCE, embedder="auto", search_cache_size=SEARCH_CACHE_SIZE,
+                 search_cache_similarity=SEARCH_CACHE_SIMILARITY, collection_name="quantum_memory", path=None,
+                 known_hashes_size=MEMORY_KNOWN_HASHES):
+        # Embedding locali (None = embedding calcolati lato server da Chroma)
+        self.embedder = get_embedder() if embedder == "auto" else embedder
+
+        # Connessione (http / persistent / ephemeral / numpy, vedi MEMORY_BACKEND)
+        self.backend = backend if client is None else "custom"
+        if client is None and backend == "numpy":
+            # Nessun servizio esterno: gli embedding li calcoliamo sempre noi
+            if self.embedder is None:
+                self.embedder = HashingEmbedder()
+            self.client = None
+            self.collection = NumpyCollection(path=path or NUMPY_MEMORY_PATH, embedder=self.embedder)
+            if self.collection.embedder_name not in (None, self.embedder.model_name):
+                print(f"⚠️ [NUMPY] Indice creato con '{self.collection.embedder_name}', "
+                      f"embedder attuale '{self.embedder.model_name}'.")
+            elif self.collection.embedder_name is None:
+                # flush() passa vettori espliciti: dichiariamo noi il modello che li calcola
+                self.collection.embedder_name = self.embedder.model_name
+        else:
+            self.client = client or create_chroma_client(backend, path=path or MEMORY_PATH)
+            self.collection = self.client.get_or_create_collection(name=collection_name)
+
+        # Cache risultati di search(), invalidata a ogni scrittura
+        self.search_cache_size = max(1, search_cache_size)
+        self.search_cache_similarity = search_cache_similarity
+        self._search_cache = OrderedDict()  # (query, n_results, threshold) -> (embedding, risultato)
+        self._search_lock = threading.Lock()
+        self.search_stats = {"hits": 0, "similar_hits": 0, "misses": 0, "invalidations": 0}
+
+        # Write-behind buffer: i fatti vengono accodati e scritti in blocco
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.dedup_distance = dedup_distance
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+        # Hash già visti nella collection (LRU): riempito dai flush, niente scansione all'avvio.
+        # Chi esce dalla LRU viene ritrovato dalla get() filtrata di _drop_known
+        self.known_hashes_size = max(1, known_hashes_size)
+        self._known_hashes = OrderedDict()
+        self._exit_flush = lambda ref=weakref.ref(self): _flush_at_exit(ref)
+        atexit.register(self._exit_flush)
+
+        print(f"🧠 Memoria V4 Attiva [{self.backend}]. Ricordi: {self.collection.count()}")
 
     def save(self, user_input, fact_extracted):
         """
         Salva un concetto distillato (fact_extracted) collegandolo all'input originale.
+        Il fatto viene accodato: la scrittura su Chroma avviene in blocco (flush).
         """
         if not fact_extracted or len(fact_extracted) < 5:
             return
 
-        mem_id = str(uuid.uuid4())
+        f_hash = fact_hash(fact_extracted)
         now = datetime.now()
-        
+
         # Salviamo il "Fatto" come documento principale
         text_to_save = f"FATTO: {fact_extracted}\nCONTESTO ORIGINALE: {user_input}"
-        
-        self.collection.add(
-            documents=[text_to_save],
-            metadatas=[{
-                "timestamp": now.timestamp(),
-                "date_iso": now.strftime("%Y-%m-%d %H:%M:%S"),
-                "type": "fact"
-            }],
-            ids=[mem_id]
-        )
-        print(f"💾 [DB] Ricordo cristallizzato: {fact_extracted[:50]}...")
+
+        with self._lock:
+            if f_hash in self._known_hashes or any(p['metadata']['fact_hash'] == f_hash for p in self._pending):
+                print(f"⏭️  [DB] Fatto duplicato ignorato: {fact_extracted[:50]}...")
+                return
+            self._pending.append({
+                "id": str(uuid.uuid4()),
+                "document": text_to_save,
+                "metadata": {
+                    "timestamp": now.timestamp(),
+                    "date_iso": now.strftime("%Y-%m-%d %H:%M:%S"),
+                    "type": "fact",
+                    "fact_hash": f_hash
+                }
+            })
+            should_flush = len(self._pending) >= self.flush_size
+            if not should_flush and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if should_flush:
+            self.flush()
+
+    def _drop_known(self, batch):
+        """Scarta i fatti già salvati: una sola get() filtrata per fact_hash (solo metadata) per tutto il batch"""
+        with self._lock:
+            unknown = list({p['metadata']['fact_hash'] for p in batch} - self._known_hashes.keys())
+        if unknown:
+            try:
+                existing = self.collection.get(where={"fact_hash": {"$in": unknown}}, include=["metadatas"])
+            except Exception as e:
+                print(f"⚠️ [DB] Controllo duplicati non riuscito, batch scritto comunque: {e}")
+                existing = {}
+            found = {m['fact_hash'] for m in existing.get('metadatas') or [] if m and m.get('fact_hash')}
+        else:
+            found = set()
+        with self._lock:
+            kept = [p for p in batch
+                    if p['metadata']['fact_hash'] not in found and p['metadata']['fact_hash'] not in self._known_hashes]
+            self._remember_hashes(found)
+        if len(kept) < len(batch):
+            print(f"⏭️  [DB] {len(batch) - len(kept)} fatti già salvati ignorati.")
+        return kept
+
+    def _remember_hashes(self, hashes):
+        """Da chiamare con self._lock: aggiorna la LRU degli hash già salvati"""
+        for f_hash in hashes:
+            self._known_hashes[f_hash] = True
+            self._known_hashes.move_to_end(f_hash)
+        while len(self._known_hashes) > self.known_hashes_size:
+            self._known_hashes.popitem(last=False)
+
+    def _drop_near_duplicates(self, batch):
+        """
+        Scarta i fatti troppo simili a ricordi già salvati (una sola query per tutto il batch)
+        o a un fatto precedente dello stesso batch.
+        """
+        if self.dedup_distance <= 0:
+            return batch
+        kept = batch
+        if self.collection.count() > 0:
+            try:
+                if self.embedder is not None:
+                    results = self.collection.query(query_embeddings=[p['embedding'] for p in batch], n_results=1)
+                else:
+                    results = self.collection.query(query_texts=[p['document'] for p in batch], n_results=1)
+            except Exception:
+                results = {}
+
+            kept = []
+            for item, distances in zip(batch, results.get('distances') or [[] for _ in batch]):
+                if distances and distances[0] < self.dedup_distance:
+                    print(f"⏭️  [DB] Quasi-duplicato ignorato (dist {distances[0]:.3f})")
+                    continue
+                kept.append(item)
+        return self._drop_similar_in_batch(kept)
+
+    def _drop_similar_in_batch(self, batch):
+        """Quasi-duplicati dentro il batch: distanza l2 quadrata (come Chroma) tra gli embedding locali"""
+        if self.embedder is None or len(batch) < 2:
+            return batch  # Embedding calcolati da Chroma: non disponibili prima della add()
+        vectors = np.asarray([p['embedding'] for p in batch], dtype=np.float32)
+        sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+        distances = np.maximum(sq_norms[:, None] + sq_norms[None, :] - 2.0 * (vectors @ vectors.T), 0.0)
+        kept = []
+        for i in range(len(batch)):
+            if kept and distances[i, kept].min() < self.dedup_distance:
+                print(f"⏭️  [DB] Quasi-duplicato nel batch ignorato (dist {distances[i, kept].min():.3f})")
+                continue
+            kept.append(i)
+        return [batch[i] for i in kept]
+
+    def flush(self):
+        """Scrive su Chroma tutti i fatti in coda con una sola chiamata add()"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            batch, self._pending = self._pending, []
+        batch = self._drop_known(batch)
+        if not batch:
+            return 0
+
+        try:
+            if self.embedder is not None:
+                vectors = self.embedder.embed([p['document'] for p in batch])
+                for item, vector in zip(batch, vectors):
+                    item['embedding'] = vector
+        except Exception as e:
+            print(f"⚠️ [EMBED] Embedding locale fallito, uso quello di Chroma: {e}")
+            self.embedder = None
+
+        batch = self._drop_near_duplicates(batch)
+        if not batch:
+            return 0
+
+        try:
+            add_kwargs = {}
+            if self.embedder is not None:
+                add_kwargs['embeddings'] = [p['embedding'] for p in batch]
+            self.collection.add(
+                documents=[p['document'] for p in batch],
+                metadatas=[p['metadata'] for p in batch],
+                ids=[p['id'] for p in batch],
+                **add_kwargs
+            )
+        except Exception as e:
+            print(f"⚠️ [DB] Flush fallito, {len(batch)} fatti rimessi in coda: {e}")
+            with self._lock:
+                self._pending = batch + self._pending
+            return 0
+
+        with self._lock:
+            self._remember_hashes(p['metadata']['fact_hash'] for p in batch)
+        self.invalidate_search_cache()
+        print(f"💾 [DB] {len(batch)} ricordi cristallizzati in blocco.")
+        return len(batch)
+
+    def close(self):
+        """Scrive i fatti in coda e sgancia l'istanza dall'atexit (engine, bench e test)"""
+        flushed = self.flush()
+        atexit.unregister(self._exit_flush)
+        return flushed
+
+    def invalidate_search_cache(self):
+        with self._search_lock:
+            if self._search_cache:
+                self.search_stats["invalidations"] += 1
+            self._search_cache.clear()
+
+    def _cached_search(self, key, query_vector):
+        """Risultato in cache per la stessa query normalizzata o per una domanda molto simile"""
+        with self._search_lock:
+            if key in self._search_cache:
+                self._search_cache.move_to_end(key)
+                self.search_stats["hits"] += 1
+                return self._search_cache[key][1]
+
+            if query_vector is not None and self._search_cache:
+                candidates = [(k, v) for k, v in self._search_cache.items()
+                              if k[1:] == key[1:] and v[0] is not None]
+                if candidates:
+                    matrix = np.asarray([v[0] for _, v in candidates], dtype=np.float32)
+                    sims = matrix @ np.asarray(query_vector, dtype=np.float32)
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.search_cache_similarity:
+                        self.search_stats["similar_hits"] += 1
+                        return candidates[best][1][1]
+
+            self.search_stats["misses"] += 1
+            return None
+
+    def _store_search(self, key, query_vector, result):
+        with self._search_lock:
+            self._search_cache[key] = (query_vector, result)
+            self._search_cache.move_to_end(key)
+            while len(self._search_cache) > self.search_cache_size:
+                self._search_cache.popitem(last=False)
 
     def search(self, query, n_results=5, threshold=1.4):
         """
         Recupera ricordi filtrando quelli poco pertinenti (Threshold).
         """
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=n_results
-            )
+            key = (normalize_text(query), n_results, threshold)
+            query_vector = self.embedder.embed_one(query) if self.embedder is not None else None
+            cached = self._cached_search(key, query_vector)
+            if cached is not None:
+                return cached
+
+            if query_vector is not None:
+                results = self.collection.query(
+                    query_embeddings=[query_vector],
+                    n_results=n_results
+                )
+            else:
+                results = self.collection.query(
+                    query_texts=[query],
+                    n_results=n_results
+                )
             
             if not results['documents'] or not results['documents'][0]:
+                self._store_search(key, query_vector, "Nessun dato storico rilevante.")
                 return "Nessun dato storico rilevante."
 
             context_string = ""
@@ -66,8 +355,9 @@ class VectorMemory:
                 context_string += f"--- [MEMORIA DEL {date_str}] ---\n{doc}\n\n"
             
             if valid_memories == 0:
-                return "Nessun dato storico pertinente (Filtro Qualità)."
+                context_string = "Nessun dato storico pertinente (Filtro Qualità)."
                 
+            self._store_search(key, query_vector, context_string)
             return context_string
 
         except Exception as e:
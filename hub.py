@@ -4,8 +4,13 @@ import os
 import sys
 import re
 import time
-import glob
 import codecs
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from core.code_analysis import extract_public_signatures, ContextPacker
+from core.dependency_resolver import resolve_requirements, VALID_DISTRIBUTION
+from core.session_store import SessionStore
 
 # --- CHECK DIPENDENZE GRAFICHE ---
 try:
@@ -15,6 +20,7 @@ try:
     from rich.syntax import Syntax
     from rich.table import Table
     from rich.progress import Progress, SpinnerColumn, TextColumn
+    from rich.live import Live
     from rich.prompt import Prompt, Confirm
     from rich.theme import Theme
 except ImportError:
@@ -35,9 +41,24 @@ console = Console(theme=custom_theme)
 
 # --- CONFIGURAZIONE SISTEMA ---
 API_URL = "http://localhost:8001/chat/god-mode"
+STREAM_API_URL = f"{API_URL}/stream"
+TOOLS_API_URL = "http://localhost:8001/tools"
+ENV_API_URL = "http://localhost:8001/env/setup"
 BASE_DIR = "projects"
 MEMORY_DIR = "memories"
 MAX_HISTORY_LENGTH = 30
+# File generati in parallelo nella fase di costruzione (allineare agli slot paralleli del backend LLM)
+FACTORY_WORKERS = int(os.getenv("FACTORY_WORKERS", "3"))
+# Context budget (token stimati) per il prompt di review
+CRITIC_TOKEN_BUDGET = int(os.getenv("CRITIC_TOKEN_BUDGET", "2500"))
+# Runtime: un servizio vivo e senza traceback per N secondi è considerato stabile (niente attesa del timeout)
+RUN_HEALTHY_AFTER = float(os.getenv("RUN_HEALTHY_AFTER", "10"))
+# Engine sovraccarico (429): tentativi e attesa massima rispettando Retry-After
+AI_RETRY_ATTEMPTS = int(os.getenv("AI_RETRY_ATTEMPTS", "5"))
+AI_RETRY_MAX_WAIT = float(os.getenv("AI_RETRY_MAX_WAIT", "60"))
+# Setup del venv lato engine (pool core/env_manager.py): venv + pip install possono richiedere minuti
+ENV_SETUP_TIMEOUT = float(os.getenv("ENV_SETUP_TIMEOUT", "1900"))
+session_store = SessionStore(directory=MEMORY_DIR)
 
 # ==============================================================================
 # 1. CORE UTILITIES
@@ -52,39 +73,114 @@ def print_header(title, subtitle=""):
         padding=(1, 2)
     ))
 
-def call_ai(message, history=[], system_context="", mode="general", silent=False):
+def iter_sse_events(resp):
+    """Decodifica gli eventi SSE (delta / tool / done) dell'endpoint streaming"""
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        try:
+            yield json.loads(line[5:].strip())
+        except json.JSONDecodeError:
+            continue
+
+def stream_ai(payload, title="Nexus"):
+    """
+    Mostra i token in un pannello live man mano che arrivano; ritorna la risposta finale.
+    Un evento "tool" chiude un round intermedio: il testo ritornato (salvato nella history) riparte da lì,
+    come la risposta di /chat/god-mode; i marker dei tool compaiono solo nel pannello.
+    """
+    text = shown = ""
+    try:
+        with post_ai(payload, url=STREAM_API_URL, stream=True) as resp:
+            resp.raise_for_status()
+            with Live(Panel("[ai]...[/ai]", title=title, border_style="purple"), console=console, refresh_per_second=8) as live:
+                for event in iter_sse_events(resp):
+                    if "delta" in event:
+                        text += event["delta"]
+                        shown += event["delta"]
+                    elif "tool" in event:
+                        text = ""
+                        shown += f"\n\n`⚙️ {event['tool']}`\n\n"
+                    else:
+                        continue
+                    live.update(Panel(Markdown(shown), title=title, border_style="purple"))
+    except Exception as e: return f"ERRORE API: {e}"
+    return text.strip()
+
+def post_ai(payload, timeout=300, url=API_URL, stream=False):
+    """POST all'engine (anche SSE con stream=True); sui 429 (coda piena) aspetta Retry-After e riprova"""
+    options = {"stream": True} if stream else {}
+    for attempt in range(AI_RETRY_ATTEMPTS):
+        resp = requests.post(url, json=payload, timeout=timeout, **options)
+        if resp.status_code != 429 or attempt == AI_RETRY_ATTEMPTS - 1:
+            return resp
+        try:
+            wait = float(resp.headers.get("Retry-After", "1"))
+        except ValueError:
+            wait = 1.0
+        resp.close()  # Libera la connessione prima di riprovare
+        time.sleep(min(max(wait, 0.1), AI_RETRY_MAX_WAIT))
+    return resp
+
+def call_ai(message, history=[], system_context="", mode="general", silent=False, stream=False, session_id=None):
+    """session_id: history tenuta dall'engine (history serve solo a inizializzare una sessione vuota)"""
     full_prompt = f"{system_context}\n\nUTENTE: {message}" if system_context else message
     payload = {
         "message": full_prompt, 
         "history": history,
         "mode": mode 
     }
+    if session_id:
+        payload["session_id"] = session_id
+    
+    if stream and not silent:
+        return stream_ai(payload)
     
     if not silent:
         with console.status("[ai]Elaborazione neurale in corso...", spinner="dots"):
             try:
-                resp = requests.post(API_URL, json=payload, timeout=300)
+                resp = post_ai(payload)
                 text = resp.json().get("response", "")
                 return text
             except Exception as e: return f"ERRORE API: {e}"
     else:
         try:
-            resp = requests.post(API_URL, json=payload, timeout=300)
+            resp = post_ai(payload)
             return resp.json().get("response", "")
         except Exception as e: return f"ERRORE API: {e}"
 
+def run_tool_direct(tool_name, query="", args=None, timeout=120):
+    """
+    Deterministic factory steps: run an engine tool directly, no LLM round trip.
+    Returns {ok, exit_code, stdout, stderr, duration, error}.
+    """
+    try:
+        resp = requests.post(f"{TOOLS_API_URL}/{tool_name}", json={"query": query, "args": args}, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+    except Exception as e:
+        return {"tool": tool_name, "ok": False, "exit_code": None, "stdout": "", "stderr": "",
+                "duration": 0.0, "error": f"ERRORE API: {e}"}
+
+def setup_env_direct(p_name):
+    """
+    Venv del runtime preparato dall'engine, dove terminal_run lo esegue (stesso interprete).
+    Returns {ok, python, duration, error}; python è relativo a BASE_DIR.
+    """
+    try:
+        resp = requests.post(ENV_API_URL, json={"project": p_name}, timeout=ENV_SETUP_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json()
+    except Exception as e:
+        return {"ok": False, "python": None, "duration": 0.0, "error": f"ERRORE API: {e}"}
+
 def load_session(name):
-    path = os.path.join(MEMORY_DIR, f"{name}.json")
-    if os.path.exists(path):
-        with open(path, 'r') as f: return json.load(f)
-    return []
-
-def save_session(name, history):
-    if not os.path.exists(MEMORY_DIR): os.makedirs(MEMORY_DIR)
-    if len(history) > MAX_HISTORY_LENGTH:
-        history = history[-MAX_HISTORY_LENGTH:]
-    path = os.path.join(MEMORY_DIR, f"{name}.json")
-    with open(path, 'w') as f: json.dump(history, f, indent=2)
+    """Ultimi MAX_HISTORY_LENGTH messaggi (lettura dalla coda del log)"""
+    return session_store.tail(name, MAX_HISTORY_LENGTH)
+
+def append_session(name, *messages):
+    """Append O(1) dei nuovi messaggi; i vecchi finiscono in archivio, mai cancellati"""
+    session_store.append(name, *messages)
 
 def extract_code_block(text):
     """
@@ -248,18 +344,111 @@ def infer_files_from_goal(project_name, goal):
     console.print(f"[info]💡 Template inferito da keywords: {', '.join(base)}[/info]")
     return list(set(base))
 
+# Moduli "base" che di solito vengono importati dagli altri (generati per primi)
+CONFIG_MODULES = ["config", "settings", "constants"]
+FOUNDATION_MODULES = CONFIG_MODULES + ["utils", "helpers", "models", "database", "db"]
+
+def infer_dependencies(files):
+    """
+    Name-based dependency guess for blueprint files.
+    - main.py imports every other module
+    - config/settings/constants come first, then the other foundation modules
+      (utils, models, database...), then everything else
+    Returns {file: [deps]} for .py files only.
+    """
+    py_files = [f for f in files if f.endswith(".py")]
+    stems = {f: os.path.splitext(os.path.basename(f))[0] for f in py_files}
+    configs = [f for f in py_files if stems[f] in CONFIG_MODULES]
+    foundations = [f for f in py_files if stems[f] in FOUNDATION_MODULES]
+    
+    graph = {}
+    for f in py_files:
+        if stems[f] == "main":
+            graph[f] = [d for d in py_files if d != f]
+        elif f in configs:
+            graph[f] = []
+        elif f in foundations:
+            graph[f] = list(configs)
+        else:
+            graph[f] = list(foundations)
+    return graph
+
+def parse_dependency_graph(text, files):
+    """Extract an LLM-proposed {file: [deps]} JSON object, keeping only known .py files"""
+    clean = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
+    clean = clean.replace("```json", "").replace("```", "")
+    match = re.search(r'\{.*\}', clean, re.DOTALL)
+    if not match:
+        return None
+    try:
+        raw = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(raw, dict):
+        return None
+    
+    known = {f for f in files if f.endswith(".py")}
+    graph = {}
+    for f, deps in raw.items():
+        if f in known and isinstance(deps, list):
+            graph[f] = [d for d in deps if d in known and d != f]
+    return graph or None
+
+def topological_waves(graph):
+    """
+    Kahn's algorithm by levels: each wave only depends on earlier waves.
+    Cycles are broken by putting the remaining files in one final wave.
+    """
+    nodes = set(graph) | {d for deps in graph.values() for d in deps}
+    remaining = {n: set(graph.get(n, [])) & nodes for n in nodes}
+    waves = []
+    while remaining:
+        ready = sorted(n for n, deps in remaining.items() if not deps)
+        if not ready:
+            ready = sorted(remaining)  # Ciclo: nessun ordine possibile, generali insieme
+        waves.append(ready)
+        for n in ready:
+            del remaining[n]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return waves
+
+def plan_build_graph(files, goal):
+    """
+    Lightweight planning pass: ask the LLM for the import graph, fall back to
+    name heuristics for anything it leaves out.
+    """
+    prompt = f"""
+    SEI UN ARCHITETTO SOFTWARE. OBIETTIVO: {goal}
+    FILE DEL PROGETTO: {json.dumps([f for f in files if f.endswith(".py")])}
+    
+    TASK: Per ogni file indica quali altri file del progetto importa.
+    DOPO </think>, scrivi SOLO un oggetto JSON, esempio:
+    {{"main.py": ["scraper.py", "database.py"], "scraper.py": ["config.py"], "config.py": []}}
+    """
+    graph = infer_dependencies(files)
+    proposed = parse_dependency_graph(call_ai(prompt, mode="factory", silent=True), files)
+    if proposed:
+        graph.update(proposed)
+        console.print("[info]🧭 Grafo delle dipendenze proposto dall'architetto.[/info]")
+    else:
+        console.print("[info]🧭 Grafo delle dipendenze inferito dai nomi dei file.[/info]")
+    return graph
+
 def ensure_project_dir(project_name):
     path = os.path.join(BASE_DIR, project_name)
     if not os.path.exists(path): os.makedirs(path)
     return path
 
 def save_build_state(project_path, state):
-    """Save build progress for crash recovery"""
+    """Save build progress for crash recovery (atomic: temp file -> rename)"""
     state_file = os.path.join(project_path, ".build_state.json")
     state['timestamp'] = time.time()
+    temp_file = state_file + ".tmp"
     
-    with open(state_file, "w") as f:
+    with open(temp_file, "w") as f:
         json.dump(state, f, indent=2)
+    os.replace(temp_file, state_file)
 
 def load_build_state(project_path):
     """Load previous build state if exists"""
@@ -389,12 +578,13 @@ def sh_phase_blueprint(p_name, initial_goal):
             
             return fallback_files
 
-def generate_file_with_retry(filename, goal, research_context, history, max_attempts=3):
+def generate_file_with_retry(filename, goal, research_context, history, max_attempts=3, interface_context=""):
     """
     Generate file with intelligent retry logic.
     - Attempt 1: Standard prompt
     - Attempt 2: More explicit prompt with failure explanation
     - Attempt 3: Simplified version (MVP approach)
+    interface_context: public signatures of already-generated dependencies, included in every attempt.
     """
     docker_constraints = """
     VINCOLI DOCKER (LINUX HEADLESS):
@@ -411,6 +601,7 @@ def generate_file_with_retry(filename, goal, research_context, history, max_atte
             TASK: Scrivi codice completo per '{filename}'.
             CONTESTO PROGETTO: {goal}
             {docker_constraints}
+            {interface_context}
             {research_context}
             
             ISTRUZIONI DEEPSEEK-R1:
@@ -429,6 +620,7 @@ def generate_file_with_retry(filename, goal, research_context, history, max_atte
             
             TASK: Scrivi codice VALIDO per '{filename}'.
             CONTESTO: {goal}
+            {interface_context}
             
             REGOLE CRITICHE:
             1. USA <think> tags per ragionare
@@ -457,6 +649,7 @@ def generate_file_with_retry(filename, goal, research_context, history, max_atte
             
             Genera versione MINIMA FUNZIONANTE di '{filename}'.
             Obiettivo: {goal}
+            {interface_context}
             
             FORMATO OBBLIGATORIO:
             <think>Logica minima necessaria</think>
@@ -489,17 +682,68 @@ def generate_file_with_retry(filename, goal, research_context, history, max_atte
     
     return None, max_attempts  # All attempts failed
 
-def sh_phase_construction(project_path, files, goal, existing_state=None):
+def build_interface_context(project_path, deps):
+    """Public signatures of already-generated dependencies, formatted as prompt context"""
+    blocks = []
+    for dep in deps:
+        dep_path = os.path.join(project_path, os.path.basename(dep))
+        if not dep.endswith(".py") or not os.path.exists(dep_path):
+            continue
+        with open(dep_path, "r") as f:
+            signatures = extract_public_signatures(f.read())
+        if signatures:
+            module = os.path.splitext(os.path.basename(dep))[0]
+            blocks.append(f"# {dep} (import {module})\n{signatures}")
+    if not blocks:
+        return ""
+    return "INTERFACCE GIÀ GENERATE (importa e usa ESATTAMENTE questi nomi):\n" + "\n\n".join(blocks)
+
+def build_file(filename, goal, history, history_lock, progress=None, task_id=None, interface_context=""):
+    """
+    Research + generation for a single blueprint file (runs inside a worker thread).
+    Returns (code, attempts).
+    """
+    clean_filename = os.path.basename(filename)
+    with history_lock:
+        context_history = list(history)
+    
+    # Research context
+    research_context = ""
+    if filename.endswith(".py"):
+        if progress is not None:
+            progress.update(task_id, description=f"[cyan]🔎 {clean_filename}: ricerca...")
+        search_query = f"python code example for {goal} related to {clean_filename} modern libraries headless"
+        res = run_tool_direct("web_search", search_query)
+        if res.get("ok") and len(res.get("stdout", "")) > 100:
+            research_context = f"DATI RICERCA:\n{res['stdout'][:2000]}\n"
+    
+    # Generate with retry
+    if progress is not None:
+        progress.update(task_id, description=f"[cyan]🛠️ {clean_filename}: generazione...")
+    code, attempts = generate_file_with_retry(clean_filename, goal, research_context, context_history,
+                                              interface_context=interface_context)
+    
+    if code:
+        with history_lock:
+            history.append({"role": "user", "content": f"Codice per {clean_filename} completato."})
+            history.append({"role": "assistant", "content": "Confermato."})
+    
+    return code, attempts
+
+def sh_phase_construction(project_path, files, goal, existing_state=None, workers=FACTORY_WORKERS, dependency_graph=None):
     console.print(Panel("[bold blue]FASE 2: RICERCA & SVILUPPO[/bold blue]", border_style="blue"))
     history = []
+    history_lock = threading.Lock()
+    graph = dependency_graph or infer_dependencies(files)
     
     # Track completed files for state persistence
     completed_files = set(existing_state.get('completed_files', [])) if existing_state else set()
     failed_files = []
     
     with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), console=console) as progress:
-        main_task = progress.add_task("[cyan]Costruzione in corso...", total=len(files))
+        main_task = progress.add_task(f"[cyan]Costruzione in corso ({workers} worker)...", total=len(files))
         
+        pending = []
         for filename in files:
             if filename == "requirements.txt": 
                 progress.advance(main_task)
@@ -513,42 +757,56 @@ def sh_phase_construction(project_path, files, goal, existing_state=None):
                 progress.advance(main_task)
                 continue
             
-            progress.update(main_task, description=f"[cyan]Lavorazione {clean_filename}...")
-            real_path = os.path.join(project_path, clean_filename)
-            
-            # Research context
-            research_context = ""
-            if filename.endswith(".py"):
-                search_query = f"python code example for {goal} related to {clean_filename} modern libraries headless"
-                res = call_ai(f"USE [web_search] for: {search_query}", history, mode="factory", silent=True)
-                if len(res) > 100 and "Traceback" not in res:
-                    research_context = f"DATI RICERCA:\n{res[:2000]}\n"
-            
-            # Generate with retry
-            code, attempts = generate_file_with_retry(clean_filename, goal, research_context, history)
-            
-            if code:
-                with open(real_path, "w") as f:
-                    f.write(code)
-                console.print(f"[success]✅ {clean_filename} creato ({len(code)} bytes, {attempts} tentativi)[/success]")
-                completed_files.add(clean_filename)
-                
-                # Save state checkpoint after each successful file
-                save_build_state(project_path, {
-                    'phase': 'construction_in_progress',
-                    'blueprint': files,
-                    'completed_files': list(completed_files),
-                    'goal': goal
-                })
+            pending.append(filename)
+        
+        # Dependencies first: each wave only imports files from earlier waves
+        waves = topological_waves({f: [d for d in graph.get(f, []) if d in pending] for f in pending})
+        task_ids = {}
+        for wave_index, wave in enumerate(waves, 1):
+            for filename in wave:
+                task_ids[filename] = progress.add_task(f"[dim]⏳ {os.path.basename(filename)}: in coda (wave {wave_index})[/dim]", total=1)
+        
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for wave in waves:
+                futures = {}
+                for filename in wave:
+                    interface_context = build_interface_context(project_path, graph.get(filename, []))
+                    future = pool.submit(build_file, filename, goal, history, history_lock, progress,
+                                         task_ids[filename], interface_context)
+                    futures[future] = (os.path.basename(filename), task_ids[filename])
                 
-                history.append({"role": "user", "content": f"Codice per {clean_filename} completato."})
-                history.append({"role": "assistant", "content": "Confermato."})
-            else:
-                console.print(f"[error]❌ Impossibile generare {clean_filename} dopo {attempts} tentativi[/error]")
-                failed_files.append(clean_filename)
-                # Don't abort - continue with other files
-            
-            progress.advance(main_task)
+                # Results are handled here, in the main thread only: a single writer for
+                # project files and .build_state.json checkpoints.
+                for future in as_completed(futures):
+                    clean_filename, task_id = futures[future]
+                    try:
+                        code, attempts = future.result()
+                    except Exception as e:
+                        console.print(f"[error]❌ Errore durante la generazione di {clean_filename}: {e}[/error]")
+                        code, attempts = None, 0
+                    
+                    if code:
+                        real_path = os.path.join(project_path, clean_filename)
+                        with open(real_path, "w") as f:
+                            f.write(code)
+                        progress.update(task_id, completed=1, description=f"[green]✅ {clean_filename} ({len(code)} bytes, {attempts} tentativi)[/green]")
+                        completed_files.add(clean_filename)
+                        
+                        # Save state checkpoint after each successful file
+                        save_build_state(project_path, {
+                            'phase': 'construction_in_progress',
+                            'blueprint': files,
+                            'completed_files': list(completed_files),
+                            'goal': goal,
+                            'dependency_graph': graph
+                        })
+                    else:
+                        progress.update(task_id, completed=1, description=f"[red]❌ {clean_filename} ({attempts} tentativi)[/red]")
+                        console.print(f"[error]❌ Impossibile generare {clean_filename} dopo {attempts} tentativi[/error]")
+                        failed_files.append(clean_filename)
+                        # Don't abort - continue with other files
+                    
+                    progress.advance(main_task)
     
     # Report summary
     if failed_files:
@@ -600,31 +858,45 @@ def validate_requirements(requirements_text):
     
     return (len(warnings) == 0, warnings, '\n'.join(fixed_lines))
 
+def resolve_unknown_distributions(modules):
+    """
+    LLM fallback for import names missing from the bundled table.
+    Returns pip distribution names; unanswered modules keep their import name.
+    """
+    prompt = f"""
+    SEI UN SISTEMISTA PYTHON. Per ciascun modulo importato indica il nome del pacchetto su PyPI.
+    MODULI: {json.dumps(modules)}
+    
+    DOPO </think>, scrivi SOLO un oggetto JSON, esempio: {{"bs4": "beautifulsoup4", "cv2": "opencv-python"}}
+    """
+    answer = {}
+    resp = re.sub(r'<think>.*?</think>', '', call_ai(prompt, mode="factory", silent=True), flags=re.DOTALL)
+    match = re.search(r'\{.*\}', resp.replace("```json", "").replace("```", ""), re.DOTALL)
+    if match:
+        try:
+            answer = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            answer = {}
+    
+    distributions = []
+    for module in modules:
+        dist = answer.get(module) if isinstance(answer, dict) else None
+        if not isinstance(dist, str) or not VALID_DISTRIBUTION.match(dist.strip()):
+            console.print(f"[warning]⚠️ Pacchetto per '{module}' non risolto, uso il nome del modulo.[/warning]")
+            dist = module
+        distributions.append(dist.strip())
+    return distributions
+
 def sh_phase_integrator(project_path):
     console.print(Panel("[bold yellow]FASE 3: SYSTEM INTEGRATION[/bold yellow]", border_style="yellow"))
     
     with console.status("Analisi dipendenze incrociate...", spinner="bouncingBar"):
-        py_files = glob.glob(os.path.join(project_path, "*.py"))
-        all_code = ""
-        for fpath in py_files:
-            with open(fpath, "r") as f: 
-                all_code += f"\n--- {os.path.basename(fpath)} ---\n" + f.read()
-        
-        prompt = f"""
-        SEI UN SISTEMISTA. Analizza il codice e genera requirements.txt.
-        
-        CODICE:
-        {all_code[:6000]}
-        
-        ISTRUZIONI:
-        1. Identifica TUTTE le librerie importate
-        2. Genera requirements.txt con versioni compatibili
-        3. DOPO </think>, scrivi SOLO il contenuto del file (no markdown)
-        """
-        resp = call_ai(prompt, mode="factory", silent=True)
-        
-        req = extract_code_block(resp) or resp.replace("```", "").strip()
-        req = re.sub(r'<think>.*?</think>', '', req, flags=re.DOTALL).strip()
+        # Import letti con ast e mappati sui pacchetti pip: l'LLM solo per i nomi sconosciuti
+        distributions, unresolved = resolve_requirements(project_path)
+        if unresolved:
+            console.print(f"[info]🔎 Moduli non in tabella, chiedo all'LLM: {', '.join(unresolved)}[/info]")
+            distributions += resolve_unknown_distributions(unresolved)
+        req = "\n".join(sorted(set(distributions), key=str.lower))
         
         # Validate dependencies
         is_valid, warnings, fixed_req = validate_requirements(req)
@@ -650,11 +922,15 @@ def sh_phase_critic(project_path):
     console.print(Panel("[bold magenta]FASE 4: HOLISTIC CODE REVIEW[/bold magenta]", border_style="magenta"))
     
     with console.status("Scannerizzazione coerenza globale...", spinner="shark"):
-        py_files = glob.glob(os.path.join(project_path, "*.py"))
-        content = ""
-        for f in py_files:
-            with open(f, "r") as r: 
-                content += f"\n=== {os.path.basename(f)} ===\n" + r.read()
+        # Riassunto di ogni file + codice completo solo dei file cambiati dall'ultima review
+        packer = ContextPacker(project_path)
+        entries = packer.scan()
+        changed = packer.changed_since_review(entries)
+        if not changed:
+            console.print("[success]✅ Tutti i file già revisionati.[/success]")
+            return
+        # pack() garantisce almeno un file completo, anche se da solo supera il budget
+        content, full_files = packer.pack(entries, CRITIC_TOKEN_BUDGET, full_body=changed)
 
         prompt = f"""
         REVIEWER OLISTICO. Controlla consistenza del codice:
@@ -662,15 +938,24 @@ def sh_phase_critic(project_path):
         - Import corretti?
         - Logica coerente?
         
+        Ogni file è riassunto (imports, firme pubbliche, calls verso altri moduli);
+        i file marcati "codice completo" sono quelli modificati dall'ultima review.
+        
         CODICE: 
-        {content[:8000]}
+        {content}
+        
+        FILE RISCRIVIBILI (solo quelli di cui vedi il codice completo): {", ".join(full_files)}
         
         Rispondi:
         - "OK" se tutto è coerente
-        - Altrimenti, per ogni file da correggere: "FILE: nome.py" seguito da ```python codice corretto ```
+        - Altrimenti, per ogni file RISCRIVIBILE da correggere: "FILE: nome.py" seguito da ```python codice corretto ```
         """
         resp = call_ai(prompt, mode="factory", silent=True)
     
+    console.print(f"[info]📦 Contesto review: {len(entries)} file, {len(full_files)} completi, "
+                  f"{packer.stats['cached']} riassunti dalla cache.[/info]")
+    # Revisionati solo i file visti per intero: gli altri avranno il codice completo in un round successivo
+    packer.mark_reviewed([e for e in entries if e["name"] in full_files])
     resp = re.sub(r'<think>.*?</think>', '', resp, flags=re.DOTALL)
     
     if "OK" in resp and len(resp) < 100:
@@ -683,7 +968,9 @@ def sh_phase_critic(project_path):
             lines = patch.split('\n')
             fname = lines[0].strip()
             code = extract_code_block(patch)
-            if code and fname.endswith(".py"):
+            if code and fname.endswith(".py") and fname not in full_files:
+                console.print(f"[warning]⏭️ {fname} ignorato: il modello ne ha visto solo le firme.[/warning]")
+            elif code and fname.endswith(".py"):
                 with open(os.path.join(project_path, fname), "w") as f: 
                     f.write(code)
                 console.print(f"[warning]🔧 {fname} patchato per consistenza.[/warning]")
@@ -691,39 +978,57 @@ def sh_phase_critic(project_path):
 def sh_phase_runtime(project_path, p_name, goal):
     console.print(Panel("[bold red]FASE 5: RUNTIME & AUTO-HEALING[/bold red]", border_style="red"))
     
-    docker_p = os.path.join("projects", p_name)
     local_main = os.path.join(project_path, "main.py")
-    venv = os.path.join(docker_p, "venv")
     
+    # Venv dal pool condiviso dell'engine (stessi requirements = stesso venv), pip diretto senza LLM
     with console.status("Setup ambiente isolato...", spinner="earth"):
-        call_ai(f"TASK: Crea venv: python3 -m venv {venv}. Usa [TOOL: terminal_run, query: \"python3 -m venv {venv}\"]", mode="factory", silent=True)
-        if os.path.exists(os.path.join(project_path, "requirements.txt")):
-            call_ai(f"TASK: Install requirements in {venv}. Usa [TOOL: terminal_run, query: \"{venv}/bin/pip install -r {docker_p}/requirements.txt\"]", mode="factory", silent=True)
+        env = setup_env_direct(p_name)
+    if not env.get("ok"):
+        console.print(Panel(env.get("error") or "Errore sconosciuto", title="[red]❌ Setup ambiente fallito[/red]", border_style="red"))
+        return
 
-    cmd = f"{venv}/bin/python3 {docker_p}/main.py"
+    # terminal_run esegue da projects/: l'engine restituisce il path già relativo a BASE_DIR
+    cmd = f"{env['python']} {p_name}/main.py"
     
     for attempt in range(4):
         console.rule(f"[bold yellow]Test Run {attempt+1}/4[/bold yellow]")
         
-        with console.status("Esecuzione script...", spinner="runner"):
-            resp = call_ai(f"TASK: Esegui: {cmd}. Usa [TOOL: terminal_run, query: \"{cmd}\"]", mode="factory", silent=True)
+        with console.status(f"Esecuzione script (stabile dopo {RUN_HEALTHY_AFTER:.0f}s senza errori)...", spinner="runner"):
+            result = run_tool_direct("terminal_run", args={"command": cmd, "healthy_after": str(RUN_HEALTHY_AFTER)})
         
-        # 🔧 Pulisci formato tool dalla risposta prima di mostrare
-        display_resp = re.sub(r'\[TOOL:.*?\].*?(?=\n\n|\n[A-Z]|$)', '', resp, flags=re.DOTALL).strip()
-        if not display_resp or len(display_resp) < 10:
-            display_resp = resp
+        timed_out = result.get("outcome") == "timeout"
+        if result.get("exit_code") is None and not timed_out:
+            # Comando non eseguito (engine irraggiungibile, rifiutato, coda piena): riscrivere main.py non serve
+            console.print(Panel(result.get("error") or "Errore sconosciuto", title="[red]❌ Esecuzione non riuscita[/red]", border_style="red"))
+            return
         
-        panel_color = "green" if "Traceback" not in display_resp else "red"
+        output = (result.get("stdout", "") + result.get("stderr", "")).strip()
+        if timed_out:
+            # Né terminato né stabile (loop infinito, attesa di input, servizio bloccato): va al debugger con la coda dell'output
+            display_resp = (f"{output or '(nessun output)'}\n\n"
+                            f"NOTA: il processo è andato in timeout dopo {result.get('duration', 0):.0f}s ed è stato terminato.")
+        else:
+            display_resp = result.get("error") or output or "(nessun output)"
+        healthy = result.get("outcome") == "healthy"
+        crashed = timed_out or (not healthy and (result.get("exit_code") != 0 or "Traceback" in display_resp))
+        
+        panel_color = "red" if crashed else "green"
+        status = ("in esecuzione, nessun errore" if healthy else
+                  "timeout" if timed_out else f"exit {result.get('exit_code')}")
         console.print(Panel(display_resp[:500] + "..." if len(display_resp) > 500 else display_resp, 
-                           title="Output Terminale", border_style=panel_color))
+                           title=f"Output Terminale ({status}, {result.get('duration', 0):.1f}s)",
+                           border_style=panel_color))
         
-        if "Traceback" not in display_resp and "Error" not in display_resp:
-            console.print("[bold green]🚀 SUCCESSO! Il sistema è stabile.[/bold green]")
+        if not crashed:
+            if healthy:
+                console.print(f"[bold green]🚀 SUCCESSO! Il servizio gira da {RUN_HEALTHY_AFTER:.0f}s senza errori.[/bold green]")
+            else:
+                console.print("[bold green]🚀 SUCCESSO! Il sistema è stabile.[/bold green]")
             return
         
         console.print("[bold red]❌ Rilevato Crash. Applicazione protocollo medico...[/bold red]")
         with console.status("Applicazione Patch...", spinner="dots"):  # ✅ Fixed spinner
-            fix = call_ai(f"DEBUGGER. OBIETTIVO: {goal}. ERRORE: {display_resp}. RISCRIVI main.py completo.", mode="factory", silent=True)
+            fix = call_ai(f"DEBUGGER. OBIETTIVO: {goal}. ERRORE: {display_resp[-3000:]}. RISCRIVI main.py completo.", mode="factory", silent=True)
             code = extract_code_block(fix)
             if code:
                 with open(local_main, "w") as f: 
@@ -742,16 +1047,15 @@ def sh_phase_runtime(project_path, p_name, goal):
 
 def mode_general():
     print_header("QUANTUM GENERAL INTELLIGENCE", "DeepSeek-R1 Powered Analyst")
-    history = load_session("general_brain")
+    # History lato engine: la locale viene mandata solo al primo turno, per inizializzare la sessione
+    seed = load_session("general_brain")
     while True:
         u = Prompt.ask("[bold white]CEO[/bold white]")
         if u.lower() in ['exit', 'quit']: 
             break
-        resp = call_ai(u, history, mode="general")
-        console.print(Panel(Markdown(resp), title="Nexus", border_style="purple"))
-        history.append({"role": "user", "content": u})
-        history.append({"role": "assistant", "content": resp})
-        save_session("general_brain", history)
+        resp = call_ai(u, seed, mode="general", stream=True, session_id="general_brain")
+        seed = []
+        append_session("general_brain", {"role": "user", "content": u}, {"role": "assistant", "content": resp})
 
 def mode_factory():
     print_header("QUANTUM SOFTWARE FACTORY V5.2", "DeepSeek-R1 Optimized | Architect -> Build -> Integrate -> Critic -> Run")
@@ -764,6 +1068,7 @@ def mode_factory():
     # Check for existing build
     existing_state = load_build_state(path)
     files = None
+    dependency_graph = None
     
     if existing_state:
         console.print(Panel(
@@ -779,6 +1084,7 @@ def mode_factory():
             files = existing_state.get('blueprint', [])
             completed = set(existing_state.get('completed_files', []))
             goal = existing_state.get('goal', goal)
+            dependency_graph = existing_state.get('dependency_graph')
             
             console.print(f"[info]🔄 Resuming build... {len(completed)}/{len(files)} file già completati[/info]")
         else:
@@ -794,21 +1100,24 @@ def mode_factory():
         
         # Save initial state
         if files:
+            dependency_graph = plan_build_graph(files, goal)
             save_build_state(path, {
                 'phase': 'blueprint_complete',
                 'blueprint': files,
                 'completed_files': [],
-                'goal': goal
+                'goal': goal,
+                'dependency_graph': dependency_graph
             })
     
     if files:
-        if sh_phase_construction(path, files, goal, existing_state):
+        if sh_phase_construction(path, files, goal, existing_state, dependency_graph=dependency_graph):
             # Save state after construction
             save_build_state(path, {
                 'phase': 'construction_complete',
                 'blueprint': files,
                 'completed_files': files,
-                'goal': goal
+                'goal': goal,
+                'dependency_graph': dependency_graph
             })
             
             sh_phase_integrator(path)
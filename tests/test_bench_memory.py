@@ -0,0 +1,58 @@
+import pytest
+import os
+import sys
+import json
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks import bench_memory
+
+
+class TestMemoryBenchmark:
+    """Smoke test del benchmark memoria (backend numpy, dataset minimo)"""
+
+    def test_report_is_machine_readable(self, tmp_path):
+        output = tmp_path / "bench.json"
+        code = bench_memory.main(["--sizes", "30", "--backends", "numpy", "--queries", "5",
+                                  "--flush-size", "8", "--output", str(output)])
+        assert code == 0
+
+        report = json.loads(output.read_text())
+        ops = {r["op"] for r in report["results"]}
+        assert {"save", "flush", "write_total", "search", "search_cached"} <= ops
+        search = next(r for r in report["results"] if r["op"] == "search")
+        assert search["p50_ms"] <= search["p95_ms"] <= search["p99_ms"]
+        assert report["meta"]["embedder"] == "hashing"
+
+    def test_flush_size_one(self, tmp_path):
+        """Test that a run where every save flushes reports an empty save row instead of crashing"""
+        output = tmp_path / "bench.json"
+        assert bench_memory.main(["--sizes", "10", "--backends", "numpy", "--queries", "3",
+                                  "--flush-size", "1", "--output", str(output)]) == 0
+        rows = {r["op"]: r for r in json.loads(output.read_text())["results"]}
+        assert rows["save"]["n"] == 0 and "p95_ms" not in rows["save"]
+        assert rows["write_total"]["stored"] == 10
+
+    def test_chroma_collections_removed(self, tmp_path):
+        """Test that each size starts from an empty ephemeral client and bench_* collections are dropped"""
+        chromadb = pytest.importorskip("chromadb")
+        output = tmp_path / "bench.json"
+        assert bench_memory.main(["--sizes", "6,6", "--backends", "ephemeral", "--queries", "3",
+                                  "--flush-size", "4", "--output", str(output)]) == 0
+        report = json.loads(output.read_text())
+        assert report["skipped"] == []
+        assert [r["stored"] for r in report["results"] if r["op"] == "write_total"] == [6, 6]
+        assert not [c for c in chromadb.EphemeralClient().list_collections() if c.name.startswith("bench_")]
+
+    def test_baseline_regression_detected(self, tmp_path):
+        results = [{"backend": "numpy", "size": 10, "op": "search", "p95_ms": 2.0}]
+        baseline = tmp_path / "old.json"
+        baseline.write_text(json.dumps({"results": [{"backend": "numpy", "size": 10, "op": "search", "p95_ms": 1.0}]}))
+        regressions = bench_memory.compare_with_baseline(results, str(baseline), max_regression=25)
+        assert len(regressions) == 1
+        assert results[0]["p95_change_pct"] == 100.0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,260 @@
+import pytest
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import shutil
+import threading
+from fastapi.testclient import TestClient
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import engine
+from core.chat_sessions import ChatSessions, InvalidSessionId
+
+
+class FakeRedis:
+    """Sottoinsieme di redis-py usato dal tier Redis (liste + pipeline)"""
+
+    def __init__(self):
+        self.lists = {}
+        self.values = {}
+
+    def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        return [i.encode("utf-8") for i in items[start:][:None if end == -1 else end + 1]]
+
+    def get(self, key):
+        value = self.values.get(key)
+        return value.encode("utf-8") if value is not None else None
+
+    def delete(self, *keys):
+        for key in keys:
+            self.lists.pop(key, None)
+            self.values.pop(key, None)
+
+    def pipeline(self):
+        redis = self
+        class Pipeline:
+            def __init__(self):
+                self.ops = []
+            def rpush(self, key, *values):
+                self.ops.append(lambda: redis.lists.setdefault(key, []).extend(values))
+            def ltrim(self, key, start, end):
+                self.ops.append(lambda: redis.lists.__setitem__(key, redis.lists[key][start:]))
+            def set(self, key, value, ex=None):
+                self.ops.append(lambda: redis.values.__setitem__(key, value))
+            def expire(self, key, ttl):
+                pass
+            def execute(self):
+                for op in self.ops:
+                    op()
+        return Pipeline()
+
+
+def turn(i):
+    return [{"role": "user", "content": f"domanda {i}"}, {"role": "assistant", "content": f"risposta {i}"}]
+
+
+class TestChatSessions:
+    """Test tier in RAM (LRU) + tier persistente"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def test_disk_tier_survives_restart_and_eviction(self):
+        sessions = ChatSessions(backend="disk", directory=self.temp_dir, max_sessions=1)
+        sessions.append("a", *turn(0))
+        sessions.append("b", *turn(1))  # "a" esce dalla RAM
+
+        assert sessions.stats["evictions"] == 1
+        assert sessions.get("a") == turn(0)
+        assert ChatSessions(backend="disk", directory=self.temp_dir).get("b") == turn(1)
+
+    def test_redis_tier(self):
+        fake = FakeRedis()
+        sessions = ChatSessions(backend="redis", redis_client=fake, max_messages=4)
+        for i in range(3):
+            sessions.append("s1", *turn(i))
+
+        assert sessions.backend == "redis"
+        reloaded = ChatSessions(backend="redis", redis_client=fake, max_messages=4).get("s1")
+        assert reloaded == sessions.get("s1")
+        assert reloaded[1:] == turn(2) and "domanda 0" in reloaded[0]["content"]
+
+    def test_trim_drops_old_half_at_once(self):
+        """Test che il prefisso resti stabile: si scarta metà history solo oltre il limite"""
+        sessions = ChatSessions(backend="memory", max_messages=8)
+        for i in range(4):
+            sessions.append("s", *turn(i))
+        assert len(sessions.get("s")) == 8
+        sessions.append("s", *turn(4))
+        history = sessions.get("s")
+        assert history[0]["role"] == "system" and history[1:] == turn(3) + turn(4)
+        sessions.append("s", *turn(5))
+        assert sessions.get("s")[:5] == history  # Stesso prefisso fino al prossimo taglio
+
+    def test_trimmed_facts_are_summarized(self):
+        """Test that dropped messages are folded into the head summary, also across trims and restarts"""
+        sessions = ChatSessions(backend="disk", directory=self.temp_dir, max_messages=4)
+        sessions.append("s", {"role": "user", "content": "il database è PostgreSQL 16"},
+                        {"role": "assistant", "content": "<think>annoto</think>Ok"})
+        folds = [sessions.append("s", *turn(i)) for i in range(1, 4)]
+
+        assert folds[0] is None and folds[1]["previous"] is None
+        assert [m["content"] for m in folds[1]["dropped"]] == ["il database è PostgreSQL 16", "Ok", "domanda 1", "risposta 1"]
+        assert "PostgreSQL 16" in folds[2]["previous"]  # Riassunto precedente incluso
+        history = sessions.get("s")
+        assert "PostgreSQL 16" in history[0]["content"] and history[1:] == turn(3)
+        assert ChatSessions(backend="disk", directory=self.temp_dir, max_messages=4).get("s") == history
+
+    def test_llm_summary_replaces_extract(self):
+        """Test that the LLM summary replaces the extractive one in RAM and on disk, unless trimmed again"""
+        sessions = ChatSessions(backend="disk", directory=self.temp_dir, max_messages=2)
+        sessions.append("s", *turn(0))
+        fold = sessions.append("s", *turn(1))
+        assert sessions.stats["folds"] == 1
+
+        assert sessions.replace_summary("s", fold, "- riassunto LLM")
+        assert sessions.get("s")[0]["content"].endswith("- riassunto LLM")
+        assert ChatSessions(backend="disk", directory=self.temp_dir, max_messages=2).get("s") == sessions.get("s")
+
+        stale = sessions.append("s", *turn(2))
+        sessions.append("s", *turn(3))
+        assert not sessions.replace_summary("s", stale, "- vecchio")
+        assert "vecchio" not in sessions.get("s")[0]["content"]
+
+    def test_summary_fallback_without_llm(self):
+        sessions = ChatSessions(backend="memory", max_messages=2)
+        sessions.append("s", {"role": "user", "content": "uso sempre Python 3.12"})
+        fold = sessions.append("s", *turn(1))
+        assert "Python 3.12" in sessions.get("s")[0]["content"]
+        assert not sessions.replace_summary("s", fold, None)
+        assert "Python 3.12" in sessions.get("s")[0]["content"]
+        assert sessions.stats["summary_fallbacks"] == 1
+
+    def test_invalid_session_id(self):
+        sessions = ChatSessions(backend="memory")
+        for bad in ["../etc", "", "a" * 65, "con spazi"]:
+            with pytest.raises(InvalidSessionId):
+                sessions.get(bad)
+
+    def test_delete(self):
+        sessions = ChatSessions(backend="disk", directory=self.temp_dir, max_messages=2)
+        sessions.append("a", *turn(0))
+        sessions.append("a", *turn(1))
+        sessions.delete("a")
+        assert ChatSessions(backend="disk", directory=self.temp_dir).get("a") == []
+        assert os.listdir(self.temp_dir) == []
+
+
+class TestEngineSessions:
+    """Test /chat/god-mode con session_id: il client manda solo il nuovo messaggio"""
+
+    def setup_method(self):
+        self.client = TestClient(engine.app)
+
+    def scripted(self, monkeypatch):
+        calls = []
+        async def call_llm(messages, temperature=0.3, mode="general", session_id=None):
+            calls.append([dict(m) for m in messages])
+            return f"<think>ragiono</think>risposta {len(calls)}"
+        monkeypatch.setattr(engine, "call_llm", call_llm)
+        monkeypatch.setattr(engine, "memory", None)
+        monkeypatch.setattr(engine, "chat_sessions", engine.ChatSessions(backend="memory"))
+        return calls
+
+    def test_server_keeps_history(self, monkeypatch):
+        calls = self.scripted(monkeypatch)
+        first = self.client.post("/chat/god-mode", json={"message": "ciao", "session_id": "s1"}).json()
+        self.client.post("/chat/god-mode", json={"message": "e poi?", "session_id": "s1"})
+
+        assert first["session_id"] == "s1"
+        assert calls[1][1:] == [
+            {"role": "user", "content": "ciao"},
+            {"role": "assistant", "content": "risposta 1"},
+            {"role": "user", "content": "e poi?"},
+        ]
+
+    def test_history_seeds_empty_session_once(self, monkeypatch):
+        calls = self.scripted(monkeypatch)
+        seed = turn(0)
+        self.client.post("/chat/god-mode", json={"message": "uno", "session_id": "s2", "history": seed})
+        self.client.post("/chat/god-mode", json={"message": "due", "session_id": "s2", "history": seed})
+
+        assert calls[1][1:3] == seed and calls[1].count(seed[0]) == 1
+
+    def test_stream_records_turn(self, monkeypatch):
+        self.scripted(monkeypatch)
+        async def stream_llm(messages, temperature=0.3, mode="general", session_id=None):
+            for delta in ["<think>x</think>", "Ciao ", "a te"]:
+                yield delta
+        monkeypatch.setattr(engine, "stream_llm", stream_llm)
+
+        with self.client.stream("POST", "/chat/god-mode/stream", json={"message": "hey", "session_id": "s3"}) as r:
+            events = [json.loads(l[5:]) for l in r.iter_lines() if l.startswith("data:")]
+
+        assert events[-1]["session_id"] == "s3"
+        assert engine.chat_sessions.get("s3") == [{"role": "user", "content": "hey"},
+                                                  {"role": "assistant", "content": "Ciao a te"}]
+
+    def test_trimmed_fact_reaches_prompt(self, monkeypatch):
+        """Test that a fact from a message dropped by the session trim is still in the prompt"""
+        calls = self.scripted(monkeypatch)
+        monkeypatch.setattr(engine, "chat_sessions", engine.ChatSessions(backend="memory", max_messages=4))
+
+        self.client.post("/chat/god-mode", json={"message": "il mio database è PostgreSQL 16", "session_id": "s4"})
+        for i in range(4):
+            self.client.post("/chat/god-mode", json={"message": f"domanda {i}", "session_id": "s4"})
+
+        assert all("PostgreSQL" not in m["content"] for m in engine.chat_sessions.get("s4")[1:])
+        assert any("PostgreSQL 16" in m["content"] for m in calls[-1])
+
+    def test_summary_runs_in_background(self, monkeypatch):
+        """Test that the fold LLM call does not delay the response and runs at background priority"""
+        self.scripted(monkeypatch)
+        monkeypatch.setattr(engine, "chat_sessions", engine.ChatSessions(backend="memory", max_messages=2))
+        started, release, priorities = threading.Event(), threading.Event(), []
+        async def summarize_history(previous_summary, folded_messages, max_tokens, priority="interactive"):
+            priorities.append(priority)
+            started.set()
+            await asyncio.to_thread(release.wait, 5)
+            return "- riassunto LLM"
+        monkeypatch.setattr(engine, "summarize_history", summarize_history)
+
+        with TestClient(engine.app) as client:
+            client.post("/chat/god-mode", json={"message": "uso PostgreSQL 16", "session_id": "s5"})
+            client.post("/chat/god-mode", json={"message": "e poi?", "session_id": "s5"})
+            assert started.wait(5) and not release.is_set()
+            head = engine.chat_sessions.get("s5")[0]["content"]
+            assert "PostgreSQL 16" in head  # Estratto mentre l'LLM lavora
+
+            release.set()
+            deadline = time.time() + 5
+            while "riassunto LLM" not in engine.chat_sessions.get("s5")[0]["content"] and time.time() < deadline:
+                time.sleep(0.01)
+        assert engine.chat_sessions.get("s5")[0]["content"].endswith("- riassunto LLM")
+        assert priorities == ["background"]
+
+    def test_invalid_session_is_400(self, monkeypatch):
+        self.scripted(monkeypatch)
+        response = self.client.post("/chat/god-mode", json={"message": "x", "session_id": "../../etc"})
+        assert response.status_code == 400
+
+    def test_stateless_requests_unchanged(self, monkeypatch):
+        calls = self.scripted(monkeypatch)
+        body = self.client.post("/chat/god-mode", json={"message": "x", "history": turn(0)}).json()
+        assert body["session_id"] is None
+        assert calls[0][1:3] == turn(0)
+        assert engine.chat_sessions.get_stats()["sessions_in_memory"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
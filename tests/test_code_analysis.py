@@ -0,0 +1,204 @@
+import pytest
+import os
+import sys
+import tempfile
+import shutil
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import hub
+from core.code_analysis import summarize_module, format_summary, estimate_tokens, ContextPacker
+
+
+DB_SOURCE = '''import sqlite3
+from config import DB_PATH as PATH
+
+def get_connection(path=PATH):
+    """Apre il database"""
+    return sqlite3.connect(path)
+
+def _migrate(conn):
+    conn.execute("CREATE TABLE x (id INTEGER)")
+'''
+
+MAIN_SOURCE = '''import db
+import requests
+
+def main():
+    conn = db.get_connection()
+    page = requests.get("https://example.com")
+    print(len(page.text))
+'''
+
+
+class TestSummarizeModule:
+    """Test AST summaries of a single file"""
+
+    def test_imports_signatures_and_calls(self):
+        """Test that imports, public signatures and cross-module calls are extracted"""
+        summary = summarize_module(MAIN_SOURCE)
+
+        assert summary["imports"] == ["import db", "import requests"]
+        assert summary["signatures"] == "def main()"
+        assert summary["calls"] == ["db.get_connection", "requests.get"]
+
+    def test_aliases_and_private_names(self):
+        """Test import aliases and that private helpers stay out of the interface"""
+        summary = summarize_module(DB_SOURCE)
+
+        assert "from config import DB_PATH as PATH" in summary["imports"]
+        assert "_migrate" not in summary["signatures"]
+        assert summary["calls"] == ["sqlite3.connect"]
+
+    def test_syntax_error(self):
+        """Test that unparsable files are reported instead of raising"""
+        summary = summarize_module("def broken(:\n")
+        assert summary["error"].startswith("SyntaxError")
+        assert "!! SyntaxError" in format_summary("broken.py", summary)
+
+    def test_detail_levels(self):
+        """Test that lower detail levels drop signatures and calls"""
+        summary = summarize_module(MAIN_SOURCE)
+
+        assert "calls:" in format_summary("main.py", summary, "calls")
+        assert "calls:" not in format_summary("main.py", summary, "signatures")
+        assert format_summary("main.py", summary, "imports") == "### main.py\nimports: import db | import requests"
+
+
+class TestContextPacker:
+    """Test the incremental, token-budgeted project context"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.write("db.py", DB_SOURCE)
+        self.write("main.py", MAIN_SOURCE)
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def write(self, name, source):
+        with open(os.path.join(self.temp_dir, name), "w") as f:
+            f.write(source)
+
+    def test_summaries_cached_by_content_hash(self):
+        """Test that unchanged files are not re-parsed on the next run"""
+        ContextPacker(self.temp_dir).scan()
+
+        self.write("main.py", MAIN_SOURCE + "\nmain()\n")
+        packer = ContextPacker(self.temp_dir)
+        packer.scan()
+
+        assert packer.stats == {"parsed": 1, "cached": 1}
+
+    def test_every_file_covered_under_tight_budget(self):
+        """Test that summaries are compressed, never dropped, when the budget is small"""
+        for i in range(20):
+            self.write(f"module_{i}.py", f"import os\n\ndef run_{i}(a, b, c):\n    return os.getcwd()\n")
+        packer = ContextPacker(self.temp_dir)
+        entries = packer.scan()
+
+        text, full_files = packer.pack(entries, budget_tokens=150, full_body=["main.py"])
+
+        for e in entries:
+            assert f"### {e['name']}" in text or f"=== {e['name']}" in text
+        assert full_files == ["main.py"]  # nothing fits: the first requested file is shown anyway
+        assert "def run_" not in text  # compressed down to imports only
+
+    def test_full_body_only_for_changed_summaries(self):
+        """Test that the critic sees full code only for files whose summary changed"""
+        packer = ContextPacker(self.temp_dir)
+        entries = packer.scan()
+        assert packer.changed_since_review(entries) == ["db.py", "main.py"]
+        packer.mark_reviewed(entries)
+
+        # Body-only change: same summary, no full review needed
+        self.write("main.py", MAIN_SOURCE.replace("example.com", "example.org"))
+        # Interface change: new public function
+        self.write("db.py", DB_SOURCE + "\ndef close(conn):\n    conn.close()\n")
+
+        packer = ContextPacker(self.temp_dir)
+        entries = packer.scan()
+        changed = packer.changed_since_review(entries)
+        text, full_files = packer.pack(entries, budget_tokens=2000, full_body=changed)
+
+        assert changed == ["db.py"]
+        assert full_files == ["db.py"]
+        assert "=== db.py (codice completo) ===" in text
+        assert "### main.py" in text and "example.org" not in text
+
+    def test_critic_prompt_covers_large_projects(self, monkeypatch):
+        """Test that the critic prompt stays within budget and still lists every file"""
+        for i in range(40):
+            self.write(f"module_{i}.py", "import os\n" + "x = 1\n" * 300 + f"\ndef run_{i}():\n    return os.getcwd()\n")
+        prompts = []
+        def call_ai(message, *args, **kwargs):
+            prompts.append(message)
+            return "OK"
+        monkeypatch.setattr(hub, "call_ai", call_ai)
+
+        hub.sh_phase_critic(self.temp_dir)
+
+        assert estimate_tokens(prompts[0]) < hub.CRITIC_TOKEN_BUDGET + 300
+        for i in range(40):
+            assert f"### module_{i}.py" in prompts[0] or f"=== module_{i}.py" in prompts[0]
+
+        # Files left out of a round get their full body in a later one, until every file was seen in full
+        reviewed_in_full = set()
+        for _ in range(40):
+            code = prompts[-1].split("CODICE:")[1]
+            round_files = {i for i in range(40) if f"=== module_{i}.py (codice completo)" in code}
+            assert round_files and not round_files & reviewed_in_full
+            reviewed_in_full |= round_files
+            calls = len(prompts)
+            hub.sh_phase_critic(self.temp_dir)
+            if len(prompts) == calls:
+                break
+        assert reviewed_in_full == set(range(40))
+
+    def test_critic_patches_only_full_files(self, monkeypatch):
+        """Test that rewrites of files seen only as signatures are ignored"""
+        for i in range(40):
+            self.write(f"module_{i}.py", "import os\n" + "x = 1\n" * 300 + f"\ndef run_{i}():\n    return os.getcwd()\n")
+        prompts = []
+        def call_ai(message, *args, **kwargs):
+            prompts.append(message)
+            return "".join(f"FILE: module_{i}.py\n```python\nprint('riscritto')\n```\n" for i in range(40))
+        monkeypatch.setattr(hub, "call_ai", call_ai)
+
+        hub.sh_phase_critic(self.temp_dir)
+
+        rewritable = prompts[0].split("FILE RISCRIVIBILI")[1].split("\n")[0]
+        for i in range(40):
+            with open(os.path.join(self.temp_dir, f"module_{i}.py")) as f:
+                patched = "riscritto" in f.read()
+            assert patched == (f"module_{i}.py" in rewritable)
+
+    def test_critic_reviews_file_over_budget(self, monkeypatch):
+        """Test that a changed file larger than the whole budget is still reviewed in full"""
+        packer = ContextPacker(self.temp_dir)
+        packer.mark_reviewed(packer.scan())
+        big_source = "import db\n" + "".join(f"def step_{i}(x):\n    return db.get_connection(x + {i})\n" for i in range(400))
+        self.write("big.py", big_source)
+        assert estimate_tokens(big_source) > hub.CRITIC_TOKEN_BUDGET
+        prompts = []
+        def call_ai(message, *args, **kwargs):
+            prompts.append(message)
+            return "OK"
+        monkeypatch.setattr(hub, "call_ai", call_ai)
+
+        hub.sh_phase_critic(self.temp_dir)
+
+        assert len(prompts) == 1
+        assert "=== big.py (codice completo)" in prompts[0]
+        assert "big.py" in prompts[0].split("FILE RISCRIVIBILI")[1].split("\n")[0]
+        packer = ContextPacker(self.temp_dir)
+        assert packer.changed_since_review(packer.scan()) == []
+
+        hub.sh_phase_critic(self.temp_dir)
+        assert len(prompts) == 1  # already reviewed, no new call
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,115 @@
+import pytest
+import os
+import sys
+import asyncio
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import engine
+from core.context_window import ContextWindow, strip_reasoning, message_tokens, SUMMARY_HEADER
+
+
+def conversation(turns, words=40):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"domanda {i} " + "parola " * words})
+        history.append({"role": "assistant", "content": f"<think>{'ragiono ' * 200}</think>risposta {i} " + "parola " * words})
+    return history
+
+
+class FakeSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, previous, messages, max_tokens):
+        self.calls.append((previous, [m["content"].split()[0] + " " + m["content"].split()[1] for m in messages]))
+        return f"{previous or ''} +{len(messages)}".strip()
+
+
+class TestStripReasoning:
+    """Test rimozione del ragionamento dalle risposte"""
+
+    def test_think_removed_from_assistant_only(self):
+        assert strip_reasoning({"role": "assistant", "content": "<think>x</think> Ciao"})["content"] == "Ciao"
+        assert strip_reasoning({"role": "assistant", "content": "ragiono...</think>Ciao"})["content"] == "Ciao"
+        assert strip_reasoning({"role": "assistant", "content": "Ciao <think>troncato"})["content"] == "Ciao"
+        assert strip_reasoning({"role": "user", "content": "<think>letterale</think>"})["content"] == "<think>letterale</think>"
+
+
+class TestContextWindow:
+    """Test finestra di contesto con budget e riassunto incrementale"""
+
+    def test_short_history_untouched(self):
+        window = ContextWindow(history_tokens=2000)
+        summarizer = FakeSummarizer()
+        history = asyncio.run(window.build(conversation(2), summarizer))
+
+        assert [m["role"] for m in history] == ["user", "assistant"] * 2
+        assert "<think>" not in history[1]["content"]
+        assert summarizer.calls == []
+
+    def test_budget_respected_for_any_length(self):
+        window = ContextWindow(history_tokens=300, summary_tokens=50)
+        for turns in (5, 50, 200):
+            history = asyncio.run(window.build(conversation(turns), FakeSummarizer()))
+            recent = [m for m in history if m["role"] != "system"]
+            assert sum(message_tokens(m) for m in recent) <= 300
+            assert history[0]["content"].startswith(SUMMARY_HEADER)
+
+    def test_summary_cached_and_incremental(self):
+        """Test che i turni successivi riusino il riassunto e ripieghino solo i nuovi messaggi"""
+        window = ContextWindow(history_tokens=600, summary_tokens=50)
+        summarizer = FakeSummarizer()
+        history = conversation(20)
+
+        asyncio.run(window.build(history[:20], summarizer))
+        assert len(summarizer.calls) == 1 and summarizer.calls[0][0] is None
+
+        asyncio.run(window.build(history[:22], summarizer))  # Un turno dopo: sta ancora nel budget
+        assert len(summarizer.calls) == 1 and window.stats["summary_hits"] == 1
+
+        asyncio.run(window.build(history, summarizer))
+        assert len(summarizer.calls) == 2
+        previous, folded = summarizer.calls[-1]
+        assert previous == "+" + str(len(summarizer.calls[0][1]))
+        first_folded = len(summarizer.calls[0][1])
+        assert folded[0] == ("domanda " if first_folded % 2 == 0 else "risposta ") + str(first_folded // 2)
+
+    def test_min_recent_kept(self):
+        window = ContextWindow(history_tokens=10, min_recent=2)
+        history = asyncio.run(window.build(conversation(3, words=100), FakeSummarizer()))
+        assert [m["role"] for m in history[-2:]] == ["user", "assistant"]
+
+    def test_summarizer_failure_falls_back(self):
+        async def broken(previous, messages, max_tokens):
+            raise RuntimeError("backend giù")
+        window = ContextWindow(history_tokens=300, summary_tokens=100)
+        history = asyncio.run(window.build(conversation(20), broken))
+
+        # Estratto entro il budget: restano le righe dei messaggi ripiegati più recenti
+        assert "- user: domanda 18" in history[0]["content"] and "domanda 0 " not in history[0]["content"]
+        assert window.stats["summary_fallbacks"] == 1
+
+
+class TestEngineContext:
+    """Test integrazione in build_chat_messages"""
+
+    def test_single_system_message(self, monkeypatch):
+        async def summarize(previous, messages, max_tokens, priority="interactive"):
+            return "- l'utente preferisce Python"
+        monkeypatch.setattr(engine, "summarize_history", summarize)
+        monkeypatch.setattr(engine, "context_window", ContextWindow(history_tokens=300))
+        monkeypatch.setattr(engine, "memory", None)
+
+        request = engine.ChatRequest(message="e adesso?", history=conversation(20))
+        messages, _, _ = asyncio.run(engine.build_chat_messages(request))
+
+        assert [m["role"] for m in messages].count("system") == 1
+        assert "l'utente preferisce Python" in messages[0]["content"]
+        assert messages[-1] == {"role": "user", "content": "e adesso?"}
+        assert all("<think>" not in m["content"] for m in messages[1:])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
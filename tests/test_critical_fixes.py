@@ -127,7 +127,15 @@ class TestSecurityFixes:
         result = terminal_run("/usr/bin/ls")
         assert "ERRORE SICUREZZA" in result
         assert "Path nel comando" in result
-    
+
+    def test_terminal_pool_venv_python_allowed(self):
+        """Test that only pool venv interpreters are exempt from the path check"""
+        result = terminal_run(".venvs/0123456789abcdef/bin/python3 demo/main.py")
+        assert "ERRORE SICUREZZA" not in result
+
+        for cmd in ["../.venvs/0123456789abcdef/bin/python3", ".venvs/../../bin/python3", "demo/venv/bin/python3"]:
+            assert "Path nel comando" in terminal_run(cmd)
+
     def test_terminal_allowed_command(self):
         """Test that whitelisted commands work"""
         result = terminal_run("ls")
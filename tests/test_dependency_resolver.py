@@ -0,0 +1,110 @@
+import pytest
+import os
+import sys
+import tempfile
+import shutil
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import hub
+from core.dependency_resolver import (
+    imported_modules,
+    classify_imports,
+    distribution_for,
+    resolve_requirements
+)
+
+
+class TestImportScanner:
+    """Test static import extraction and classification"""
+
+    def test_imported_modules(self):
+        """Test absolute imports are reduced to their top-level module"""
+        source = (
+            "import os, sys\n"
+            "import xml.etree.ElementTree as ET\n"
+            "from bs4 import BeautifulSoup\n"
+            "from . import helpers\n"
+            "from .db import get_connection\n"
+            "def f():\n    import yaml\n"
+        )
+        assert imported_modules(source) == {"os", "sys", "xml", "bs4", "yaml"}
+
+    def test_syntax_error_returns_empty(self):
+        """Test that broken files do not abort the scan"""
+        assert imported_modules("import (") == set()
+
+    def test_classify_imports(self):
+        """Test stdlib / local / third-party separation"""
+        result = classify_imports({"os", "json", "__future__", "scraper", "requests", "bs4"}, local={"scraper"})
+
+        assert result["stdlib"] == {"os", "json", "__future__"}
+        assert result["local"] == {"scraper"}
+        assert result["third_party"] == {"requests", "bs4"}
+
+    def test_distribution_mapping(self):
+        """Test the bundled import -> distribution table"""
+        assert distribution_for("bs4") == "beautifulsoup4"
+        assert distribution_for("cv2") == "opencv-python"
+        assert distribution_for("PIL") == "Pillow"
+        assert distribution_for("requests") == "requests"
+        assert distribution_for("some_private_sdk") is None
+
+
+class TestResolveRequirements:
+    """Test requirements.txt generation for a whole project"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.write("main.py", "import os\nimport scraper\nfrom dotenv import load_dotenv\nimport requests\n")
+        self.write("scraper.py", "from bs4 import BeautifulSoup\nimport requests\nimport acme_sdk\n")
+        self.write(os.path.join("utils", "__init__.py"), "import yaml\n")
+        # Un venv dentro il progetto non deve finire nei requirements
+        self.write(os.path.join("venv", "lib", "site.py"), "import numpy\n")
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def write(self, name, source):
+        path = os.path.join(self.temp_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(source)
+
+    def test_resolve_requirements(self):
+        """Test deterministic resolution with unknown names reported separately"""
+        distributions, unresolved = resolve_requirements(self.temp_dir)
+
+        assert distributions == ["beautifulsoup4", "python-dotenv", "PyYAML", "requests"]
+        assert unresolved == ["acme_sdk"]
+
+    def test_integrator_asks_llm_only_for_unknown_names(self, monkeypatch):
+        """Test that the LLM sees only unresolved modules and <think> noise is ignored"""
+        prompts = []
+        def call_ai(message, *args, **kwargs):
+            prompts.append(message)
+            return '<think>forse acme?</think>{"acme_sdk": "acme-sdk"}'
+        monkeypatch.setattr(hub, "call_ai", call_ai)
+
+        hub.sh_phase_integrator(self.temp_dir)
+
+        assert len(prompts) == 1
+        assert 'MODULI: ["acme_sdk"]' in prompts[0]
+        with open(os.path.join(self.temp_dir, "requirements.txt")) as f:
+            assert f.read().split("\n") == ["acme-sdk", "beautifulsoup4", "python-dotenv", "PyYAML", "requests"]
+
+    def test_integrator_without_unknown_names_skips_llm(self, monkeypatch):
+        """Test that a fully resolved project needs no LLM call"""
+        self.write("scraper.py", "from bs4 import BeautifulSoup\n")
+        monkeypatch.setattr(hub, "call_ai", lambda *a, **k: pytest.fail("LLM non necessario"))
+
+        hub.sh_phase_integrator(self.temp_dir)
+
+        with open(os.path.join(self.temp_dir, "requirements.txt")) as f:
+            assert "beautifulsoup4" in f.read()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
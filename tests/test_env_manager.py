@@ -0,0 +1,257 @@
+import pytest
+import os
+import sys
+import tempfile
+import time
+import shutil
+import threading
+import subprocess
+from fastapi.testclient import TestClient
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import hub
+from core import engine
+from core.env_manager import EnvManager, EnvSetupError, normalize_requirements
+
+
+class FakePip:
+    """Simula 'python -m venv', 'pip wheel' e 'pip install --no-index' senza rete"""
+
+    def __init__(self, wheelhouse, broken=()):
+        self.wheelhouse = wheelhouse
+        self.broken = set(broken)
+        self.calls = []
+
+    def requirements(self, args):
+        with open(args[args.index("-r") + 1]) as f:
+            return [l.strip() for l in f if l.strip()]
+
+    def __call__(self, args, **kwargs):
+        self.calls.append(args)
+        if args[1:3] == ["-m", "venv"]:
+            env = args[3]
+            os.makedirs(os.path.join(env, "bin"))
+            with open(os.path.join(env, "bin", "pip"), "w") as f:
+                f.write(f"#!{env}/bin/python\nimport pip\n")
+            with open(os.path.join(env, "pyvenv.cfg"), "w") as f:
+                f.write(f"home = /usr/bin\ncommand = python -m venv {env}\n")
+            os.symlink(sys.executable, os.path.join(env, "bin", "python3"))
+            return subprocess.CompletedProcess(args, 0, "", "")
+
+        names = self.requirements(args)
+        if "wheel" in args:
+            if self.broken & set(names):
+                return subprocess.CompletedProcess(args, 1, "", "ERROR: No matching distribution")
+            for name in names:
+                open(os.path.join(self.wheelhouse, f"{name}.whl"), "w").close()
+            return subprocess.CompletedProcess(args, 0, "", "")
+
+        # install --no-index: riesce solo se tutti i wheel sono nella wheelhouse
+        missing = [n for n in names if not os.path.exists(os.path.join(self.wheelhouse, f"{n}.whl"))]
+        if missing:
+            return subprocess.CompletedProcess(args, 1, "", f"ERROR: Could not find {missing[0]}")
+        return subprocess.CompletedProcess(args, 0, "", "")
+
+    def count(self, word):
+        return sum(1 for c in self.calls if word in c)
+
+
+class TestEnvManager:
+    """Test the shared venv pool and the local wheelhouse"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.wheelhouse = os.path.join(self.temp_dir, "wheelhouse")
+        self.pip = FakePip(self.wheelhouse, broken={"ghost-package"})
+        self.manager = self.make_manager()
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make_manager(self, max_envs=8):
+        return EnvManager(pool_dir=os.path.join(self.temp_dir, ".venvs"), wheelhouse=self.wheelhouse,
+                          max_envs=max_envs, runner=self.pip)
+
+    def test_normalize_requirements(self):
+        """Test that comments, blank lines, spacing and order do not matter"""
+        assert normalize_requirements("requests >= 2.0\n\n# scraping\nbs4  # parser\n") == ["bs4", "requests>=2.0"]
+
+    def test_same_requirements_reuse_env(self):
+        """Test that an equivalent requirement set reuses the venv without pip"""
+        first = self.manager.ensure_env("requests\nbeautifulsoup4\n")
+        calls = len(self.pip.calls)
+        second = self.manager.ensure_env("# deps\nbeautifulsoup4\n  requests  \n")
+
+        assert first == second
+        assert len(self.pip.calls) == calls
+        assert self.manager.stats == {"reused": 1, "created": 1, "failed": 0}
+
+    def test_template_created_once_and_paths_rewritten(self):
+        """Test that new venvs are clones of one template with their own paths"""
+        python_a = self.manager.ensure_env("requests")
+        python_b = self.manager.ensure_env("pandas")
+        env_b = os.path.dirname(os.path.dirname(python_b))
+
+        assert self.pip.count("venv") == 1
+        assert python_a != python_b
+        with open(os.path.join(env_b, "bin", "pip")) as f:
+            assert f.readline().strip() == f"#!{os.path.abspath(env_b)}/bin/python"
+        with open(os.path.join(env_b, "pyvenv.cfg")) as f:
+            assert "_template" not in f.read()
+
+    def test_wheelhouse_avoids_rebuilds(self):
+        """Test that cached wheels are installed offline without 'pip wheel'"""
+        self.manager.ensure_env("requests\npandas")
+        wheels_before = self.pip.count("wheel")
+        self.manager.ensure_env("pandas")
+
+        assert self.pip.count("wheel") == wheels_before
+        assert all("--no-index" in c for c in self.pip.calls if "install" in c)
+
+    def test_failed_install_is_not_cached(self):
+        """Test that a failed setup raises and leaves no half-built venv"""
+        with pytest.raises(EnvSetupError):
+            self.manager.ensure_env("ghost-package")
+
+        key = self.manager.requirements_key("ghost-package")
+        assert not os.path.exists(self.manager.env_path(key))
+        assert self.manager.stats["failed"] == 1
+
+    def test_slow_install_does_not_block_cached_envs(self):
+        """Test that a running pip install holds only its own venv, not the whole pool"""
+        cached = self.manager.ensure_env("requests")
+        started, release = threading.Event(), threading.Event()
+        def slow_pip(args, **kwargs):
+            if "-r" in args and "pandas" in self.pip.requirements(args):
+                started.set()
+                release.wait(5)
+            return self.pip(args, **kwargs)
+        self.manager._run = slow_pip
+        results = []
+        builders = [threading.Thread(target=lambda: results.append(self.manager.ensure_env("pandas"))) for _ in range(2)]
+        for t in builders:
+            t.start()
+        assert started.wait(5)
+
+        start = time.time()
+        assert self.manager.ensure_env("requests") == cached
+        assert time.time() - start < 1  # Non aspetta il pip in corso
+        release.set()
+        for t in builders:
+            t.join(5)
+
+        assert len(results) == 2 and results[0] == results[1]
+        assert self.manager.stats == {"reused": 2, "created": 2, "failed": 0}  # Il secondo builder riusa
+
+    def test_pool_eviction(self):
+        """Test that the least recently used venv leaves the pool"""
+        manager = self.make_manager(max_envs=2)
+        manager.ensure_env("a")
+        manager.ensure_env("b")
+        manager.ensure_env("c")
+
+        assert not os.path.exists(manager.env_path(manager.requirements_key("a")))
+        assert os.path.exists(manager.env_path(manager.requirements_key("c")))
+
+
+class TestRuntimeSetup:
+    """Test that the factory runtime uses the engine-side pool instead of LLM tool calls"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.project = os.path.join(self.temp_dir, "projects", "demo")
+        os.makedirs(self.project)
+        with open(os.path.join(self.project, "requirements.txt"), "w") as f:
+            f.write("requests\n")
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def engine_pool(self, monkeypatch):
+        """Pool dell'engine con pip finto; l'hub lo raggiunge via /env/setup"""
+        wheelhouse = os.path.join("projects", ".wheelhouse")
+        monkeypatch.setattr(engine.env_manager, "pool_dir", os.path.join("projects", ".venvs"))
+        monkeypatch.setattr(engine.env_manager, "wheelhouse", wheelhouse)
+        monkeypatch.setattr(engine.env_manager, "_run", FakePip(wheelhouse))
+        client = TestClient(engine.app)
+        monkeypatch.setattr(hub, "setup_env_direct", lambda p_name: client.post("/env/setup", json={"project": p_name}).json())
+        monkeypatch.chdir(self.temp_dir)
+        return engine.env_manager
+
+    def test_runtime_runs_with_pool_venv(self, monkeypatch):
+        """Test that pip and the test run need no LLM call and use the engine's pool venv"""
+        manager = self.engine_pool(monkeypatch)
+        commands = []
+        def run_tool_direct(tool_name, query="", args=None, timeout=120):
+            commands.append((tool_name, args["command"]))
+            assert float(args["healthy_after"]) == hub.RUN_HEALTHY_AFTER
+            return {"tool": tool_name, "ok": True, "exit_code": 0, "stdout": "ok", "stderr": "", "duration": 0.1}
+        monkeypatch.setattr(hub, "run_tool_direct", run_tool_direct)
+        monkeypatch.setattr(hub, "call_ai", lambda *a, **k: pytest.fail("LLM non necessario"))
+
+        hub.sh_phase_runtime(self.project, "demo", "test")
+
+        key = manager.requirements_key("requests\n")
+        assert commands == [("terminal_run", f".venvs/{key}/bin/python3 demo/main.py")]
+        assert os.path.exists(os.path.join("projects", ".venvs", key, ".ready"))
+
+    def test_setup_failure_skips_run(self, monkeypatch):
+        """Test that a failed engine-side install is reported and nothing is executed"""
+        manager = self.engine_pool(monkeypatch)
+        monkeypatch.setattr(manager, "_run", FakePip(manager.wheelhouse, broken={"requests"}))
+        monkeypatch.setattr(hub, "run_tool_direct", lambda *a, **k: pytest.fail("Nessun run senza venv"))
+
+        hub.sh_phase_runtime(self.project, "demo", "test")
+
+    def test_invalid_project_name(self):
+        client = TestClient(engine.app)
+        result = client.post("/env/setup", json={"project": "../core"}).json()
+        assert result["ok"] is False and "SICUREZZA" in result["error"]
+
+    def test_healthy_service_is_success(self, monkeypatch):
+        """Test that a long-running service alive for RUN_HEALTHY_AFTER seconds needs no patch"""
+        runs = []
+        def run_tool_direct(tool_name, query="", args=None, timeout=120):
+            runs.append(args)
+            return {"tool": tool_name, "ok": True, "exit_code": -9, "stdout": "scheduler avviato", "stderr": "",
+                    "duration": 10.0, "outcome": "healthy"}
+        monkeypatch.setattr(hub, "setup_env_direct", lambda p_name: {"ok": True, "duration": 0.0,
+                                                                     "python": ".venvs/0123456789abcdef/bin/python3"})
+        monkeypatch.setattr(hub, "run_tool_direct", run_tool_direct)
+        monkeypatch.setattr(hub, "call_ai", lambda *a, **k: pytest.fail("Nessuna patch per un servizio sano"))
+
+        hub.sh_phase_runtime(self.project, "demo", "test")
+
+        assert len(runs) == 1
+
+    def test_timeout_goes_to_fixer(self, monkeypatch):
+        """Test that a run killed by the timeout is patched with the output tail and a timeout note"""
+        results = [
+            {"tool": "terminal_run", "ok": False, "exit_code": None, "stdout": "attendo input...", "stderr": "",
+             "duration": 60.0, "outcome": "timeout", "error": "ERRORE TIMEOUT: Comando superato 60s"},
+            {"tool": "terminal_run", "ok": True, "exit_code": 0, "stdout": "fatto", "stderr": "", "duration": 0.1,
+             "outcome": "exited"},
+        ]
+        prompts = []
+        def call_ai(message, *args, **kwargs):
+            prompts.append(message)
+            return "```python\nprint('fatto')\n```"
+        monkeypatch.setattr(hub, "setup_env_direct", lambda p_name: {"ok": True, "duration": 0.0,
+                                                                     "python": ".venvs/0123456789abcdef/bin/python3"})
+        monkeypatch.setattr(hub, "run_tool_direct", lambda *a, **k: results.pop(0))
+        monkeypatch.setattr(hub, "call_ai", call_ai)
+
+        hub.sh_phase_runtime(self.project, "demo", "test")
+
+        assert len(prompts) == 1 and results == []
+        assert "attendo input..." in prompts[0] and "timeout dopo 60s" in prompts[0]
+        with open(os.path.join(self.project, "main.py")) as f:
+            assert f.read() == "print('fatto')"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,168 @@
+import pytest
+import os
+import sys
+import time
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import tools
+from core.executor import CommandExecutor, RingBuffer, QueueFullError
+
+PYTHON = sys.executable
+
+
+class TestRingBuffer:
+    """Test buffer circolare dell'output"""
+
+    def test_keeps_tail(self):
+        buffer = RingBuffer(max_bytes=10)
+        for part in [b"0123456", b"789abc", b"def"]:
+            buffer.write(part)
+        assert buffer.getvalue() == "...[6 byte precedenti omessi]...\n6789abcdef"
+
+    def test_small_output_unchanged(self):
+        buffer = RingBuffer(max_bytes=100)
+        buffer.write("ciao ✅".encode("utf-8"))
+        assert buffer.getvalue() == "ciao ✅"
+
+
+class TestCommandExecutor:
+    """Test pool limitato di processi con rlimit"""
+
+    def setup_method(self):
+        self.executor = CommandExecutor(workers=1, queue_size=1)
+
+    def teardown_method(self):
+        self.executor.shutdown()
+
+    def test_captures_output_and_exit_code(self):
+        job = self.executor.run([PYTHON, "-c", "import sys; print('out'); sys.exit('boom')"], timeout=10)
+        assert job["exit_code"] == 1
+        assert job["stdout"] == "out\n" and "boom" in job["stderr"]
+        assert job["timed_out"] is False
+
+    def test_output_streamed_into_ring_buffer(self):
+        job = self.executor.run([PYTHON, "-c", "print('x' * 100000, end=''); print('FINE', end='')"],
+                                timeout=10, output_limit=1000)
+        assert job["stdout"].endswith("x" * 996 + "FINE")
+        assert "100000 byte precedenti omessi" not in job["stdout"]
+
+    def test_timeout_kills_process_group(self):
+        start = time.time()
+        job = self.executor.run([PYTHON, "-c", "import subprocess, sys, time; "
+                                 "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)']); "
+                                 "print('avviato', flush=True); time.sleep(30)"], timeout=1)
+        assert job["timed_out"] is True
+        assert time.time() - start < 5
+        assert job["stdout"] == "avviato\n"
+        assert self.executor.stats["timed_out"] == 1
+
+    def test_cpu_limit(self):
+        executor = CommandExecutor(workers=1, queue_size=0, limits={"cpu_seconds": 1})
+        job = executor.run([PYTHON, "-c", "while True: pass"], timeout=20)
+        executor.shutdown()
+        assert job["exit_code"] != 0 and job["timed_out"] is False
+
+    def test_memory_limit(self):
+        executor = CommandExecutor(workers=1, queue_size=0, limits={"memory_mb": 512})
+        job = executor.run([PYTHON, "-c", "x = bytearray(1024 * 1024 * 1024)"], timeout=20)
+        executor.shutdown()
+        assert job["exit_code"] != 0 and "MemoryError" in job["stderr"]
+
+    def test_queue_full_rejects(self):
+        """Test backpressure: 1 in esecuzione + 1 in coda, il terzo viene rifiutato"""
+        blocker = [PYTHON, "-c", "import time; time.sleep(0.5)"]
+        first = self.executor.submit(blocker, timeout=10)
+        second = self.executor.submit(blocker, timeout=10)
+        with pytest.raises(QueueFullError):
+            self.executor.submit(blocker, timeout=10)
+
+        first.result(), second.result()
+        assert self.executor.stats["rejected"] == 1
+        self.executor.run([PYTHON, "-c", "pass"], timeout=10)  # Slot liberati
+        assert self.executor.stats["running"] == 0 and self.executor.stats["queued"] == 0
+
+
+class TestTerminalRunExecutor:
+    """Test terminal_run/execute_command sopra l'executor"""
+
+    def test_queue_full_is_reported(self, monkeypatch):
+        def full(*args, **kwargs):
+            raise tools.QueueFullError("Coda di esecuzione piena")
+        monkeypatch.setattr(tools.command_executor, "run", full)
+        result = tools.execute_command("ls")
+        assert result["exit_code"] is None and result["error"].startswith("ERRORE CODA")
+
+    def test_timeout_keeps_partial_output(self, monkeypatch):
+        monkeypatch.setattr(tools.command_executor, "run", lambda *a, **k: {
+            "exit_code": -9, "stdout": "parziale", "stderr": "", "timed_out": True, "outcome": "timeout", "duration": 60.0})
+        result = tools.execute_command("python3 main.py")
+        assert result["error"].startswith("ERRORE TIMEOUT") and result["stdout"] == "parziale"
+
+    def test_terminal_output_is_tail(self, monkeypatch):
+        captured = {}
+        def run(args, cwd=None, timeout=60, output_limit=None, healthy_after=None):
+            captured["output_limit"] = output_limit
+            return {"exit_code": 0, "stdout": "ok", "stderr": "", "timed_out": False, "outcome": "exited", "duration": 0.1}
+        monkeypatch.setattr(tools.command_executor, "run", run)
+        assert tools.terminal_run("ls") == "✅ OUTPUT:\nok"
+        assert captured["output_limit"] == tools.TERMINAL_OUTPUT_BYTES
+
+
+class TestWatchMode:
+    """Test modalità watch per servizi long-running"""
+
+    def setup_method(self):
+        self.executor = CommandExecutor(workers=1, queue_size=0)
+
+    def teardown_method(self):
+        self.executor.shutdown()
+
+    def test_healthy_after(self):
+        """Test che un servizio vivo senza errori sia 'healthy' senza aspettare il timeout"""
+        start = time.time()
+        job = self.executor.run([PYTHON, "-c", "import time\nprint('avvio')\nwhile True: time.sleep(0.1)"],
+                                timeout=30, healthy_after=0.5)
+        assert job["outcome"] == "healthy"
+        assert time.time() - start < 3
+        assert job["stdout"] == "avvio\n"
+
+    def test_traceback_kills_early(self):
+        """Test crash in un thread mentre il loop principale continua: kill al traceback"""
+        code = ("import threading, time\n"
+                "threading.Thread(target=lambda: 1 / 0).start()\n"
+                "while True: time.sleep(0.1)")
+        start = time.time()
+        job = self.executor.run([PYTHON, "-c", code], timeout=30, healthy_after=20)
+        assert job["outcome"] == "crashed"
+        assert time.time() - start < 5
+        assert "ZeroDivisionError" in job["stderr"]
+
+    def test_lines_streamed_while_running(self):
+        lines = []
+        code = "import time\nfor i in range(3):\n    print(i, flush=True)\n    time.sleep(0.1)"
+        job = self.executor.run([PYTHON, "-c", code], timeout=10, watch=True,
+                                on_line=lambda stream, line: lines.append((stream, line, time.time())))
+        assert job["outcome"] == "exited" and job["exit_code"] == 0
+        assert [l[:2] for l in lines] == [("stdout", "0\n"), ("stdout", "1\n"), ("stdout", "2\n")]
+        assert lines[-1][2] - lines[0][2] > 0.15  # Ricevute durante l'esecuzione, non alla fine
+
+    def test_execute_command_healthy_is_ok(self, monkeypatch):
+        monkeypatch.setattr(tools.command_executor, "run", lambda *a, **k: {
+            "exit_code": -9, "stdout": "", "stderr": "", "timed_out": False, "outcome": "healthy", "duration": 10.0})
+        result = tools.execute_command("python3 main.py", healthy_after=10)
+        assert result["ok"] is True and result["outcome"] == "healthy"
+
+    def test_engine_passes_healthy_after(self, monkeypatch):
+        from core import engine
+        calls = []
+        monkeypatch.setattr(engine, "execute_command", lambda command, healthy_after=None: calls.append(
+            (command, healthy_after)) or {"ok": True, "exit_code": 0, "stdout": "", "stderr": "", "duration": 0.1})
+        engine.execute_tool("terminal_run", args={"command": "python3 main.py", "healthy_after": "5"})
+        assert calls == [("python3 main.py", 5.0)]
+        assert engine.execute_tool("terminal_run", args={"command": "ls", "healthy_after": "x"})["ok"] is False
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,89 @@
+import pytest
+import os
+import sys
+import time
+import asyncio
+import httpx
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.llm_client import LLMClient
+
+
+def make_slow_transport(delay=0.2, calls=None):
+    """Backend finto: risponde dopo `delay` secondi con una completion OpenAI-style"""
+    async def handler(request):
+        if calls is not None:
+            calls.append(request)
+        await asyncio.sleep(delay)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+    return httpx.MockTransport(handler)
+
+
+class TestLLMClient:
+    """Test client LLM asincrono con pool e limite di concorrenza"""
+
+    def test_chat_returns_json(self):
+        """Test che chat() ritorni il JSON del backend"""
+        client = LLMClient("http://llm.test/v1/chat/completions", transport=make_slow_transport(0))
+
+        async def run():
+            try:
+                return await client.chat({"messages": []})
+            finally:
+                await client.close()
+
+        data = asyncio.run(run())
+        assert data["choices"][0]["message"]["content"] == "ok"
+
+    def test_concurrent_requests_overlap(self):
+        """Test che richieste concorrenti si sovrappongano invece di serializzarsi"""
+        client = LLMClient("http://llm.test/v1/chat/completions", max_concurrency=4,
+                           transport=make_slow_transport(0.2))
+
+        async def run():
+            try:
+                return await asyncio.gather(*(client.chat({"messages": []}) for _ in range(4)))
+            finally:
+                await client.close()
+
+        start = time.monotonic()
+        results = asyncio.run(run())
+        elapsed = time.monotonic() - start
+
+        assert len(results) == 4
+        assert elapsed < 0.6  # Sequenziale sarebbe >= 0.8s
+
+    def test_concurrency_cap_enforced(self):
+        """Test che il semaforo limiti le richieste in volo"""
+        client = LLMClient("http://llm.test/v1/chat/completions", max_concurrency=1,
+                           transport=make_slow_transport(0.1))
+
+        async def run():
+            try:
+                await asyncio.gather(*(client.chat({"messages": []}) for _ in range(3)))
+            finally:
+                await client.close()
+
+        start = time.monotonic()
+        asyncio.run(run())
+        assert time.monotonic() - start >= 0.3
+
+    def test_http_error_raises(self):
+        """Test che uno status di errore sollevi eccezione"""
+        transport = httpx.MockTransport(lambda request: httpx.Response(503, json={"error": "busy"}))
+        client = LLMClient("http://llm.test/v1/chat/completions", transport=transport)
+
+        async def run():
+            try:
+                await client.chat({"messages": []})
+            finally:
+                await client.close()
+
+        with pytest.raises(httpx.HTTPStatusError):
+            asyncio.run(run())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
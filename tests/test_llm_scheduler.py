@@ -0,0 +1,170 @@
+import pytest
+import os
+import sys
+import json
+import asyncio
+from fastapi.testclient import TestClient
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import hub
+from core import engine
+from core.llm_scheduler import LLMScheduler, Overloaded
+
+
+class Response:
+    """Risposta requests finta (JSON o righe SSE)"""
+
+    def __init__(self, status, body=None, headers=None, lines=()):
+        self.status_code, self.body, self.headers, self.lines = status, body, headers or {}, lines
+        self.closed = False
+
+    def json(self):
+        return self.body
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise hub.requests.HTTPError(f"{self.status_code}")
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TestLLMScheduler:
+    """Test priorità, limiti per classe e load shedding"""
+
+    def test_interactive_goes_first(self):
+        """Test che allo slot liberato passi la chat anche se la factory era in coda da prima"""
+        scheduler = LLMScheduler(slots=1)
+        order = []
+
+        async def call(priority):
+            async with scheduler.slot(priority):
+                order.append(priority)
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await scheduler.acquire("background")
+            tasks = [asyncio.create_task(call("factory")), asyncio.create_task(call("background"))]
+            await asyncio.sleep(0.01)
+            tasks.append(asyncio.create_task(call("interactive")))
+            await asyncio.sleep(0.01)
+            scheduler.release("background")
+            await asyncio.gather(*tasks)
+
+        asyncio.run(main())
+        assert order == ["interactive", "factory", "background"]
+
+    def test_per_class_limit_keeps_slot_for_chat(self):
+        scheduler = LLMScheduler(slots=2, limits={"factory": 1})
+
+        async def main():
+            await scheduler.acquire("factory")
+            waiting = asyncio.create_task(scheduler.acquire("factory"))
+            await asyncio.sleep(0.01)
+            assert not waiting.done()
+            await asyncio.wait_for(scheduler.acquire("interactive"), timeout=1)  # Slot libero: subito
+            scheduler.release("factory")
+            await asyncio.wait_for(waiting, timeout=1)
+
+        asyncio.run(main())
+        stats = scheduler.get_stats()["classes"]
+        assert stats["factory"]["running"] == 1 and stats["interactive"]["running"] == 1
+        assert stats["factory"]["max_wait"] > 0
+
+    def test_full_queue_is_shed(self):
+        scheduler = LLMScheduler(slots=1, queue_sizes={"factory": 1}, service_seconds=30)
+
+        async def main():
+            await scheduler.acquire("factory")
+            queued = asyncio.create_task(scheduler.acquire("factory"))
+            await asyncio.sleep(0.01)
+            with pytest.raises(Overloaded) as excinfo:
+                await scheduler.acquire("factory")
+            queued.cancel()
+            await asyncio.gather(queued, return_exceptions=True)
+            return excinfo.value
+
+        error = asyncio.run(main())
+        assert error.retry_after >= 30
+        stats = scheduler.get_stats()["classes"]["factory"]
+        assert stats["rejected"] == 1 and stats["queued"] == 0 and stats["running"] == 1
+
+    def test_cancelled_waiter_does_not_leak_slot(self):
+        scheduler = LLMScheduler(slots=1)
+
+        async def main():
+            await scheduler.acquire("interactive")
+            waiter = asyncio.create_task(scheduler.acquire("interactive"))
+            await asyncio.sleep(0.01)
+            scheduler.release("interactive")  # Slot assegnato al waiter...
+            waiter.cancel()                   # ...che però viene annullato prima di usarlo
+            await asyncio.gather(waiter, return_exceptions=True)
+            await asyncio.sleep(0.01)
+            await asyncio.wait_for(scheduler.acquire("background"), timeout=1)
+
+        asyncio.run(main())
+        assert scheduler.get_stats()["classes"]["interactive"]["running"] == 0
+
+    def test_unknown_class(self):
+        with pytest.raises(ValueError):
+            asyncio.run(LLMScheduler().acquire("urgente"))
+
+
+class TestEngineAdmission:
+    """Test 429 + Retry-After dall'engine e retry lato hub"""
+
+    def test_overloaded_chat_returns_429(self, monkeypatch):
+        scheduler = engine.LLMScheduler(slots=1, queue_sizes={"interactive": 0}, service_seconds=5)
+        asyncio.run(scheduler.acquire("interactive"))  # Backend occupato
+        monkeypatch.setattr(engine, "llm_scheduler", scheduler)
+        monkeypatch.setattr(engine, "memory", None)
+        client = TestClient(engine.app)
+
+        response = client.post("/chat/god-mode", json={"message": "ciao"})
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 5
+
+        stream = client.post("/chat/god-mode/stream", json={"message": "ciao"})
+        assert stream.status_code == 429
+        assert client.get("/scheduler/stats").json()["classes"]["interactive"]["rejected"] == 2
+
+    def test_hub_retries_after_429(self, monkeypatch):
+        responses = [Response(429, {"detail": "pieno"}, {"Retry-After": "2"}), Response(200, {"response": "fatto"})]
+        sleeps = []
+        monkeypatch.setattr(hub.requests, "post", lambda url, json, timeout: responses.pop(0))
+        monkeypatch.setattr(hub.time, "sleep", sleeps.append)
+
+        assert hub.call_ai("genera", mode="factory", silent=True) == "fatto"
+        assert sleeps == [2.0]
+        assert responses == []
+
+    def test_hub_stream_retries_after_429(self, monkeypatch):
+        """Test that the SSE path shares the Retry-After handling and keeps tool markers out of the text"""
+        events = [{"delta": "Cerco "}, {"tool": "web_search"}, {"delta": "fatto"}, {"done": True}]  # Round intermedio + finale
+        lines = [f"data: {json.dumps(e)}" for e in events]
+        responses = [Response(429, {"detail": "pieno"}, {"Retry-After": "3"}), Response(200, lines=lines)]
+        urls, sleeps = [], []
+        def post(url, json, timeout, stream=False):
+            urls.append((url, stream))
+            return responses.pop(0)
+        monkeypatch.setattr(hub.requests, "post", post)
+        monkeypatch.setattr(hub.time, "sleep", sleeps.append)
+
+        assert hub.call_ai("cerca", stream=True) == "fatto"  # Solo il round dopo l'ultimo tool
+        assert sleeps == [3.0]
+        assert urls == [(hub.STREAM_API_URL, True)] * 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
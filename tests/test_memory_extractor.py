@@ -0,0 +1,197 @@
+import pytest
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+import shutil
+from fastapi.testclient import TestClient
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import engine
+from core.llm_scheduler import LLMScheduler
+from core.memory_extractor import PendingTurns, MemoryExtractor, parse_facts
+
+
+class FakeMemory:
+    """Memoria vettoriale finta: registra i fatti salvati"""
+
+    def __init__(self):
+        self.saved = []
+
+    def search(self, query):
+        return "Nessun dato storico rilevante."
+
+    def save(self, user_input, fact):
+        self.saved.append((user_input, fact))
+
+
+def batch_reply(*facts):
+    return "<think>analizzo</think>" + json.dumps({"facts": [{"turn": t, "fact": f} for t, f in facts]})
+
+
+class TestPendingTurns:
+    """Test coda persistente dei turni"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def test_survives_restart(self):
+        queue = PendingTurns(self.temp_dir)
+        for i in range(3):
+            queue.append({"input": f"turno {i}"})
+        queue.ack(2)
+
+        reloaded = PendingTurns(self.temp_dir)
+        assert len(reloaded) == 1
+        assert reloaded.peek(5) == [{"input": "turno 2"}]
+
+        reloaded.ack(1)
+        assert len(PendingTurns(self.temp_dir)) == 0
+        assert os.path.getsize(os.path.join(self.temp_dir, "pending.jsonl")) == 0
+
+    def test_torn_last_line_is_dropped(self):
+        queue = PendingTurns(self.temp_dir)
+        queue.append({"input": "completo"})
+        with open(os.path.join(self.temp_dir, "pending.jsonl"), "ab") as f:
+            f.write(b'{"input": "scritto a me')
+
+        reloaded = PendingTurns(self.temp_dir)
+        assert reloaded.peek(5) == [{"input": "completo"}]
+        reloaded.append({"input": "dopo"})
+        assert len(reloaded.peek(5)) == 2
+
+
+class TestParseFacts:
+    """Test parsing della risposta JSON del batch"""
+
+    def test_valid_reply(self):
+        text = batch_reply((1, "Usa Python 3.12"), (3, "Preferisce FastAPI"), (9, "turno inesistente"), (2, "x"))
+        assert parse_facts("Ecco:\n" + text, 3) == [(0, "Usa Python 3.12"), (2, "Preferisce FastAPI")]
+
+    def test_empty_and_invalid(self):
+        assert parse_facts('{"facts": []}', 2) == []
+        with pytest.raises(ValueError):
+            parse_facts("<think>...</think>Nessun fatto rilevante.", 2)
+        with pytest.raises(ValueError):
+            parse_facts('{"facts": [', 2)
+
+
+class TestMemoryExtractor:
+    """Test batch, inattività del backend e tentativi"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.memory = FakeMemory()
+        self.replies = []
+        self.calls = []
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make(self, idle=100.0, **kwargs):
+        async def extract(turns):
+            self.calls.append(turns)
+            return self.replies.pop(0)
+        return MemoryExtractor(extract, self.memory.save, idle_seconds=lambda: idle,
+                               directory=self.temp_dir, batch_size=4, **kwargs)
+
+    def test_one_call_per_batch(self):
+        extractor = self.make()
+        for i in range(4):
+            extractor.enqueue(f"lavoro sempre con il framework numero {i}")
+        assert extractor.enqueue("ci sei?") is False
+
+        self.replies.append(batch_reply((2, "Usa il framework numero 1")))
+        assert extractor.ready()
+        assert asyncio.run(extractor.process_batch()) == 1
+
+        assert len(self.calls) == 1 and len(self.calls[0]) == 4
+        assert self.memory.saved == [("lavoro sempre con il framework numero 1", "Usa il framework numero 1")]
+        stats = extractor.get_stats()
+        assert stats["pending"] == 0 and stats["llm_calls_per_turn"] == 0.25
+
+    def test_waits_for_full_batch_or_age_and_idle_backend(self):
+        extractor = self.make(max_age=60)
+        extractor.enqueue("preferisco risposte brevi")
+        assert not extractor.ready()  # Batch incompleto e recente
+
+        stale = self.make(max_age=60)
+        stale.queue.ack(1)
+        stale.queue.append({"input": "turno vecchio di ieri", "ts": time.time() - 3600})
+        assert stale.ready()  # Il più vecchio ha superato max_age
+
+        assert not self.make(idle=0.0, max_age=0).ready()  # Chat in corso: si aspetta
+
+    def test_invalid_replies_retried_then_dropped(self):
+        extractor = self.make(max_attempts=2)
+        extractor.enqueue("uso sempre postgres in produzione")
+        self.replies += ["non è JSON", "ancora no"]
+
+        with pytest.raises(ValueError):
+            asyncio.run(extractor.process_batch())
+        assert len(extractor.queue) == 1  # Resta in coda per il prossimo tentativo
+
+        asyncio.run(extractor.process_batch())
+        assert len(extractor.queue) == 0 and extractor.stats["dropped"] == 1
+
+    def test_scheduler_idle_seconds(self):
+        scheduler = LLMScheduler(slots=2)
+
+        async def main():
+            await scheduler.acquire("background")
+            assert scheduler.idle_seconds() > 0  # Il background non rende il backend "occupato"
+            await scheduler.acquire("interactive")
+            assert scheduler.idle_seconds() == 0
+            scheduler.release("interactive")
+            assert scheduler.idle_seconds() < 1
+
+        asyncio.run(main())
+
+
+class TestEngineExtraction:
+    """Test che un turno di chat costi una sola chiamata LLM"""
+
+    def test_chat_enqueues_instead_of_calling(self, monkeypatch, tmp_path):
+        calls = []
+        async def call_llm(messages, temperature=0.3, mode="general", session_id=None):
+            calls.append(messages)
+            return "risposta"
+        extractor = engine.MemoryExtractor(engine.extract_memory_facts, lambda i, f: None, directory=str(tmp_path))
+        monkeypatch.setattr(engine, "call_llm", call_llm)
+        monkeypatch.setattr(engine, "memory", FakeMemory())
+        monkeypatch.setattr(engine, "memory_extractor", extractor)
+        client = TestClient(engine.app)
+
+        client.post("/chat/god-mode", json={"message": "il mio progetto usa Django 5"})
+        client.post("/chat/god-mode", json={"message": "genera il modello", "mode": "factory"})
+
+        assert len(calls) == 2
+        stats = client.get("/memory/stats").json()
+        assert stats["pending"] == 1 and stats["llm_calls"] == 0
+
+    def test_extraction_prompt(self, monkeypatch):
+        payloads = []
+        class FakeClient:
+            async def chat(self, payload, timeout=None):
+                payloads.append(payload)
+                return {"choices": [{"message": {"content": batch_reply((1, "Usa Django 5"))}}]}
+        monkeypatch.setattr(engine, "llm_client", FakeClient())
+        monkeypatch.setattr(engine, "llm_scheduler", engine.LLMScheduler())
+
+        text = asyncio.run(engine.extract_memory_facts([{"input": "uso Django 5"}, {"input": "ciao a tutti"}]))
+        assert parse_facts(text, 2) == [(0, "Usa Django 5")]
+        assert "[1] uso Django 5\n[2] ciao a tutti" in payloads[0]["messages"][0]["content"]
+        assert engine.llm_scheduler.get_stats()["classes"]["background"]["completed"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
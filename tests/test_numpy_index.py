@@ -0,0 +1,154 @@
+import pytest
+import os
+import sys
+import numpy as np
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import numpy_index
+from core import vector_memory
+from core.numpy_index import NumpyCollection
+from core.embeddings import HashingEmbedder
+
+
+def unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+class FakeChromaCollection:
+    """Collection Chroma finta con paginazione limit/offset"""
+
+    def __init__(self, n):
+        self.ids = [f"id{i}" for i in range(n)]
+        self.embeddings = [unit([1.0, float(i), 0.5]) for i in range(n)]
+
+    def get(self, include=None, limit=None, offset=0):
+        end = offset + limit
+        return {
+            "ids": self.ids[offset:end],
+            "documents": [f"FATTO: {i}\nCONTESTO ORIGINALE: x" for i in self.ids[offset:end]],
+            "metadatas": [{"date_iso": "2026-01-01 00:00:00"} for _ in self.ids[offset:end]],
+            "embeddings": np.array(self.embeddings[offset:end]),
+        }
+
+
+class TestNumpyCollection:
+    """Test indice vettoriale NumPy"""
+
+    def test_query_returns_nearest_first(self, tmp_path):
+        index = NumpyCollection(path=str(tmp_path))
+        index.add(documents=["a", "b", "c"], ids=["1", "2", "3"], metadatas=[{}, {}, {}],
+                  embeddings=[unit([1, 0, 0]), unit([0, 1, 0]), unit([1, 1, 0])])
+        result = index.query(query_embeddings=[unit([1, 0.1, 0])], n_results=2)
+        assert result["documents"][0] == ["a", "c"]
+        assert result["distances"][0][0] < result["distances"][0][1]
+
+    def test_l2_distance_matches_chroma_scale(self, tmp_path):
+        """Distanza l2 quadrata: vettori opposti -> 4, identici -> 0 (threshold 1.4 invariato)"""
+        index = NumpyCollection(path=str(tmp_path))
+        index.add(documents=["x", "y"], embeddings=[unit([1, 0]), unit([-1, 0])])
+        result = index.query(query_embeddings=[unit([1, 0])], n_results=2)
+        assert result["distances"][0] == pytest.approx([0.0, 4.0], abs=1e-5)
+
+    def test_cosine_space(self, tmp_path):
+        index = NumpyCollection(path=str(tmp_path), space="cosine")
+        index.add(documents=["x", "y"], embeddings=[[2.0, 0.0], [0.0, 3.0]])
+        result = index.query(query_embeddings=[[1.0, 0.0]], n_results=2)
+        assert result["distances"][0] == pytest.approx([0.0, 1.0], abs=1e-5)
+
+    def test_persistence_and_growth(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(numpy_index, "NUMPY_INITIAL_CAPACITY", 2)
+        index = NumpyCollection(path=str(tmp_path))
+        for i in range(5):
+            index.add(documents=[f"doc{i}"], ids=[str(i)], embeddings=[unit([1.0, float(i)])])
+        assert index.capacity >= 5
+
+        reopened = NumpyCollection(path=str(tmp_path))
+        assert reopened.count() == 5
+        result = reopened.query(query_embeddings=[unit([1.0, 4.0])], n_results=1)
+        assert result["documents"][0] == ["doc4"]
+
+    def test_crash_before_header_keeps_ids_aligned(self, tmp_path):
+        """Test that meta lines written after the last header are dropped on load, not kept behind new rows"""
+        index = NumpyCollection(path=str(tmp_path))
+        index.add(documents=["doc a"], ids=["a"], embeddings=[[1.0, 0.0]])
+        with open(tmp_path / numpy_index.META_FILE, "a", encoding="utf-8") as f:
+            f.write('{"id": "orphan", "document": "orfano", "metadata": {}}\n')  # Crash prima di _write_header
+
+        reopened = NumpyCollection(path=str(tmp_path))
+        reopened.add(documents=["doc b"], ids=["b"], embeddings=[[0.0, 1.0]])
+        assert reopened.ids == ["a", "b"]
+
+        again = NumpyCollection(path=str(tmp_path))
+        assert again.ids == ["a", "b"]
+        assert again.query(query_embeddings=[[0.0, 1.0]], n_results=1)["documents"][0] == ["doc b"]
+
+    def test_get_where_filter(self, tmp_path):
+        index = NumpyCollection(path=str(tmp_path))
+        index.add(documents=["a", "b", "c"], ids=["1", "2", "3"], embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+                  metadatas=[{"fact_hash": "h1"}, {"fact_hash": "h2"}, {}])
+        assert index.get(where={"fact_hash": {"$in": ["h2", "h9"]}})["ids"] == ["2"]
+        assert index.get(where={"fact_hash": "h1"}, include=["embeddings"])["embeddings"].tolist() == [[1.0, 0.0]]
+
+    def test_dimension_mismatch(self, tmp_path):
+        index = NumpyCollection(path=str(tmp_path))
+        index.add(documents=["x"], embeddings=[[1.0, 0.0]])
+        with pytest.raises(ValueError):
+            index.add(documents=["y"], embeddings=[[1.0, 0.0, 0.0]])
+
+    def test_empty_query(self, tmp_path):
+        index = NumpyCollection(path=str(tmp_path))
+        result = index.query(query_embeddings=[[1.0, 0.0]], n_results=3)
+        assert result["documents"] == [[]]
+
+    def test_import_from_chroma(self, tmp_path):
+        index = NumpyCollection(path=str(tmp_path))
+        source = FakeChromaCollection(7)
+        assert index.import_from_chroma(source, batch_size=3) == 7
+        assert index.import_from_chroma(source, batch_size=3) == 0  # già importati
+        assert index.count() == 7
+        assert index.embedder_name == "all-MiniLM-L6-v2"
+
+    def test_explicit_embeddings_keep_embedder_name_unset(self, tmp_path):
+        """Test that vectors passed explicitly are not attributed to the attached embedder"""
+        index = NumpyCollection(path=str(tmp_path), embedder=HashingEmbedder(dim=3))
+        index.add(documents=["x"], embeddings=[[1.0, 0.0, 0.0]])
+        assert index.embedder_name is None
+
+        index = NumpyCollection(path=str(tmp_path / "computed"), embedder=HashingEmbedder(dim=3))
+        index.add(documents=["x"])
+        assert index.embedder_name == "hashing-3"
+
+    def test_import_refused_for_other_embedder(self, tmp_path):
+        """Test that Chroma vectors from another model are not mixed with the attached embedder"""
+        index = NumpyCollection(path=str(tmp_path), embedder=HashingEmbedder(dim=3))
+        with pytest.raises(ValueError):
+            index.import_from_chroma(FakeChromaCollection(3))
+        assert index.count() == 0
+
+        assert index.import_from_chroma(FakeChromaCollection(3), embedder_name="hashing-3") == 3
+        assert NumpyCollection(path=str(tmp_path)).embedder_name == "hashing-3"
+
+
+class TestVectorMemoryNumpyBackend:
+    """Test VectorMemory sopra l'indice NumPy (nessun servizio esterno)"""
+
+    def test_save_and_search(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(vector_memory, "NUMPY_MEMORY_PATH", str(tmp_path))
+        memory = vector_memory.VectorMemory(backend="numpy", embedder=HashingEmbedder(), flush_size=1,
+                                            flush_interval=60)
+        memory.save("parlo sempre in italiano", "L'utente preferisce risposte in italiano")
+        memory.save("uso docker compose", "Il deploy usa docker compose con rete host")
+
+        context = memory.search("risposte in italiano", threshold=1.4)
+        assert "italiano" in context.split("---")[2]
+
+        nothing = memory.search("risposte in italiano", threshold=0.0)
+        assert "Filtro Qualità" in nothing
+        memory.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
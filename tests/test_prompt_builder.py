@@ -0,0 +1,144 @@
+import pytest
+import os
+import sys
+import json
+import asyncio
+import httpx
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import engine
+from core.llm_client import LLMClient
+from core.prompt_builder import PromptBuilder, static_system_prompt, CONTEXT_HEADER
+
+
+class FakeMemory:
+    """Memoria vettoriale finta: contesto diverso a ogni ricerca"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query):
+        self.calls += 1
+        return f"ricordo numero {self.calls} su {query}"
+
+
+class TestPromptBuilder:
+    """Test ordine dei messaggi, hint per llama.cpp e statistiche di prefill"""
+
+    def test_summary_after_static_part_and_context_last(self):
+        builder = PromptBuilder()
+        history = [{"role": "system", "content": "RIASSUNTO: x"}, {"role": "user", "content": "prima"}]
+        messages = builder.assemble("STATICO", history, "domanda", context="memoria")
+
+        assert messages[0] == {"role": "system", "content": "STATICO\n\nRIASSUNTO: x"}
+        assert messages[1] == {"role": "user", "content": "prima"}
+        assert messages[-1]["content"].startswith(CONTEXT_HEADER)
+        assert messages[-1]["content"].endswith("domanda")
+        assert builder.assemble("STATICO", [], "domanda")[-1]["content"] == "domanda"
+
+    def test_request_options(self):
+        assert PromptBuilder(prompt_cache="off").request_options("s1") == {}
+        assert PromptBuilder(slots=0).request_options("s1") == {"cache_prompt": True}
+
+        builder = PromptBuilder(slots=4)
+        slot = builder.request_options("s1")["id_slot"]
+        assert 0 <= slot < 4
+        assert all(builder.request_options("s1")["id_slot"] == slot for _ in range(3))
+
+    def test_record_usage_llama_cpp_and_openai(self):
+        builder = PromptBuilder()
+        builder.record_usage({"usage": {"prompt_tokens": 1000}, "timings": {"prompt_n": 100, "cache_n": 900}})
+        builder.record_usage({"usage": {"prompt_tokens": 500, "prompt_tokens_details": {"cached_tokens": 400}}})
+        builder.record_usage({"choices": []})  # Backend senza usage: ignorato
+
+        stats = builder.get_stats()
+        assert stats["reported"] == 2
+        assert stats["prompt_tokens"] == 1500
+        assert stats["prefill_tokens"] == 200
+        assert stats["cached_tokens"] == 1300
+
+    def test_track_estimates_reused_prefix(self):
+        builder = PromptBuilder()
+        turn = [{"role": "system", "content": "S" * 4000}, {"role": "user", "content": "uno"}]
+        builder.track("s1", turn)
+        builder.track("s1", turn[:1] + [{"role": "user", "content": "due"}])
+
+        stats = builder.get_stats()
+        assert stats["estimated_reused_tokens"] >= 1000
+        assert 0.4 < stats["estimated_reuse_ratio"] <= 0.5  # Il primo prompt non riusa nulla
+
+
+class TestEnginePrefix:
+    """Test che il system prompt dell'engine non cambi tra richieste con contesto diverso"""
+
+    def test_system_prompt_is_static(self, monkeypatch):
+        monkeypatch.setattr(engine, "memory", FakeMemory())
+        first, _, _ = asyncio.run(engine.build_chat_messages(engine.ChatRequest(message="ciao")))
+        second, _, _ = asyncio.run(engine.build_chat_messages(engine.ChatRequest(message="altro")))
+
+        assert first[0] == second[0]
+        assert "ricordo" not in first[0]["content"]
+        assert str(list(engine.AVAILABLE_TOOLS.keys())) in first[0]["content"]
+        assert "ricordo numero 2 su altro" in second[-1]["content"]
+
+    def test_factory_prompt(self):
+        messages, temp, _ = asyncio.run(engine.build_chat_messages(engine.ChatRequest(message="task", mode="factory")))
+        assert messages[0]["content"] == static_system_prompt(engine.FACTORY_PERSONA, engine.AVAILABLE_TOOLS.keys())
+        assert messages[-1] == {"role": "user", "content": "task"}
+
+
+class TestOptionalFields:
+    """Test LLMClient: campi llama.cpp tolti se il backend li rifiuta"""
+
+    def run(self, client, coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await client.close()
+        return asyncio.run(main())
+
+    def test_rejected_fields_are_dropped_once(self):
+        bodies = []
+        def handler(request):
+            body = json.loads(request.content)
+            bodies.append(body)
+            if "cache_prompt" in body:
+                return httpx.Response(400, json={"error": "unknown field cache_prompt"})
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+        client = LLMClient("http://llm.test/v1/chat/completions", transport=httpx.MockTransport(handler))
+        payload = {"messages": [], "cache_prompt": True, "id_slot": 1}
+        data = self.run(client, client.chat(payload))
+        self.run(client, client.chat(payload))
+
+        assert data["choices"][0]["message"]["content"] == "ok"
+        assert client.unsupported_fields == {"cache_prompt", "id_slot"}
+        assert len(bodies) == 3 and "id_slot" not in bodies[2]
+
+    def test_other_errors_still_raise(self):
+        client = LLMClient("http://llm.test/v1/chat/completions",
+                           transport=httpx.MockTransport(lambda r: httpx.Response(500)))
+        with pytest.raises(httpx.HTTPStatusError):
+            self.run(client, client.chat({"messages": [], "cache_prompt": True}))
+        assert client.unsupported_fields == set()
+
+    def test_stream_reports_usage(self):
+        chunks = [{"choices": [{"delta": {"content": "ciao"}}]},
+                  {"choices": [], "usage": {"prompt_tokens": 50}, "timings": {"prompt_n": 5, "cache_n": 45}}]
+        body = "".join(f"data: {json.dumps(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+        client = LLMClient("http://llm.test/v1/chat/completions",
+                           transport=httpx.MockTransport(lambda r: httpx.Response(200, text=body)))
+        builder = PromptBuilder()
+
+        async def collect():
+            return [d async for d in client.stream_chat({"messages": []}, on_usage=builder.record_usage)]
+
+        assert self.run(client, collect()) == ["ciao"]
+        assert builder.get_stats()["cached_tokens"] == 45
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
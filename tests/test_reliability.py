@@ -9,13 +9,19 @@ import shutil
 # Add parent directory to path to import modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import hub
 from hub import (
     extract_json_from_reasoning, 
     sanitize_filenames,
     validate_requirements,
     save_build_state,
-    load_build_state
+    load_build_state,
+    sh_phase_construction,
+    infer_dependencies,
+    parse_dependency_graph,
+    topological_waves
 )
+from core.code_analysis import extract_public_signatures
 
 
 class TestRobustJSONParser:
@@ -415,5 +421,144 @@ def main()
         assert syntax_valid is False
 
 
+class TestParallelConstruction:
+    """Test parallel file generation in the construction phase"""
+    
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def fake_call_ai(self, delay):
+        def call_ai(message, history=[], system_context="", mode="general", silent=False, stream=False):
+            time.sleep(delay)
+            return "<think>ok</think>```python\nimport os\n\ndef main():\n    print('ok')\n```"
+        return call_ai
+    
+    def fake_run_tool(self, delay):
+        def run_tool_direct(tool_name, query="", args=None, timeout=120):
+            time.sleep(delay)
+            return {"tool": tool_name, "ok": True, "exit_code": None, "stdout": "Nessun risultato.", "stderr": "", "duration": delay}
+        return run_tool_direct
+    
+    def test_files_generated_in_parallel(self, monkeypatch):
+        """Test that wall-clock time scales with the worker count"""
+        monkeypatch.setattr(hub, "call_ai", self.fake_call_ai(0.2))
+        monkeypatch.setattr(hub, "run_tool_direct", self.fake_run_tool(0.2))
+        files = ["main.py", "scraper.py", "notifier.py", "parser.py", "requirements.txt"]
+        
+        start = time.time()
+        assert sh_phase_construction(self.temp_dir, files, "test", workers=4) is True
+        elapsed = time.time() - start
+        
+        # 4 files x (search + generation) x 0.2s = 1.6s sequential; 2 waves (modules, then main.py) = 0.8s
+        assert elapsed < 1.2
+        for f in ["main.py", "scraper.py", "notifier.py", "parser.py"]:
+            assert os.path.exists(os.path.join(self.temp_dir, f))
+    
+    def test_checkpoint_lists_all_completed_files(self, monkeypatch):
+        """Test that .build_state.json stays consistent under concurrency"""
+        monkeypatch.setattr(hub, "call_ai", self.fake_call_ai(0.05))
+        monkeypatch.setattr(hub, "run_tool_direct", self.fake_run_tool(0))
+        files = ["main.py", "a.py", "b.py", "c.py", "requirements.txt"]
+        
+        sh_phase_construction(self.temp_dir, files, "test", workers=3)
+        state = load_build_state(self.temp_dir)
+        
+        assert state['phase'] == 'construction_in_progress'
+        assert sorted(state['completed_files']) == ["a.py", "b.py", "c.py", "main.py"]
+    
+    def test_resume_skips_completed_files(self, monkeypatch):
+        """Test that resumed builds only generate missing files"""
+        calls = []
+        fake = self.fake_call_ai(0)
+        def call_ai(message, *args, **kwargs):
+            calls.append(message)
+            return fake(message, *args, **kwargs)
+        monkeypatch.setattr(hub, "call_ai", call_ai)
+        monkeypatch.setattr(hub, "run_tool_direct", self.fake_run_tool(0))
+        
+        existing = {'completed_files': ["main.py", "a.py"]}
+        sh_phase_construction(self.temp_dir, ["main.py", "a.py", "b.py"], "test", existing, workers=2)
+        
+        assert not os.path.exists(os.path.join(self.temp_dir, "main.py"))
+        assert os.path.exists(os.path.join(self.temp_dir, "b.py"))
+        assert all("main.py" not in c for c in calls)
+
+class TestDependencyScheduling:
+    """Test dependency-aware ordering of blueprint files"""
+    
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+    
+    def test_infer_dependencies(self):
+        """Test name heuristics: config first, then foundations, then main.py last"""
+        graph = infer_dependencies(["main.py", "config.py", "utils.py", "scraper.py", "requirements.txt"])
+        
+        assert graph["config.py"] == []
+        assert graph["utils.py"] == ["config.py"]
+        assert sorted(graph["scraper.py"]) == ["config.py", "utils.py"]
+        assert sorted(graph["main.py"]) == ["config.py", "scraper.py", "utils.py"]
+        assert "requirements.txt" not in graph
+    
+    def test_topological_waves(self):
+        """Test that every wave only depends on earlier waves"""
+        graph = {"main.py": ["a.py", "b.py"], "a.py": ["c.py"], "b.py": [], "c.py": []}
+        assert topological_waves(graph) == [["b.py", "c.py"], ["a.py"], ["main.py"]]
+    
+    def test_topological_waves_cycle(self):
+        """Test that a cycle ends up in one final wave instead of looping forever"""
+        graph = {"a.py": ["b.py"], "b.py": ["a.py"], "c.py": []}
+        assert topological_waves(graph) == [["c.py"], ["a.py", "b.py"]]
+    
+    def test_parse_dependency_graph(self):
+        """Test LLM graph parsing keeps only known .py files"""
+        text = '<think>...</think>```json\n{"main.py": ["db.py", "ghost.py"], "db.py": []}\n```'
+        graph = parse_dependency_graph(text, ["main.py", "db.py"])
+        assert graph == {"main.py": ["db.py"], "db.py": []}
+        assert parse_dependency_graph("nessun json", ["main.py"]) is None
+    
+    def test_extract_public_signatures(self):
+        """Test that only the public interface is extracted"""
+        source = (
+            "API_URL = 'x'\n"
+            "def fetch(url, timeout=10):\n    \"\"\"Scarica la pagina\"\"\"\n    pass\n"
+            "def _private():\n    pass\n"
+            "class Store(Base):\n    def __init__(self, path):\n        pass\n"
+            "    def save(self, item):\n        pass\n    def _flush(self):\n        pass\n"
+        )
+        signatures = extract_public_signatures(source)
+        
+        assert "API_URL = ..." in signatures
+        assert "def fetch(url, timeout=10)  # Scarica la pagina" in signatures
+        assert "class Store(Base):" in signatures
+        assert "def save(self, item)" in signatures
+        assert "_private" not in signatures and "_flush" not in signatures
+        assert extract_public_signatures("def broken(:") == ""
+    
+    def test_dependencies_generated_first_with_interfaces(self, monkeypatch):
+        """Test that main.py is generated after its imports and sees their signatures"""
+        prompts = {}
+        def call_ai(message, history=[], system_context="", mode="general", silent=False, stream=False):
+            for name in ["main.py", "db.py"]:
+                if f"'{name}'" in message:
+                    prompts[name] = message
+            if "'db.py'" in message:
+                return "```python\ndef get_connection(path):\n    return path\n```"
+            return "```python\nimport db\n\ndef main():\n    db.get_connection('x')\n```"
+        monkeypatch.setattr(hub, "call_ai", call_ai)
+        monkeypatch.setattr(hub, "run_tool_direct", lambda *a, **k: {"ok": False, "error": "offline"})
+        
+        assert sh_phase_construction(self.temp_dir, ["main.py", "db.py"], "test", workers=2) is True
+        
+        assert "def get_connection(path)" in prompts["main.py"]
+        assert "def get_connection" not in prompts["db.py"]
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,246 @@
+import pytest
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import shutil
+import httpx
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import tools
+from core.research import (ResearchClient, PageCache, extract_main_text, make_stub_transport,
+                           run_sync, chunk_text, BRAVE_SEARCH_URL)
+from core.embeddings import HashingEmbedder
+
+ARTICLE = """<html><head><title>Guida SSE</title><script>var x = 1;</script></head>
+<body><nav>Home | Blog</nav><article><h1>Server-Sent Events</h1>
+<p>Con FastAPI si usa StreamingResponse.</p></article><footer>Copyright</footer></body></html>"""
+
+
+class TestExtractMainText:
+    """Test estrazione testo principale con lxml"""
+
+    def test_boilerplate_removed(self):
+        title, text = extract_main_text(ARTICLE)
+        assert title == "Guida SSE"
+        assert text == "Server-Sent Events\nCon FastAPI si usa StreamingResponse."
+
+    def test_empty_or_broken_html(self):
+        assert extract_main_text("") == ("", "")
+        assert extract_main_text(b"<?xml version='1.0' encoding='utf-8'?><html><body>ok</body></html>")[1] == "ok"
+
+
+class TestResearchClient:
+    """Test pipeline di ricerca con transport locale (nessuna rete)"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.requests = []
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make_client(self, pages, search_results=None, ttl=3600, per_host=2):
+        stub = make_stub_transport(pages, search_results)
+        def handler(request):
+            self.requests.append(request)
+            return stub.handle_request(request)
+        return ResearchClient(cache=PageCache(self.temp_dir, ttl=ttl), per_host=per_host,
+                              transport=httpx.MockTransport(handler), api_key="test")
+
+    def page_requests(self):
+        return [r for r in self.requests if not str(r.url).startswith(BRAVE_SEARCH_URL)]
+
+    def test_fresh_cache_skips_network(self):
+        client = self.make_client({"https://a.it/doc": ARTICLE})
+        first = asyncio.run(client.fetch_page("https://a.it/doc"))
+        second = asyncio.run(client.fetch_page("https://a.it/doc"))
+
+        assert first["cached"] is False and second["cached"] is True
+        assert second["text"] == first["text"]
+        assert len(self.page_requests()) == 1
+
+    def test_stale_cache_revalidated_with_etag(self):
+        """Test che una pagina scaduta venga rivalidata (304) senza riscaricarla"""
+        url = "https://a.it/doc"
+        client = self.make_client({url: (200, {"ETag": '"v1"'}, ARTICLE)}, ttl=0)
+        asyncio.run(client.fetch_page(url))
+        page = asyncio.run(client.fetch_page(url))
+
+        assert self.page_requests()[-1].headers["if-none-match"] == '"v1"'
+        assert page["cached"] is True and "StreamingResponse" in page["text"]
+        assert client.stats["revalidated"] == 1
+
+    def test_errors_are_reported(self):
+        client = self.make_client({})
+        page = asyncio.run(client.fetch_page("https://a.it/missing"))
+        assert page["error"] == "Status code 404" and page["text"] == ""
+
+    def test_research_fetches_top_pages_concurrently(self):
+        """Test download concorrente dei primi N risultati, con limite per host"""
+        urls = [f"https://site{i}.it/" for i in range(3)]
+        pages = {u: f"<html><body><p>pagina {u}</p></body></html>" for u in urls}
+        stub = make_stub_transport(pages, [{"title": f"T{i}", "url": u} for i, u in enumerate(urls)])
+
+        class SlowTransport(httpx.AsyncBaseTransport):
+            async def handle_async_request(self, request):
+                if not str(request.url).startswith(BRAVE_SEARCH_URL):
+                    await asyncio.sleep(0.2)
+                return stub.handle_request(request)
+
+        client = ResearchClient(cache=PageCache(self.temp_dir), transport=SlowTransport(), api_key="test")
+        start = time.time()
+        results = asyncio.run(client.research("fastapi", top_n=3))
+
+        assert time.time() - start < 0.5
+        assert [r["page"]["text"] for r in results] == [f"pagina {u}" for u in urls]
+
+    def test_per_host_limit(self):
+        active, peak = [0], [0]
+
+        class CountingTransport(httpx.AsyncBaseTransport):
+            async def handle_async_request(self, request):
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                await asyncio.sleep(0.05)
+                active[0] -= 1
+                return httpx.Response(200, text="<p>ok</p>")
+
+        client = ResearchClient(cache=PageCache(self.temp_dir), per_host=2, transport=CountingTransport())
+        async def fetch_all():
+            return await asyncio.gather(*(client.fetch_page(f"https://a.it/{i}") for i in range(6)))
+        asyncio.run(fetch_all())
+
+        assert peak[0] == 2
+
+    def test_missing_api_key(self, monkeypatch):
+        monkeypatch.delenv("BRAVE_API_KEY", raising=False)
+        client = ResearchClient(cache=PageCache(self.temp_dir), transport=make_stub_transport({}))
+        with pytest.raises(ValueError):
+            asyncio.run(client.search("x"))
+
+
+class TestResearchTools:
+    """Test web_search/read_url sopra la pipeline (formato output invariato)"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def use_stub(self, monkeypatch, pages, search_results=None):
+        client = ResearchClient(cache=PageCache(self.temp_dir), api_key="test",
+                                transport=make_stub_transport(pages, search_results))
+        monkeypatch.setattr(tools, "research_client", client)
+        return client
+
+    def test_read_url(self, monkeypatch):
+        self.use_stub(monkeypatch, {"https://a.it/doc": ARTICLE})
+        result = tools.read_url("https://a.it/doc")
+        assert result.startswith("--- CONTENUTO URL: https://a.it/doc ---\nServer-Sent Events")
+        assert "Copyright" not in result
+        assert tools.read_url("https://a.it/altro") == "Errore: Status code 404"
+
+    def test_web_search_includes_page_excerpts(self, monkeypatch):
+        self.use_stub(monkeypatch, {"https://a.it/doc": ARTICLE},
+                      [{"title": "Guida SSE", "url": "https://a.it/doc"}])
+        result = tools.web_search("sse")
+        assert result.startswith("--- RISULTATI WEB PER: 'sse' ---\n- Guida SSE: https://a.it/doc\n")
+        assert "> Server-Sent Events Con FastAPI" in result
+
+    def test_web_search_no_results(self, monkeypatch):
+        self.use_stub(monkeypatch, {}, [])
+        assert tools.web_search("niente") == "Nessun risultato."
+
+    def test_run_sync_reuses_client(self, monkeypatch):
+        """Test che il pool HTTP sopravviva tra due chiamate sincrone"""
+        client = self.use_stub(monkeypatch, {"https://a.it/1": "<p>1</p>", "https://a.it/2": "<p>2</p>"})
+        run_sync(client.fetch_page("https://a.it/1"))
+        first = client._client
+        run_sync(client.fetch_page("https://a.it/2"))
+        assert client._client is first
+
+
+class TestChunkRetrieval:
+    """Test chunking della pagina e retrieval dei chunk rilevanti"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        sections = {
+            "installazione": "Per installare il pacchetto usa pip install quantum.",
+            "autenticazione": "Il token di autenticazione va passato nell'header Authorization.",
+            "paginazione": "La paginazione usa i parametri page e per_page.",
+        }
+        body = "".join(f"<p>{(text + ' ') * 12}</p>" for text in sections.values())
+        self.url = "https://docs.it/api"
+        self.pages = {self.url: f"<html><body><article>{body}</article></body></html>"}
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make_client(self, embedder):
+        return ResearchClient(cache=PageCache(self.temp_dir), transport=make_stub_transport(self.pages),
+                              embedder=embedder)
+
+    def test_chunks_respect_size_and_overlap(self):
+        text = "\n".join(f"riga {i} " + "x" * 80 for i in range(30))
+        chunks = chunk_text(text, size=300, overlap=100)
+
+        assert all(len(c) <= 300 for c in chunks)
+        assert "\n".join(dict.fromkeys(l for c in chunks for l in c.splitlines())) == text
+        for previous, current in zip(chunks, chunks[1:]):
+            assert current.splitlines()[0] in previous.splitlines()
+
+    def test_long_line_is_split(self):
+        chunks = chunk_text("a" * 1000, size=300, overlap=50)
+        assert all(len(c) <= 300 for c in chunks)
+        assert "".join(c[50:] if i else c for i, c in enumerate(chunks)) == "a" * 1000
+
+    def test_top_chunk_matches_query(self):
+        client = self.make_client(HashingEmbedder())
+        page = asyncio.run(client.relevant_chunks(self.url, "header Authorization token", top_k=1))
+
+        assert page["total_chunks"] > 1
+        assert "Authorization" in page["chunks"][0]["text"]
+
+    def test_chunks_cached_per_url(self):
+        """Test che una seconda domanda sulla stessa pagina non rifaccia fetch né embedding"""
+        embedder = HashingEmbedder()
+        embedded = []
+        original = embedder.embed
+        embedder.embed = lambda texts: embedded.extend(texts) or original(texts)
+
+        client = self.make_client(embedder)
+        asyncio.run(client.relevant_chunks(self.url, "installare"))
+        chunk_count = len(embedded)
+        restarted = self.make_client(embedder)
+        asyncio.run(restarted.relevant_chunks(self.url, "paginazione"))
+
+        assert len(embedded) == chunk_count
+        assert restarted.stats["cache_hits"] == 1 and restarted.stats["chunk_hits"] == 1
+
+    def test_read_url_with_query(self, monkeypatch):
+        monkeypatch.setattr(tools, "research_client", self.make_client(HashingEmbedder()))
+        monkeypatch.setattr(tools, "RESEARCH_TOP_K", 1)
+        result = tools.read_url(self.url, "parametri page per_page")
+
+        assert result.startswith(f"--- CONTENUTO URL: {self.url} (sezioni rilevanti per: 'parametri page per_page') ---")
+        assert "per_page" in result and "Authorization" not in result
+
+    def test_engine_splits_url_and_question(self, monkeypatch):
+        from core import engine
+        calls = []
+        monkeypatch.setitem(engine.AVAILABLE_TOOLS, "read_url", lambda url, query="": calls.append((url, query)) or "ok")
+        engine.run_tool("read_url", "https://docs.it/api | come si pagina?")
+        assert calls == [("https://docs.it/api", "come si pagina?")]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
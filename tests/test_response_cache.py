@@ -0,0 +1,107 @@
+import pytest
+import os
+import sys
+import time
+import asyncio
+import httpx
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import engine
+from core.response_cache import ResponseCache, make_cache_key
+from core.llm_client import LLMClient
+
+
+MESSAGES = [{"role": "system", "content": "SEI UN SISTEMISTA."}, {"role": "user", "content": "Crea venv"}]
+
+
+class TestCacheKey:
+    """Test chiave normalizzata"""
+
+    def test_whitespace_is_normalized(self):
+        indented = [{"role": "system", "content": "\n        SEI UN   SISTEMISTA.\n    "},
+                    {"role": "user", "content": "Crea venv"}]
+        assert make_cache_key(MESSAGES, 0.05, "factory", "m") == make_cache_key(indented, 0.05, "factory", "m")
+
+    def test_mode_temperature_model_change_key(self):
+        base = make_cache_key(MESSAGES, 0.05, "factory", "m")
+        assert base != make_cache_key(MESSAGES, 0.1, "factory", "m")
+        assert base != make_cache_key(MESSAGES, 0.05, "general", "m")
+        assert base != make_cache_key(MESSAGES, 0.05, "factory", "altro")
+
+
+class TestResponseCache:
+    """Test cache in-process: TTL, LRU, bypass, contatori"""
+
+    def test_hit_and_miss_counters(self):
+        cache = ResponseCache(backend="memory")
+        assert cache.get("k") is None
+        cache.set("k", "risposta")
+        assert cache.get("k") == "risposta"
+        stats = cache.get_stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["backend"] == "memory"
+
+    def test_ttl_expiration(self):
+        cache = ResponseCache(backend="memory", ttl=0)
+        cache.set("k", "risposta")
+        time.sleep(0.01)
+        assert cache.get("k") is None
+        assert cache.get_stats()["expired"] == 1
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(backend="memory", max_entries=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        cache.get("a")           # 'a' diventa il più recente
+        cache.set("c", "3")      # evict 'b'
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_temperature_bypass(self):
+        cache = ResponseCache(backend="memory", max_temperature=0.2)
+        assert cache.key_for(MESSAGES, 0.4, "general", "m") is None
+        assert cache.key_for(MESSAGES, 0.05, "factory", "m") is not None
+        assert cache.get_stats()["bypassed"] == 1
+
+    def test_disabled_cache(self):
+        cache = ResponseCache(backend="off")
+        assert cache.key_for(MESSAGES, 0.0, "factory", "m") is None
+
+
+class TestCallLLMCache:
+    """Test integrazione cache in call_llm"""
+
+    def test_repeated_prompt_hits_cache(self, monkeypatch):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "APPROVED"}}]})
+
+        monkeypatch.setattr(engine, "llm_client", LLMClient("http://llm.test/v1", transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(engine, "response_cache", ResponseCache(backend="memory"))
+
+        async def run():
+            first = await engine.call_llm(MESSAGES, temperature=0.05, mode="factory")
+            second = await engine.call_llm(MESSAGES, temperature=0.05, mode="factory")
+            return first, second
+
+        assert asyncio.run(run()) == ("APPROVED", "APPROVED")
+        assert len(calls) == 1
+
+    def test_errors_are_not_cached(self, monkeypatch):
+        transport = httpx.MockTransport(lambda request: httpx.Response(500))
+        monkeypatch.setattr(engine, "llm_client", LLMClient("http://llm.test/v1", transport=transport))
+        monkeypatch.setattr(engine, "response_cache", ResponseCache(backend="memory"))
+
+        result = asyncio.run(engine.call_llm(MESSAGES, temperature=0.05, mode="factory"))
+        assert result.startswith("Errore LLM")
+        assert engine.response_cache.get_stats()["entries"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,101 @@
+import pytest
+import os
+import sys
+import json
+import tempfile
+import shutil
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import hub
+from core.session_store import SessionStore
+
+
+def turn(i):
+    return [{"role": "user", "content": f"domanda {i}"}, {"role": "assistant", "content": f"risposta {i}"}]
+
+
+class TestSessionStore:
+    """Test storico conversazioni su log append-only"""
+
+    def setup_method(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = SessionStore(self.temp_dir, compact_after=20, keep=6)
+
+    def teardown_method(self):
+        if os.path.exists(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def path(self, ext):
+        return os.path.join(self.temp_dir, f"chat{ext}")
+
+    def test_append_and_tail(self):
+        for i in range(5):
+            self.store.append("chat", *turn(i))
+        assert self.store.tail("chat", 3) == [turn(3)[1]] + turn(4)
+        assert self.store.tail("chat", 100)[0] == turn(0)[0]
+        assert self.store.tail("nuova", 5) == []
+
+    def test_append_does_not_rewrite_log(self):
+        """Test che ogni turno sia un append: i byte già scritti non cambiano"""
+        self.store.append("chat", *turn(0))
+        with open(self.path(".jsonl"), "rb") as f:
+            before = f.read()
+        self.store.append("chat", *turn(1))
+        with open(self.path(".jsonl"), "rb") as f:
+            assert f.read().startswith(before)
+
+    def test_compaction_archives_old_messages(self):
+        for i in range(15):
+            self.store.append("chat", *turn(i))
+
+        assert self.store.count("chat") == 30
+        assert self.store.tail("chat", 2) == turn(14)
+        with open(self.path(".jsonl")) as f:
+            assert sum(1 for _ in f) < 20
+        assert self.store.search("chat", "risposta 0") == [turn(10)[1], turn(0)[1]]  # Archivio incluso
+
+    def test_search_most_recent_first(self):
+        for i in range(3):
+            self.store.append("chat", {"role": "user", "content": f"prezzo bitcoin giorno {i}"})
+        results = self.store.search("chat", "Bitcoin prezzo", limit=2)
+        assert [r["content"] for r in results] == ["prezzo bitcoin giorno 2", "prezzo bitcoin giorno 1"]
+
+    def test_reopen_and_torn_write_recovery(self):
+        """Test che un indice non aggiornato (crash a metà append) venga ricostruito"""
+        for i in range(3):
+            self.store.append("chat", *turn(i))
+        with open(self.path(".jsonl"), "ab") as f:
+            f.write(b'{"role": "user", "content": "sc')  # Riga troncata
+
+        reopened = SessionStore(self.temp_dir, compact_after=20, keep=6)
+        assert reopened.tail("chat", 2) == turn(2)
+        reopened.append("chat", *turn(3))
+        assert SessionStore(self.temp_dir).tail("chat", 4) == turn(2) + turn(3)
+
+    def test_legacy_json_imported(self):
+        with open(self.path(".json"), "w") as f:
+            json.dump(turn(0) + turn(1), f, indent=2)
+        assert self.store.tail("chat", 10) == turn(0) + turn(1)
+        assert self.store.count("chat") == 4
+
+
+class TestHubSessions:
+    """Test load_session/append_session di hub.py"""
+
+    def test_hub_uses_tail(self, monkeypatch):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            monkeypatch.setattr(hub, "session_store", SessionStore(temp_dir))
+            for i in range(hub.MAX_HISTORY_LENGTH):
+                hub.append_session("general_brain", *turn(i))
+            history = hub.load_session("general_brain")
+            assert len(history) == hub.MAX_HISTORY_LENGTH
+            assert history[-2:] == turn(hub.MAX_HISTORY_LENGTH - 1)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,104 @@
+import pytest
+import os
+import sys
+import json
+import httpx
+from fastapi.testclient import TestClient
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import engine
+from core.engine import ThinkTagFilter, clean_think_tags
+from core.llm_client import LLMClient
+
+
+def run_filter(chunks):
+    f = ThinkTagFilter()
+    return "".join(f.feed(c) for c in chunks) + f.flush()
+
+
+def sse_body(deltas):
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': d}}]})}\n\n" for d in deltas]
+    return "".join(lines) + "data: [DONE]\n\n"
+
+
+class TestThinkTagFilter:
+    """Test filtro streaming dei <think> tags"""
+
+    def test_single_chunk(self):
+        text = "<think>ragiono...</think>Risposta finale"
+        assert run_filter([text]) == "Risposta finale"
+
+    def test_tag_split_across_chunks(self):
+        """Test tag spezzato tra più delta"""
+        chunks = ["<th", "ink>segreto</thi", "nk>\n\nCiao ", "mondo"]
+        assert run_filter(chunks) == "Ciao mondo"
+
+    def test_matches_clean_think_tags_char_by_char(self):
+        """Test che il filtro dia lo stesso risultato della regex anche carattere per carattere"""
+        text = "<think>a < b</think>Prima parte <think>altro</think> seconda < parte"
+        assert run_filter(list(text)) == clean_think_tags(text)
+
+    def test_no_think_tags(self):
+        assert run_filter(["Solo ", "testo"]) == "Solo testo"
+
+    def test_unclosed_think_is_hidden(self):
+        assert run_filter(["Visibile <think>ragionamento infinito"]) == "Visibile "
+
+
+class TestStreamEndpoint:
+    """Test endpoint SSE /chat/god-mode/stream"""
+
+    def test_stream_forwards_visible_deltas(self, monkeypatch):
+        deltas = ["<think>", "pensiero", "</think>", "Ciao", " CEO"]
+        transport = httpx.MockTransport(
+            lambda request: httpx.Response(200, text=sse_body(deltas),
+                                           headers={"content-type": "text/event-stream"})
+        )
+        monkeypatch.setattr(engine, "llm_client", LLMClient("http://llm.test/v1", transport=transport))
+        monkeypatch.setattr(engine, "memory", None)
+
+        client = TestClient(engine.app)
+        resp = client.post("/chat/god-mode/stream", json={"message": "ciao", "mode": "factory"})
+
+        events = [json.loads(line[5:]) for line in resp.text.splitlines() if line.startswith("data:")]
+        text = "".join(e.get("delta", "") for e in events)
+        assert text == "Ciao CEO"
+        assert events[-1]["done"] is True
+        assert events[-1]["tool_used"] is None
+
+    def test_tool_directives_not_streamed(self, monkeypatch):
+        """Test that a tool round followed by a final round streams no [TOOL: directive and saves the final round"""
+        rounds = [["<think>cerco</think>Controllo ", "online. [TO", 'OL: web_search, query: "meteo roma"]', " fine"],
+                  ["<think>ok</think>A Roma ", "c'è sole."]]
+        async def stream_llm(messages, temperature=0.3, mode="general", session_id=None):
+            for delta in rounds.pop(0):
+                yield delta
+        async def run_tools(commands):
+            return ["sole, 25 gradi"]
+        monkeypatch.setattr(engine, "stream_llm", stream_llm)
+        monkeypatch.setattr(engine, "run_tools", run_tools)
+        monkeypatch.setattr(engine, "memory", None)
+        monkeypatch.setattr(engine, "chat_sessions", engine.ChatSessions(backend="memory"))
+
+        client = TestClient(engine.app)
+        resp = client.post("/chat/god-mode/stream", json={"message": "meteo?", "session_id": "meteo"})
+        events = [json.loads(line[5:]) for line in resp.text.splitlines() if line.startswith("data:")]
+
+        deltas = [e["delta"] for e in events if "delta" in e]
+        assert not any("[TO" in d for d in deltas)
+        tool_at = next(i for i, e in enumerate(events) if "tool" in e)
+        final = "".join(e.get("delta", "") for e in events[tool_at:])
+        assert final == "A Roma c'è sole."
+        assert engine.chat_sessions.get("meteo")[-1]["content"] == final
+        assert events[-1]["tools_used"] == ["web_search"]
+
+    def test_directive_filter_holds_partial_marker(self):
+        f = engine.ToolDirectiveFilter()
+        out = f.feed("Vedi [") + f.feed("1] e [TO") + f.feed("OL: x]") + f.feed(" altro") + f.flush()
+        assert out == "Vedi [1] e "
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
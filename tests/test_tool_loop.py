@@ -0,0 +1,140 @@
+import pytest
+import os
+import sys
+import time
+import asyncio
+import threading
+from fastapi.testclient import TestClient
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import engine
+from core.engine import extract_tool_commands, extract_tool_command, run_tools
+
+
+class TestExtractToolCommands:
+    """Test estrazione di tutte le direttive [TOOL: ...]"""
+
+    def test_all_formats_in_order(self):
+        text = (
+            'Prima cerco. [TOOL: web_search, query: "fastapi sse"]\n'
+            '[TOOL: read_url]\n{"query": "https://example.com"}\n'
+            '[TOOL: terminal_run]\n{"command": "ls"}'
+        )
+        assert extract_tool_commands(text) == [
+            ("web_search", "fastapi sse"),
+            ("read_url", "https://example.com"),
+            ("terminal_run", "ls"),
+        ]
+
+    def test_duplicates_run_once(self):
+        text = '[TOOL: web_search, query: "x"] e ancora [TOOL: web_search, query: "x"]'
+        assert extract_tool_commands(text) == [("web_search", "x")]
+
+    def test_visible_answer_wins_over_think(self):
+        """Test che le direttive nel <think> non vengano eseguite due volte"""
+        text = '<think>uso [TOOL: web_search, query: "bozza"]</think>[TOOL: web_search, query: "finale"]'
+        assert extract_tool_commands(text) == [("web_search", "finale")]
+
+    def test_think_fallback(self):
+        text = '<think>[TOOL: write_file, query: "projects/a.py|x = 1"]</think>Fatto.'
+        assert extract_tool_commands(text) == [("write_file", "projects/a.py|x = 1")]
+
+    def test_single_command_compat(self):
+        assert extract_tool_command('[TOOL: web_search, query: "a"] [TOOL: read_url, query: "b"]') == ("web_search", "a")
+        assert extract_tool_command("nessun tool") == (None, None)
+
+
+class TestRunTools:
+    """Test esecuzione parallela dei tool di un round"""
+
+    def test_independent_tools_run_concurrently(self, monkeypatch):
+        def slow_write(filename, content):
+            time.sleep(0.2)
+            return f"✅ FILE SALVATO: {filename}"
+        monkeypatch.setitem(engine.AVAILABLE_TOOLS, "write_file", slow_write)
+        commands = [("write_file", f"projects/f{i}.py|x = {i}") for i in range(4)]
+
+        start = time.time()
+        results = asyncio.run(run_tools(commands))
+
+        assert time.time() - start < 0.6
+        assert results == [f"✅ FILE SALVATO: projects/f{i}.py" for i in range(4)]
+
+    def test_terminal_run_waits_for_previous_tools(self, monkeypatch):
+        written = []
+        lock = threading.Lock()
+        def slow_write(filename, content):
+            time.sleep(0.1)
+            with lock:
+                written.append(filename)
+            return "ok"
+        monkeypatch.setitem(engine.AVAILABLE_TOOLS, "write_file", slow_write)
+        monkeypatch.setitem(engine.AVAILABLE_TOOLS, "terminal_run", lambda cmd: f"visti {len(written)} file")
+
+        results = asyncio.run(run_tools([
+            ("write_file", "projects/a.py|1"),
+            ("write_file", "projects/b.py|2"),
+            ("terminal_run", "python3 a.py"),
+        ]))
+
+        assert results[-1] == "visti 2 file"
+
+
+class TestAgentLoop:
+    """Test loop multi-step in /chat/god-mode"""
+
+    def setup_method(self):
+        self.client = TestClient(engine.app)
+
+    def scripted_llm(self, monkeypatch, responses):
+        calls = []
+        async def call_llm(messages, temperature=0.3, mode="general", session_id=None):
+            calls.append([dict(m) for m in messages])
+            return responses[min(len(calls), len(responses)) - 1]
+        monkeypatch.setattr(engine, "call_llm", call_llm)
+        monkeypatch.setattr(engine, "memory", None)
+        return calls
+
+    def test_all_tools_in_one_follow_up(self, monkeypatch):
+        """Test che due tool costino una sola chiamata LLM aggiuntiva"""
+        monkeypatch.setitem(engine.AVAILABLE_TOOLS, "web_search", lambda q: f"risultati per {q}")
+        monkeypatch.setitem(engine.AVAILABLE_TOOLS, "read_url", lambda u: f"pagina {u}")
+        calls = self.scripted_llm(monkeypatch, [
+            '[TOOL: web_search, query: "quote"] [TOOL: read_url, query: "https://a.it"]',
+            "Ecco la sintesi.",
+        ])
+
+        body = self.client.post("/chat/god-mode", json={"message": "cerca", "mode": "factory"}).json()
+
+        assert len(calls) == 2
+        assert body["response"] == "Ecco la sintesi."
+        assert body["tools_used"] == ["web_search", "read_url"]
+        assert body["tool_used"] == "web_search, read_url"
+        tool_message = calls[1][-1]["content"]
+        assert "risultati per quote" in tool_message and "pagina https://a.it" in tool_message
+
+    def test_step_budget(self, monkeypatch):
+        """Test che il modello non possa chiamare tool all'infinito"""
+        monkeypatch.setitem(engine.AVAILABLE_TOOLS, "web_search", lambda q: "niente")
+        monkeypatch.setattr(engine, "TOOL_MAX_STEPS", 2)
+        calls = self.scripted_llm(monkeypatch, ['[TOOL: web_search, query: "ancora"]'])
+
+        body = self.client.post("/chat/god-mode", json={"message": "loop", "mode": "factory"}).json()
+
+        assert len(calls) == 3
+        assert body["tools_used"] == ["web_search", "web_search"]
+        assert calls[-1][-1]["content"].endswith("Ora concludi.")
+
+    def test_no_tools(self, monkeypatch):
+        calls = self.scripted_llm(monkeypatch, ["Risposta diretta."])
+
+        body = self.client.post("/chat/god-mode", json={"message": "ciao", "mode": "factory"}).json()
+
+        assert len(calls) == 1
+        assert body["tool_used"] is None and body["tools_used"] == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
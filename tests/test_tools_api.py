@@ -0,0 +1,98 @@
+import pytest
+import os
+import sys
+from fastapi.testclient import TestClient
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import hub
+from core import engine
+from core.tools import execute_command, terminal_run
+
+
+class TestExecuteCommand:
+    """Test structured results of the terminal tool"""
+
+    def test_success(self):
+        """Test exit code, stdout and duration of a successful command"""
+        result = execute_command('python3 -c "print(42)"')
+
+        assert result["ok"] is True
+        assert result["exit_code"] == 0
+        assert result["stdout"] == "42\n"
+        assert result["error"] is None
+        assert result["duration"] >= 0
+
+    def test_failure_keeps_stderr(self):
+        """Test that stderr and the exit code are reported separately"""
+        result = execute_command('python3 -c "import modulo_inesistente"')
+
+        assert result["ok"] is False
+        assert result["exit_code"] == 1
+        assert "ModuleNotFoundError" in result["stderr"]
+        assert result["stdout"] == ""
+
+    def test_rejected_command(self):
+        """Test that safety checks still apply and nothing is executed"""
+        result = execute_command("ls; rm -rf /")
+
+        assert result["exit_code"] is None
+        assert result["error"].startswith("ERRORE SICUREZZA")
+
+    def test_terminal_run_text_format(self):
+        """Test that the LLM tool keeps its text output"""
+        assert terminal_run('python3 -c "print(42)"') == "✅ OUTPUT:\n42\n"
+        assert terminal_run('python3 -c "raise SystemExit(3)"').startswith("❌ (exit 3)")
+
+
+class TestToolsEndpoint:
+    """Test /tools/{name}: direct tool execution without LLM completions"""
+
+    def setup_method(self):
+        self.client = TestClient(engine.app)
+
+    def test_terminal_run(self):
+        response = self.client.post("/tools/terminal_run", json={"query": 'python3 -c "print(42)"'})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["tool"] == "terminal_run"
+        assert body["exit_code"] == 0 and body["stdout"] == "42\n"
+
+    def test_unknown_tool(self):
+        response = self.client.post("/tools/format_disk", json={"query": "/"})
+        assert response.status_code == 404
+
+    def test_write_file_with_args(self, tmp_path, monkeypatch):
+        """Test explicit arguments and that write_file safety checks still apply"""
+        monkeypatch.chdir(tmp_path)
+
+        ok = self.client.post("/tools/write_file", json={"args": {"filename": "projects/demo/a.py", "content": "x = 1"}}).json()
+        denied = self.client.post("/tools/write_file", json={"query": "core/engine.py|boom"}).json()
+
+        assert ok["ok"] is True
+        assert (tmp_path / "projects" / "demo" / "a.py").read_text() == "x = 1"
+        assert denied["ok"] is False and "ERRORE SICUREZZA" in denied["error"]
+
+    def test_hub_client(self, monkeypatch):
+        """Test hub.run_tool_direct against the endpoint"""
+        class Response:
+            def __init__(self, resp):
+                self.resp = resp
+            def raise_for_status(self):
+                self.resp.raise_for_status()
+            def json(self):
+                return self.resp.json()
+        monkeypatch.setattr(hub.requests, "post", lambda url, json, timeout: Response(
+            self.client.post(url.replace("http://localhost:8001", ""), json=json)))
+
+        result = hub.run_tool_direct("terminal_run", 'python3 -c "print(7)"')
+        assert result["ok"] is True and result["stdout"] == "7\n"
+
+        result = hub.run_tool_direct("nope")
+        assert result["ok"] is False and result["error"].startswith("ERRORE API")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
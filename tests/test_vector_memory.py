@@ -0,0 +1,264 @@
+import pytest
+import os
+import gc
+import sys
+import weakref
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.vector_memory import VectorMemory, fact_hash, create_chroma_client
+from core.embeddings import LocalEmbedder
+
+
+class FakeCollection:
+    """Collection Chroma finta: registra le chiamate add() e risponde alle query con distanze fisse"""
+
+    def __init__(self, documents=None, query_distance=1.0, metadatas=None):
+        self.documents = list(documents or [])
+        self.metadatas = list(metadatas or [{} for _ in self.documents])
+        self.add_calls = []
+        self.get_calls = []
+        self.query_calls = 0
+        self.query_distance = query_distance
+
+    def count(self):
+        return len(self.documents)
+
+    def get(self, include=None, where=None):
+        self.get_calls.append((include, where))
+        hashes = where["fact_hash"]["$in"] if where else None
+        rows = [i for i, m in enumerate(self.metadatas) if hashes is None or m.get("fact_hash") in hashes]
+        return {"documents": [self.documents[i] for i in rows], "metadatas": [self.metadatas[i] for i in rows]}
+
+    def add(self, documents, metadatas, ids, embeddings=None):
+        self.add_calls.append(list(documents))
+        self.documents.extend(documents)
+        self.metadatas.extend(metadatas)
+
+    def query(self, n_results, query_texts=None, query_embeddings=None):
+        self.query_calls += 1
+        queries = query_texts if query_texts is not None else query_embeddings
+        return {
+            "documents": [self.documents[:n_results] for _ in queries],
+            "metadatas": [self.metadatas[:n_results] for _ in queries],
+            "distances": [[self.query_distance] * min(n_results, len(self.documents)) for _ in queries],
+        }
+
+
+class FakeClient:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get_or_create_collection(self, name):
+        return self.collection
+
+
+OPEN_MEMORIES = []
+
+
+@pytest.fixture(autouse=True)
+def close_memories():
+    yield
+    while OPEN_MEMORIES:
+        OPEN_MEMORIES.pop().close()
+
+
+def make_memory(collection, **kwargs):
+    kwargs.setdefault("flush_interval", 60)
+    kwargs.setdefault("embedder", None)
+    memory = VectorMemory(client=FakeClient(collection), **kwargs)
+    OPEN_MEMORIES.append(memory)
+    return memory
+
+
+class TestBackendSelection:
+    """Test scelta del backend Chroma"""
+
+    def test_ephemeral_backend(self):
+        client = create_chroma_client("ephemeral")
+        collection = client.get_or_create_collection(name="quantum_memory_test")
+        assert collection.count() == 0
+
+    def test_persistent_backend_creates_directory(self, tmp_path):
+        path = tmp_path / "memory"
+        client = create_chroma_client("persistent", path=str(path))
+        client.get_or_create_collection(name="quantum_memory_test")
+        assert path.exists()
+
+    def test_invalid_backend(self):
+        with pytest.raises(ValueError):
+            create_chroma_client("floppy")
+
+
+class TestWriteBehindBuffer:
+    """Test buffer di scrittura con flush in blocco"""
+
+    def test_save_is_buffered(self):
+        collection = FakeCollection()
+        memory = make_memory(collection, flush_size=10)
+        memory.save("ciao", "L'utente preferisce risposte in italiano")
+        assert collection.add_calls == []
+        memory.flush()
+        assert len(collection.add_calls) == 1
+
+    def test_size_trigger_flushes_in_one_call(self):
+        collection = FakeCollection()
+        memory = make_memory(collection, flush_size=3)
+        for i in range(3):
+            memory.save(f"input {i}", f"Vincolo tecnico numero {i}")
+        assert len(collection.add_calls) == 1
+        assert len(collection.add_calls[0]) == 3
+
+    def test_time_trigger_flushes(self):
+        import time
+        collection = FakeCollection()
+        memory = make_memory(collection, flush_size=100, flush_interval=0.05)
+        memory.save("ciao", "L'utente usa Python 3.11")
+        time.sleep(0.3)
+        assert len(collection.add_calls) == 1
+
+
+class TestDeduplication:
+    """Test scarto dei fatti duplicati"""
+
+    def test_exact_duplicates_dropped(self):
+        collection = FakeCollection()
+        memory = make_memory(collection, flush_size=10)
+        memory.save("a", "L'utente preferisce l'italiano")
+        memory.save("b", "l'utente preferisce  L'ITALIANO!")
+        memory.flush()
+        memory.save("c", "L'utente preferisce l'italiano")
+        memory.flush()
+        assert sum(len(c) for c in collection.add_calls) == 1
+
+    def test_existing_facts_found_by_hash_filter(self):
+        """Test that stored facts are matched with one metadata-only where query per flush, nothing at startup"""
+        doc = "FATTO: L'utente preferisce l'italiano\nCONTESTO ORIGINALE: parla italiano"
+        collection = FakeCollection(documents=[doc], query_distance=1.0,
+                                    metadatas=[{"fact_hash": fact_hash("L'utente preferisce l'italiano")}])
+        memory = make_memory(collection, flush_size=2)
+        assert collection.get_calls == []
+
+        memory.save("x", "L'utente preferisce l'italiano")
+        memory.save("y", "Il deploy usa docker compose")
+        assert collection.add_calls == [["FATTO: Il deploy usa docker compose\nCONTESTO ORIGINALE: y"]]
+        assert len(collection.get_calls) == 1 and collection.get_calls[0][0] == ["metadatas"]
+        assert len(collection.get_calls[0][1]["fact_hash"]["$in"]) == 2
+
+        memory.save("z", "l'utente preferisce l'italiano!")  # Già visto: nessuna query
+        assert len(collection.get_calls) == 1
+
+    def test_near_duplicates_dropped_by_distance(self):
+        collection = FakeCollection(documents=["FATTO: qualcosa\nCONTESTO ORIGINALE: x"], query_distance=0.05)
+        memory = make_memory(collection, flush_size=1, dedup_distance=0.15)
+        memory.save("y", "Un fatto quasi identico")
+        assert collection.add_calls == []
+
+    def test_near_duplicates_within_batch(self):
+        """Test that similar facts queued in the same batch are caught even with an empty collection"""
+        collection = FakeCollection()
+        memory = make_memory(collection, flush_size=10, dedup_distance=0.15,
+                             embedder=LocalEmbedder(encode_fn=keyword_vectors))
+        memory.save("a", "L'utente programma in python")
+        memory.save("b", "Per gli script si usa python")
+        memory.save("c", "Il deploy usa docker")
+        memory.flush()
+        assert collection.add_calls == [["FATTO: L'utente programma in python\nCONTESTO ORIGINALE: a",
+                                         "FATTO: Il deploy usa docker\nCONTESTO ORIGINALE: c"]]
+
+    def test_known_hashes_bounded(self):
+        """Test that the in-memory hash LRU is capped and evicted facts are still caught by the where query"""
+        collection = FakeCollection()
+        memory = make_memory(collection, flush_size=1, dedup_distance=0, known_hashes_size=2)
+        for i in range(5):
+            memory.save(f"input {i}", f"Vincolo tecnico numero {i}")
+        assert len(memory._known_hashes) == 2
+
+        memory.save("ancora", "Vincolo tecnico numero 0")  # Uscito dalla LRU: lo trova la get() filtrata
+        assert len(collection.add_calls) == 5
+
+    def test_fact_hash_normalization(self):
+        assert fact_hash("Usa  Python!") == fact_hash("usa python")
+
+
+class TestLifecycle:
+    """Test chiusura: flush finale e nessun riferimento trattenuto dall'atexit"""
+
+    def test_close_flushes_pending(self):
+        collection = FakeCollection()
+        memory = VectorMemory(client=FakeClient(collection), flush_size=10, flush_interval=60, embedder=None)
+        memory.save("ciao", "L'utente preferisce risposte in italiano")
+        assert memory.close() == 1
+        assert len(collection.add_calls) == 1
+
+    def test_unclosed_instance_is_collected(self):
+        """Test that the atexit hook does not keep every instance alive"""
+        memory = VectorMemory(client=FakeClient(FakeCollection()), flush_interval=60, embedder=None)
+        ref = weakref.ref(memory)
+        del memory
+        gc.collect()
+        assert ref() is None
+
+
+def keyword_vectors(texts):
+    """Embedding finto: una dimensione per parola chiave, normalizzato"""
+    import numpy as np
+    vocab = ["italiano", "python", "docker", "meteo"]
+    vectors = []
+    for text in texts:
+        v = np.array([1.0 + text.lower().count(w) * 10 for w in vocab])
+        vectors.append(v / np.linalg.norm(v))
+    return vectors
+
+
+class TestLocalEmbeddingCache:
+    """Test memoization degli embedding locali"""
+
+    def test_repeated_texts_are_encoded_once(self):
+        encoded = []
+        embedder = LocalEmbedder(encode_fn=lambda texts: (encoded.extend(texts), keyword_vectors(texts))[1])
+        embedder.embed(["ciao  mondo", "python"])
+        embedder.embed(["ciao mondo", "python", "docker"])
+        assert encoded == ["ciao mondo", "python", "docker"]
+        assert embedder.stats["hits"] == 2
+
+    def test_lru_limit(self):
+        embedder = LocalEmbedder(cache_size=2, encode_fn=keyword_vectors)
+        embedder.embed(["a", "b", "c"])
+        assert len(embedder._cache) == 2
+
+
+class TestSearchCache:
+    """Test cache dei risultati di search() con invalidazione su scrittura"""
+
+    def make(self):
+        collection = FakeCollection(documents=["FATTO: usa python\nCONTESTO ORIGINALE: x"], query_distance=0.5)
+        memory = make_memory(collection, flush_size=1, dedup_distance=0,
+                             embedder=LocalEmbedder(encode_fn=keyword_vectors))
+        return collection, memory
+
+    def test_repeated_query_skips_retrieval(self):
+        collection, memory = self.make()
+        first = memory.search("Che versione di python uso?")
+        second = memory.search("che versione di python   uso?")
+        assert first == second
+        assert collection.query_calls == 1
+
+    def test_similar_query_skips_retrieval(self):
+        collection, memory = self.make()
+        memory.search("python")
+        memory.search("parliamo di python")
+        assert collection.query_calls == 1
+        assert memory.search_stats["similar_hits"] == 1
+
+    def test_save_invalidates_cache(self):
+        collection, memory = self.make()
+        memory.search("python")
+        memory.save("input", "L'utente usa Docker")
+        memory.search("python")
+        assert collection.query_calls == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])